@@ -0,0 +1,94 @@
+"""
+benchmarks/bench_connection.py
+------------------------------
+Compara a latência por chamada do acesso ao banco antes e depois do
+gerenciador de conexões (connection_manager.py).
+
+"Antes" reproduz o comportamento antigo de db._get_connection: abrir a
+conexão, executar os PRAGMAs, fazer a consulta e fechar. "Depois" usa as
+funções do db.py, que reaproveitam a conexão da thread.
+
+Uso:
+    python benchmarks/bench_connection.py [--db CAMINHO] [--calls 500]
+
+Sem --db, cria um banco temporário. Para medir o cenário real, aponte --db
+para uma cópia do banco no drive compartilhado.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+
+def _legacy_last_by_badge(db_path, badge):
+    """Versão antiga: abre, configura, consulta e fecha a cada chamada."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.row_factory = sqlite3.Row
+        return conn.execute("""
+            SELECT nome, login, gestor, turno, setor, processo, tenure
+            FROM atendimentos
+            WHERE badge_number = ?
+            ORDER BY data_atendimento DESC, hora_atendimento DESC
+            LIMIT 1
+        """, (badge,)).fetchone()
+    finally:
+        conn.close()
+
+
+def _time_calls(fn, badges, calls):
+    samples = []
+    for i in range(calls):
+        badge = badges[i % len(badges)]
+        t0 = time.perf_counter()
+        fn(badge)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<28} média {statistics.mean(samples):8.3f} ms   "
+          f"p50 {statistics.median(samples):8.3f} ms   p99 {p99:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Banco existente a ser medido (não é alterado)")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=2000, help="Linhas no banco temporário")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+        db.set_db_path(db_path)
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, "bench.db")
+        generate(db_path, args.rows)
+
+    badges = [r[0] for r in db._get_connection().execute(
+        "SELECT DISTINCT badge_number FROM atendimentos LIMIT 50").fetchall()] or ["12345"]
+    print(f"Banco: {db_path}  ({args.calls} chamadas de get_last_atendimento_by_badge)")
+    _report("antes (conexão por chamada)", _time_calls(lambda b: _legacy_last_by_badge(db_path, b), badges, args.calls))
+    _report("depois (conexão reutilizada)", _time_calls(db.get_last_atendimento_by_badge, badges, args.calls))
+
+    db.close_connections()
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+benchmarks/bench_export.py
+--------------------------
+Mede tempo e pico de memória de db.export_to_csv para bancos de tamanhos
+crescentes (por padrão 10k e 100k atendimentos, com 1 a 3 condutas cada).
+
+Com a exportação em streaming, o pico de memória deve ficar praticamente
+constante entre os tamanhos; só o tempo cresce com o número de linhas.
+
+Uso:
+    python benchmarks/bench_export.py [--sizes 10000 100000 250000] [--memory] [--incremental]
+
+--memory repete cada exportação sob tracemalloc para medir o pico de
+memória do Python (bem mais lento, por isso fica separado da medição de
+tempo).
+
+--incremental faz uma exportação incremental completa (que grava a marca
+d'água), altera 1% dos atendimentos e mede a exportação só das alterações
+(db.export_changes_to_csv), que deve levar uma fração do tempo da completa.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--memory", action="store_true", help="Mede também o pico de memória")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Mede também a exportação incremental com 1%% dos atendimentos alterados")
+    args = parser.parse_args()
+
+    print(f"{'atendimentos':>12} {'tempo (s)':>10} {'linhas/s':>10} {'pico mem (MB)':>14} {'arquivo (MB)':>13}"
+          f" {'incremental (s)':>16}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            generate(os.path.join(tmp, "bench.db"), size)
+            out = os.path.join(tmp, "export.csv")
+
+            t0 = time.perf_counter()
+            exported = db.export_to_csv(out)
+            elapsed = time.perf_counter() - t0
+
+            peak_str = "-"
+            if args.memory:
+                tracemalloc.start()
+                db.export_to_csv(out)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                peak_str = f"{peak / 2**20:.2f}"
+
+            incremental_str = "-"
+            if args.incremental:
+                changes_out = os.path.join(tmp, "changes.csv")
+                db.export_changes_to_csv(changes_out)
+                # Outra conexão, como uma estação gravando durante o dia
+                with sqlite3.connect(os.path.join(tmp, "bench.db")) as conn:
+                    conn.execute("UPDATE atendimentos_base SET nome = nome WHERE id % 100 = 0")
+                t0 = time.perf_counter()
+                changed = db.export_changes_to_csv(changes_out)
+                incremental_str = f"{time.perf_counter() - t0:.2f} ({changed})"
+
+            print(f"{exported:>12} {elapsed:>10.2f} {exported / elapsed:>10.0f} "
+                  f"{peak_str:>14} {os.path.getsize(out) / 2**20:>13.1f} {incremental_str:>16}")
+            db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+benchmarks/bench_export_compression.py
+--------------------------------------
+Compara tempo de exportação e tamanho do arquivo de db.export_to_csv sem
+compressão e com gzip/zstd em vários níveis, para um banco sintético.
+
+O arquivo é comprimido enquanto é escrito, então o tempo inclui a
+compressão; em um compartilhamento de rede lento, o arquivo menor costuma
+compensar o custo de CPU.
+
+Uso:
+    python benchmarks/bench_export_compression.py [--size 100000] [--levels gzip:1 gzip:6 zstd:3 ...]
+
+Níveis zstd só são medidos com o pacote zstandard instalado.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+DEFAULT_LEVELS = ["gzip:1", "gzip:6", "gzip:9", "zstd:1", "zstd:3", "zstd:9", "zstd:19"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--levels", nargs="+", default=DEFAULT_LEVELS, help="compressão:nível")
+    args = parser.parse_args()
+
+    casos = [(None, None)]
+    for item in args.levels:
+        compression, level = item.split(":")
+        if db.compression_available(compression):
+            casos.append((compression, int(level)))
+        else:
+            print(f"{compression} indisponível; ignorando {item}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate(os.path.join(tmp, "bench.db"), args.size)
+        print(f"{'compressão':>10} {'nível':>6} {'tempo (s)':>10} {'arquivo (MB)':>13} {'razão':>7}")
+        sem_compressao = None
+        for compression, level in casos:
+            out = os.path.join(tmp, "export.csv" + db.EXPORT_COMPRESSIONS.get(compression, ""))
+            t0 = time.perf_counter()
+            db.export_to_csv(out, compression=compression, compression_level=level)
+            elapsed = time.perf_counter() - t0
+            size = os.path.getsize(out)
+            sem_compressao = sem_compressao or size
+            print(f"{compression or '-':>10} {level or '-':>6} {elapsed:>10.2f} {size / 2**20:>13.1f} "
+                  f"{sem_compressao / size:>6.1f}x")
+            os.remove(out)
+        db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
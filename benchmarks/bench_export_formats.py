@@ -0,0 +1,65 @@
+"""
+benchmarks/bench_export_formats.py
+----------------------------------
+Compara tempo de escrita e tamanho do arquivo entre db.export_to_csv (uma
+linha por conduta e, em "csv-largo", uma linha por atendimento) e
+db.export_to_parquet para bancos de tamanhos crescentes, e o tempo de
+leitura de volta (csv.reader x pyarrow.parquet.read_table).
+
+Uso:
+    python benchmarks/bench_export_formats.py [--sizes 10000 100000]
+
+Precisa do pyarrow instalado (pip install pyarrow).
+"""
+import argparse
+import csv
+import functools
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return sum(1 for _ in csv.reader(f)) - 1
+
+
+def _read_parquet(path):
+    import pyarrow.parquet as pq
+    return pq.read_table(path).num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+    if not db.parquet_available():
+        sys.exit("pyarrow não está instalado (pip install pyarrow).")
+
+    formatos = [("csv", db.export_to_csv, _read_csv),
+                ("csv-largo", functools.partial(db.export_to_csv, wide=True), _read_csv),
+                ("parquet", db.export_to_parquet, _read_parquet)]
+    print(f"{'atendimentos':>12} {'formato':>10} {'escrita (s)':>12} {'arquivo (MB)':>13} {'leitura (s)':>12}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            generate(os.path.join(tmp, "bench.db"), size)
+            for nome, export, read in formatos:
+                out = os.path.join(tmp, f"export.{nome}")
+                t0 = time.perf_counter()
+                exported = export(out)
+                written = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                read(out)
+                lido = time.perf_counter() - t0
+                print(f"{exported:>12} {nome:>10} {written:>12.2f} {os.path.getsize(out) / 2**20:>13.1f} {lido:>12.2f}")
+            db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
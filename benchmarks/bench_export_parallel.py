@@ -0,0 +1,61 @@
+"""
+benchmarks/bench_export_parallel.py
+-----------------------------------
+Mede o ganho da exportação paralela (db.export_to_csv_parallel) sobre
+db.export_to_csv para o período inteiro de um banco sintético, com 1, 2, 4
+... processos, e confere que o arquivo juntado é idêntico ao sequencial.
+
+O ganho depende do número de núcleos livres (os.cpu_count()) e do disco;
+com um núcleo só, a versão paralela fica mais lenta (custo de abrir os
+processos e de juntar os arquivos).
+
+Uso:
+    python benchmarks/bench_export_parallel.py [--size 200000] [--workers 1 2 4] [--por semana|mes]
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--por", choices=db.EXPORT_SHARD_UNITS, default="semana")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate(os.path.join(tmp, "bench.db"), args.size)
+        start_date, end_date = db._get_connection().execute(
+            "SELECT MIN(data_atendimento), MAX(data_atendimento) FROM atendimentos_base").fetchone()
+        partes = len(db.export_shards(start_date, end_date, args.por))
+        print(f"{args.size} atendimentos de {start_date} a {end_date}, {partes} partes por {args.por}, "
+              f"{os.cpu_count()} núcleo(s)")
+
+        sequencial = os.path.join(tmp, "sequencial.csv")
+        t0 = time.perf_counter()
+        db.export_to_csv(sequencial, start_date, end_date)
+        base = time.perf_counter() - t0
+        print(f"{'processos':>10} {'tempo (s)':>10} {'ganho':>7} {'idêntico':>9}")
+        print(f"{'sequencial':>10} {base:>10.2f} {1.0:>6.2f}x {'-':>9}")
+
+        for workers in args.workers:
+            out = os.path.join(tmp, f"paralelo_{workers}.csv")
+            t0 = time.perf_counter()
+            db.export_to_csv_parallel(out, start_date, end_date, por=args.por, workers=workers)
+            elapsed = time.perf_counter() - t0
+            igual = "sim" if filecmp.cmp(sequencial, out, shallow=False) else "NÃO"
+            print(f"{workers:>10} {elapsed:>10.2f} {base / elapsed:>6.2f}x {igual:>9}")
+        db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
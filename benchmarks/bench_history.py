@@ -0,0 +1,79 @@
+"""
+benchmarks/bench_history.py
+---------------------------
+Latência das consultas de histórico em bancos de 10k, 100k e 1M atendimentos.
+
+Compara a forma antiga (subquery correlacionada em condutas para cada linha)
+com a coluna desnormalizada resumo_conduta_principal, lendo os últimos 30
+dias inteiros e também só a primeira página do painel
+(db.get_atendimentos_page).
+
+Uso:
+    python benchmarks/bench_history.py [--sizes 10000 100000 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+_SUBQUERY_SQL = """
+    SELECT a.id, a.badge_number, a.nome, a.login, a.data_atendimento, a.hora_atendimento, a.qp_sintoma,
+           (SELECT c.resumo_conduta FROM condutas c WHERE c.atendimento_id = a.id LIMIT 1) as resumo_conduta
+    FROM atendimentos a
+    WHERE a.ts_atendimento >= ?
+    ORDER BY a.ts_atendimento DESC, a.id DESC
+"""
+
+_COLUMN_SQL = """
+    SELECT a.id, a.badge_number, a.nome, a.login, a.data_atendimento, a.hora_atendimento, a.qp_sintoma,
+           a.resumo_conduta_principal as resumo_conduta
+    FROM atendimentos a
+    WHERE a.ts_atendimento >= ?
+    ORDER BY a.ts_atendimento DESC, a.id DESC
+"""
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'atendimentos':>12} {'linhas 30d':>10} {'subquery (ms)':>14} {'coluna (ms)':>12} {'1ª página (ms)':>15}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            generate(os.path.join(tmp, "bench.db"), size)
+            conn = db._get_connection()
+
+            # Últimos 30 dias dos dados sintéticos
+            last_ts = conn.execute("SELECT MAX(ts_atendimento) FROM atendimentos").fetchone()[0]
+            since = last_ts - 30 * 86400
+            since_str = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(since))
+            rows = len(conn.execute(_COLUMN_SQL, (since,)).fetchall())
+
+            old = _median_ms(lambda: conn.execute(_SUBQUERY_SQL, (since,)).fetchall(), args.repeat)
+            new = _median_ms(lambda: conn.execute(_COLUMN_SQL, (since,)).fetchall(), args.repeat)
+            page = _median_ms(lambda: db.get_atendimentos_page(since_str), args.repeat)
+
+            print(f"{size:>12} {rows:>10} {old:>14.2f} {new:>12.2f} {page:>15.2f}")
+            db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
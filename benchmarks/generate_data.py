@@ -0,0 +1,192 @@
+"""
+benchmarks/generate_data.py
+---------------------------
+Gera bancos de dados sintéticos realistas para benchmarks e testes de carga.
+
+Os atendimentos passam pelo mesmo caminho de gravação da aplicação
+(db._insert_atendimento), então todas as colunas derivadas ficam corretas.
+Características dos dados:
+  - badges reaproveitados com distribuição enviesada (poucos pacientes
+    voltam muitas vezes, a maioria aparece uma ou duas vezes), sempre com a
+    mesma identificação (nome, gestor, setor, ...);
+  - 1 a 3 condutas por atendimento;
+  - qs_sintomas/qs_regioes em JSON a partir de gui.constants.SINTOMAS/REGIOES;
+  - listas de gestores/setores/processos/turnos de options_config.json;
+  - sinais vitais plausíveis, com parte dos valores 'N/A';
+  - datas em ordem cronológica terminando hoje.
+
+Uso:
+    python benchmarks/generate_data.py saida.db --atendimentos 100000 [--seed 42] [--por-dia 150]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from models import Atendimento, Conduta  # noqa: E402
+from gui.constants import OPTIONS, SINTOMAS, REGIOES  # noqa: E402
+
+_NOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Hugo", "Isabela", "João",
+          "Karina", "Lucas", "Mariana", "Nicolas", "Olívia", "Paulo", "Rafaela", "Samuel", "Tatiane", "Vitor"]
+_SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Rodrigues", "Almeida",
+               "Nascimento", "Ferreira", "Carvalho", "Gomes", "Martins", "Rocha", "Ribeiro"]
+_HIPOTESES = ["Cefaleia", "Enxaqueca", "Lombalgia", "Ansiedade", "Gastrite", "Entorse", "Corte superficial",
+              "Dermatite de contato", "Síndrome gripal", "Hipotensão", "Cólica menstrual", "N/A"]
+_TENURES = ["< 3 meses", "3-6 meses", "6-12 meses", "1-2 anos", "> 2 anos"]
+
+# Horário de chegada ponderado: mais atendimentos no início de cada escala
+_HORAS_PESOS = [2, 1, 1, 1, 1, 2, 3, 6, 6, 5, 5, 4, 5, 4, 4, 4, 3, 3, 3, 6, 5, 4, 3, 2]
+
+
+def _opts(key, fallback):
+    return [o for o in OPTIONS.get(key, []) if o and o != "N/A"] or fallback
+
+
+class _Identidades:
+    """Identificação estável por badge, criada na primeira vez que o badge aparece."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.gestores = _opts("gestores", ["GESTOR TESTE (GTESTE)"])
+        self.setores = _opts("setores", ["Setor A", "Setor B"])
+        self.processos = _opts("processos", ["Processo A", "Processo B"])
+        self.turnos = _opts("turnos", ["Blue Day", "Blue Night"])
+        self._cache = {}
+
+    def get(self, badge):
+        ident = self._cache.get(badge)
+        if ident is None:
+            rng = self.rng
+            nome = f"{rng.choice(_NOMES)} {rng.choice(_SOBRENOMES)} {rng.choice(_SOBRENOMES)}"
+            ident = self._cache[badge] = {
+                "nome": nome,
+                "login": (nome.split()[0][:4] + nome.split()[-1][:4]).lower(),
+                "gestor": rng.choice(self.gestores), "setor": rng.choice(self.setores),
+                "processo": rng.choice(self.processos), "turno": rng.choice(self.turnos),
+                "tenure": rng.choice(_TENURES),
+            }
+        return ident
+
+
+def _vital(rng, low, high, decimals=0, missing=0.1):
+    if rng.random() < missing:
+        return "N/A"
+    value = rng.uniform(low, high)
+    return f"{value:.{decimals}f}" if decimals else str(int(value))
+
+
+def build_atendimentos(n_atendimentos, seed=42, start=None, per_day=150):
+    """Gera n_atendimentos objetos Atendimento em ordem cronológica.
+
+    Sem `start`, o período é escolhido para terminar agora, com cerca de
+    `per_day` atendimentos por dia.
+    """
+    rng = random.Random(seed)
+    if start is None:
+        start = datetime.now() - timedelta(days=max(1, n_atendimentos // per_day))
+    identidades = _Identidades(rng)
+
+    # Pool de badges com peso ~1/rank: reaproveitamento realista
+    n_badges = max(50, n_atendimentos // 6)
+    badges = [str(10000000 + rng.randrange(89999999)) for _ in range(n_badges)]
+    cum_weights, acc = [], 0.0
+    for rank in range(1, n_badges + 1):
+        acc += 1.0 / rank ** 0.8
+        cum_weights.append(acc)
+
+    resumos = _opts("resumo_conduta", ["Liberado para operação"])
+    medicamentos = OPTIONS.get("medicamento_admin", ["Dipirona", "N/A"])
+    tipos = OPTIONS.get("tipo_atendimento", ["Ocupacional", "Não Ocupacional"])
+    sintomas_qp = [s for s in SINTOMAS]
+    pesos_qp = [0.3 if s in ("Absorvente", "Trabalho em altura") else 1.0 for s in sintomas_qp]
+    regioes = [r for r in REGIOES if r != "N/A"]
+
+    seconds_per_visit = 86400.0 / per_day
+    batch = 5000
+    for batch_start in range(0, n_atendimentos, batch):
+        k = min(batch, n_atendimentos - batch_start)
+        picked = rng.choices(badges, cum_weights=cum_weights, k=k)
+        for j in range(k):
+            i = batch_start + j
+            # Dia avança de forma uniforme; a hora segue a curva de chegadas
+            day = start + timedelta(seconds=i * seconds_per_visit)
+            hour = rng.choices(range(24), weights=_HORAS_PESOS)[0]
+            when = day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=0)
+
+            badge = picked[j]
+            ident = identidades.get(badge)
+            qp = rng.choices(sintomas_qp, weights=pesos_qp)[0]
+            n_condutas = rng.choices([1, 2, 3], weights=[70, 22, 8])[0]
+            condutas = [Conduta(
+                hipotese_diagnostica=rng.choice(_HIPOTESES),
+                resumo_conduta=rng.choice(resumos),
+                medicamento_administrado=rng.choice(medicamentos),
+                posologia=rng.choice(["1 comp", "15 gotas", "2 comp", "N/A"]),
+                horario_medicacao=when.strftime("%H:%M"),
+                observacoes="N/A" if rng.random() < 0.8 else "Retorno se persistir",
+            ) for _ in range(n_condutas)]
+
+            yield Atendimento(
+                badge_number=badge, tipo_atendimento=rng.choice(tipos),
+                qp_sintoma=qp, qp_regiao=rng.choice(REGIOES),
+                qs_sintomas=json.dumps(rng.sample(SINTOMAS, rng.choices([0, 1, 2, 3], weights=[50, 30, 15, 5])[0])),
+                qs_regioes=json.dumps(rng.sample(regioes, rng.choices([0, 1, 2], weights=[60, 30, 10])[0])),
+                hqa=f"Paciente refere {qp.lower()} há {rng.randint(1, 48)} horas",
+                tax=_vital(rng, 35.5, 38.8, 1), pa_sistolica=_vital(rng, 95, 165),
+                pa_diastolica=_vital(rng, 55, 105), fc=_vital(rng, 52, 125), sat=_vital(rng, 89, 100),
+                doencas_preexistentes=rng.choice(["N/A", "N/A", "N/A", "Hipertensão", "Diabetes", "Asma"]),
+                alergias=rng.choice(["N/A", "N/A", "N/A", "Dipirona", "AAS", "Penicilina"]),
+                medicamentos_em_uso=rng.choice(["N/A", "N/A", "Losartana", "Metformina", "Anticoncepcional"]),
+                observacoes="N/A",
+                condutas=condutas,
+                data_atendimento=when.strftime("%Y-%m-%d"),
+                hora_atendimento=when.strftime("%H:%M:%S"),
+                semana_iso=when.isocalendar()[1],
+                **ident,
+            )
+
+
+def generate(db_path, n_atendimentos, seed=42, start=None, per_day=150, batch_size=5000, verbose=False):
+    """Cria (ou completa) o banco em db_path com n_atendimentos sintéticos. Retorna o total inserido."""
+    db_path = os.path.abspath(db_path)
+    if not db.set_db_path(db_path) or not db.init_db():
+        raise RuntimeError(f"Não foi possível inicializar o banco em {db_path}")
+    conn = db._get_connection()
+    cursor = conn.cursor()
+    inserted = 0
+    t0 = time.perf_counter()
+    for atendimento in build_atendimentos(n_atendimentos, seed=seed, start=start, per_day=per_day):
+        db._insert_atendimento(cursor, atendimento)
+        inserted += 1
+        if inserted % batch_size == 0:
+            conn.commit()
+            if verbose:
+                print(f"  {inserted}/{n_atendimentos} atendimentos ({time.perf_counter() - t0:.1f} s)")
+    conn.commit()
+    db.invalidate_identity_cache()
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path", help="Arquivo .db a criar (ou completar)")
+    parser.add_argument("--atendimentos", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--por-dia", type=int, default=150, help="Atendimentos por dia (define o período)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    total = generate(args.db_path, args.atendimentos, seed=args.seed, per_day=args.por_dia, verbose=True)
+    db.close_connections()
+    size_mb = os.path.getsize(args.db_path) / 2**20
+    print(f"{total} atendimentos gerados em {time.perf_counter() - t0:.1f} s ({size_mb:.1f} MB): {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
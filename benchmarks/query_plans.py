@@ -0,0 +1,97 @@
+"""
+benchmarks/query_plans.py
+-------------------------
+Verifica, com EXPLAIN QUERY PLAN, que as consultas por período do db.py
+usam índices em vez de varrer a tabela atendimentos.
+
+As consultas são capturadas com set_trace_callback enquanto as funções
+públicas do db.py são chamadas, então o que é verificado é exatamente o SQL
+que a aplicação executa.
+
+Uso:
+    python benchmarks/query_plans.py
+
+Sai com código 1 se alguma consulta fizer SCAN em atendimentos.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+def _capture_queries(conn, calls):
+    """Executa as chamadas e retorna os SELECTs emitidos (com parâmetros expandidos)."""
+    captured = []
+    # Consultas internas do FTS5 às suas tabelas de apoio ('main'.'atendimentos_fts_...') ficam de fora
+    conn.set_trace_callback(lambda sql: captured.append(sql)
+                            if sql.lstrip().upper().startswith("SELECT") and "'main'." not in sql else None)
+    try:
+        for call in calls:
+            call()
+    finally:
+        conn.set_trace_callback(None)
+    return captured
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_db_path(os.path.join(tmp, "plans.db"))
+        db.init_db()
+        conn = db._get_connection()
+
+        # A primeira exportação incremental é completa (varre tudo); a verificada é a seguinte
+        db.export_changes_to_csv(os.path.join(tmp, "base.csv"))
+
+        now = datetime.now()
+        start = (now - timedelta(hours=12)).strftime("%Y-%m-%d %H:%M:%S")
+        end = now.strftime("%Y-%m-%d %H:%M:%S")
+        calls = [
+            lambda: db.get_atendimentos_by_datetime_range(start, end),
+            lambda: db.get_atendimentos_by_datetime_range(start, end, "12345"),
+            lambda: db.get_atendimentos_by_badge(None, 15),
+            lambda: db.get_atendimentos_by_badge("12345", 15),
+            lambda: db.get_last_atendimento_by_badge("12345"),
+            lambda: db.get_atendimentos_page(start, end, None, after=(0, 0)),
+            lambda: db.get_atendimentos_page(start, None, "12345", after=(0, 0)),
+            lambda: db.get_atendimentos_by_queixa(["Vertigem"], ["Cabeça"], start, end),
+            lambda: db.get_atendimentos_by_vital("sat", maximo=91),
+            lambda: db.get_atendimentos_by_vital("pa_sistolica", minimo=140, start_datetime_str=start),
+            lambda: db.get_vital_stats("pa_sistolica", "setor", start, end),
+            lambda: db.search_atendimentos("cefaleia"),
+            lambda: db.search_atendimentos("dor lombar", start, end, ordem="recentes"),
+            lambda: db.search_atendimentos("dor lombar", start, end, ordem="recentes", after=10**9),
+            lambda: db.get_summary("setor", start[:10], end[:10]),
+            lambda: db.get_summary_totals("gestor", start[:10], end[:10], "semana", limit=10),
+            lambda: db.export_to_csv(os.path.join(tmp, "out.csv"), start[:10], end[:10]),
+            lambda: db.export_to_csv(os.path.join(tmp, "wide.csv"), start[:10], end[:10], wide=True),
+            lambda: db.export_to_parquet(os.path.join(tmp, "out.parquet"), start[:10], end[:10])
+            if db.parquet_available() else None,
+            lambda: db.get_changes_since(0),
+            lambda: db.export_changes_to_csv(os.path.join(tmp, "changes.csv"), progress_callback=lambda *_: None),
+        ]
+
+        failures = 0
+        for sql in _capture_queries(conn, calls):
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            # "SCAN ... VIRTUAL TABLE INDEX" é a busca no índice FTS5, não uma varredura da tabela
+            scans = [step for step in plan if step.startswith("SCAN")
+                     and "CONSTANT ROW" not in step and "VIRTUAL TABLE INDEX" not in step]
+            status = "FALHA" if scans else "ok"
+            failures += bool(scans)
+            print(f"[{status}] {' '.join(sql.split())[:110]}")
+            for step in plan:
+                print(f"        {step}")
+
+        db.close_connections()
+    if failures:
+        print(f"{failures} consulta(s) sem índice.")
+        sys.exit(1)
+    print("Todas as consultas usam índices.")
+
+
+if __name__ == "__main__":
+    main()
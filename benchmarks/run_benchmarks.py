@@ -0,0 +1,214 @@
+"""
+benchmarks/run_benchmarks.py
+----------------------------
+Suíte de benchmarks das funções públicas do db.py sobre bancos sintéticos
+(benchmarks/generate_data.py).
+
+Para cada tamanho de banco mede mediana e p95 de cada operação e grava o
+resultado em JSON junto com o commit do git, para comparar antes/depois de
+uma mudança:
+
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --output base.json
+    (aplica a mudança)
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --compare base.json
+
+Com --compare, sai com código 1 se alguma operação ficar mais lenta que o
+limite (--threshold, padrão 1.25x a mediana anterior).
+
+--db usa um banco já existente (gerado antes ou uma cópia do banco real);
+ele é copiado para um diretório temporário e o original não é alterado.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from generate_data import generate, build_atendimentos  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _stats(samples):
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "min_ms": round(samples[0], 4),
+    }
+
+
+def _measure(fn, args_list, before=None):
+    """Chama fn(*args) para cada item de args_list; before() roda fora da medição."""
+    samples = []
+    for args in args_list:
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return _stats(samples)
+
+
+def run_suite(repeat, export_repeat, seed=42):
+    """Mede as operações no banco configurado em db. Retorna {operação: estatísticas}."""
+    rng = random.Random(seed)
+    conn = db._get_connection()
+    total = conn.execute("SELECT COUNT(*) FROM atendimentos").fetchone()[0]
+    ids = [r[0] for r in conn.execute("SELECT id FROM atendimentos ORDER BY random() LIMIT ?", (repeat * 3,))]
+    badges = [r[0] for r in conn.execute(
+        "SELECT badge_number FROM atendimentos ORDER BY random() LIMIT ?", (repeat,))]
+    if not ids:
+        raise RuntimeError("O banco não tem atendimentos para medir.")
+    rng.shuffle(ids)
+    read_ids, update_ids, delete_ids = ids[:repeat], ids[repeat:2 * repeat], ids[2 * repeat:]
+
+    # Janelas relativas ao atendimento mais recente (o banco pode ser antigo)
+    last_ts = conn.execute("SELECT MAX(ts_atendimento) FROM atendimentos").fetchone()[0]
+    last = datetime(1970, 1, 1) + timedelta(seconds=last_ts)
+    shift_start = (last - timedelta(hours=12)).strftime("%Y-%m-%d %H:%M:%S")
+    shift_end = last.strftime("%Y-%m-%d %H:%M:%S")
+    month_start = (last - timedelta(days=30)).strftime("%Y-%m-%d")
+    days_ago = max(1, (datetime.now() - last).days + 15)
+
+    results = {"_rows": total}
+    novos = list(build_atendimentos(repeat, seed=seed + 1, start=last))
+    results["save_atendimento"] = _measure(db.save_atendimento, [(a,) for a in novos])
+    results["get_atendimento_by_id"] = _measure(db.get_atendimento_by_id, [(i,) for i in read_ids])
+    # Sem o cache LRU, para medir a consulta em si
+    results["get_last_atendimento_by_badge"] = _measure(
+        db.get_last_atendimento_by_badge, [(b,) for b in badges], before=db.invalidate_identity_cache)
+    results["get_atendimentos_by_badge"] = _measure(
+        db.get_atendimentos_by_badge, [(b, days_ago) for b in badges])
+    results["get_atendimentos_by_badge_todos"] = _measure(
+        db.get_atendimentos_by_badge, [(None, days_ago)] * max(3, repeat // 10))
+    results["get_atendimentos_by_datetime_range"] = _measure(
+        db.get_atendimentos_by_datetime_range, [(shift_start, shift_end)] * max(3, repeat // 10))
+    results["get_atendimentos_page"] = _measure(
+        db.get_atendimentos_page, [(month_start + " 00:00:00",)] * repeat)
+    results["get_atendimentos_by_queixa_30d"] = _measure(
+        db.get_atendimentos_by_queixa, [(["Vertigem"], (), month_start + " 00:00:00")] * max(3, repeat // 10))
+    results["get_summary_totals_semana"] = _measure(
+        db.get_summary_totals, [("setor", None, None, "semana")] * max(3, repeat // 10))
+    results["search_atendimentos"] = _measure(
+        db.search_atendimentos, [("cefaleia",), ("losartana",), ("dor lombar",)] * max(1, repeat // 10))
+
+    to_update = [db.get_atendimento_by_id(i) for i in update_ids]
+    for atendimento in to_update:
+        atendimento.observacoes = "Atualizado no benchmark"
+    results["update_atendimento"] = _measure(db.update_atendimento, [(a,) for a in to_update if a])
+    results["delete_atendimento"] = _measure(db.delete_atendimento, [(i,) for i in delete_ids])
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        out = os.path.join(out_dir, "export.csv")
+        results["export_to_csv_30d"] = _measure(db.export_to_csv, [(out, month_start, shift_end[:10])] * export_repeat)
+        if db.parquet_available():
+            out = os.path.join(out_dir, "export.parquet")
+            results["export_to_parquet_30d"] = _measure(db.export_to_parquet,
+                                                        [(out, month_start, shift_end[:10])] * export_repeat)
+    return results
+
+
+def _print_results(size, results, baseline=None, threshold=None):
+    print(f"\n== {size} ({results['_rows']} atendimentos no banco) ==")
+    print(f"{'operação':<36} {'mediana (ms)':>13} {'p95 (ms)':>10}" + (f" {'antes (ms)':>11} {'razão':>7}" if baseline else ""))
+    regressions = []
+    for op, st in results.items():
+        if op.startswith("_"):
+            continue
+        line = f"{op:<36} {st['median_ms']:>13.3f} {st['p95_ms']:>10.3f}"
+        base = (baseline or {}).get(op)
+        if base:
+            ratio = st["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+            flag = "  << REGRESSÃO" if ratio > threshold else ""
+            line += f" {base['median_ms']:>11.3f} {ratio:>6.2f}x{flag}"
+            if flag:
+                regressions.append((size, op, ratio))
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="Tamanhos dos bancos sintéticos")
+    parser.add_argument("--db", help="Usa uma cópia deste banco em vez de gerar")
+    parser.add_argument("--repeat", type=int, default=50, help="Chamadas por operação")
+    parser.add_argument("--export-repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: bench-<commit>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Razão máxima aceita na comparação")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparando com {args.compare} (commit {baseline.get('commit')})")
+
+    labels = [os.path.basename(args.db)] if args.db else [str(s) for s in args.sizes]
+    regressions = []
+    for label in labels:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            t0 = time.perf_counter()
+            if args.db:
+                shutil.copyfile(args.db, db_path)
+                db.set_db_path(db_path)
+                db.init_db()
+                db.run_maintenance()
+            else:
+                generate(db_path, int(label), seed=args.seed)
+            print(f"Banco {label} pronto em {time.perf_counter() - t0:.1f} s")
+
+            results = run_suite(args.repeat, args.export_repeat, seed=args.seed)
+            report["results"][label] = results
+            base = baseline["results"].get(label) if baseline else None
+            regressions += _print_results(label, results, base, args.threshold)
+            db.close_connections()
+
+    output = args.output or os.path.join(REPO_DIR, f"bench-{commit or 'local'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {output}")
+
+    if regressions:
+        print(f"{len(regressions)} operação(ões) acima de {args.threshold:.2f}x:")
+        for size, op, ratio in regressions:
+            print(f"  {size}: {op} {ratio:.2f}x")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
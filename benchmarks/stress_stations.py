@@ -0,0 +1,303 @@
+"""
+benchmarks/stress_stations.py
+-----------------------------
+Teste de carga com várias estações de triagem gravando no mesmo arquivo
+SQLite, como acontece com o atendimentos.db no drive compartilhado.
+
+Cada estação é um processo separado, com a sua própria conexão, rodando uma
+mistura realista de operações do db.py (salvar, editar, ler o histórico e
+exportar) durante um tempo fixo. Ao final são reportados:
+  - vazão e latência p50/p99 por operação;
+  - erros "database is locked"/"busy" impressos pelo db.py e os contadores
+    de retentativas/falhas da camada de gravação (db.get_write_stats);
+  - tempo de espera pelo lock de escrita (duração da instrução que pega o
+    lock: BEGIN IMMEDIATE ou o primeiro INSERT/UPDATE/DELETE da transação);
+  - gravações perdidas: saves que não chegaram ao banco, separando os que a
+    aplicação informou (DatabaseWriteError) dos silenciosos.
+
+Uso:
+    python benchmarks/stress_stations.py --stations 4 --duration 30
+    python benchmarks/stress_stations.py --stations 8 --dir //servidor/share/teste --busy-timeout 2000
+
+--dir deve apontar para o mesmo tipo de armazenamento usado em produção
+(o comportamento de lock em drive de rede é bem diferente do disco local).
+O banco de teste é criado lá e removido ao final (a menos que --keep).
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from config_manager import DEFAULT_BUSY_TIMEOUT_MS  # noqa: E402
+from generate_data import generate, build_atendimentos  # noqa: E402
+
+DEFAULT_MIX = "save=35,update=15,history=45,export=5"
+STRESS_MARKER = "stress"
+
+
+class _LockWaitTracer:
+    """Mede a espera pelo lock de escrita a partir do trace de instruções da conexão.
+
+    O trace é chamado no início de cada instrução; a duração da instrução que
+    pega o lock é o intervalo até a próxima instrução (ou até o fim da operação).
+    """
+
+    def __init__(self):
+        self.waits = []
+        self._pending = None
+        self._in_write = False
+
+    def __call__(self, sql):
+        now = time.perf_counter()
+        self._close(now)
+        head = sql.lstrip()[:16].upper()
+        if head.startswith("BEGIN IMMEDIATE") or head.startswith("BEGIN EXCLUSIVE"):
+            self._pending = now
+            self._in_write = True
+        elif head.startswith(("INSERT", "UPDATE", "DELETE", "REPLACE")) and not self._in_write:
+            self._pending = now
+            self._in_write = True
+        elif head.startswith(("COMMIT", "ROLLBACK", "END")):
+            self._in_write = False
+
+    def _close(self, now):
+        if self._pending is not None:
+            self.waits.append((now - self._pending) * 1000)
+            self._pending = None
+
+    def end_operation(self):
+        self._close(time.perf_counter())
+        self._in_write = False
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"save", "update", "history", "export"}
+    if unknown:
+        raise ValueError(f"Operações desconhecidas em --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def _station(station_id, db_path, busy_timeout_ms, write_retries, duration, mix, think_ms, max_id,
+             start_event, results):
+    """Loop de uma estação (roda em um processo separado)."""
+    rng = random.Random(1000 + station_id)
+    db.set_busy_timeout(busy_timeout_ms)
+    db.set_write_retries(write_retries)
+    db.set_db_path(db_path)
+    tracer = _LockWaitTracer()
+    novos = build_atendimentos(10**6, seed=2000 + station_id, start=datetime.now())
+    # O gerador monta o pool de badges na primeira chamada; isso fica fora da medição
+    novos = itertools.chain([next(novos)], novos)
+    ops, weights = list(mix), list(mix.values())
+    export_path = os.path.join(tempfile.gettempdir(), f"stress_export_{os.getpid()}.csv")
+
+    latencies = {op: [] for op in ops}
+    errors = {op: 0 for op in ops}
+    locked_messages = 0
+    saves_attempted, saves_acked, saves_reported_failed = [], 0, 0
+
+    start_event.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        op = rng.choices(ops, weights=weights)[0]
+        conn = db._get_connection()
+        if conn is not None:
+            conn.set_trace_callback(tracer)
+
+        output = io.StringIO()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            try:
+                if op == "save":
+                    atendimento = next(novos)
+                    marker = f"{STRESS_MARKER}:{station_id}:{len(saves_attempted)}"
+                    atendimento.observacoes = marker
+                    saves_attempted.append(marker)
+                    try:
+                        ok = db.save_atendimento(atendimento) is not None
+                    except db.DatabaseWriteError:
+                        ok = False
+                    if ok:
+                        saves_acked += 1
+                    else:
+                        saves_reported_failed += 1
+                elif op == "update":
+                    atendimento = db.get_atendimento_by_id(rng.randint(1, max_id))
+                    ok = atendimento is not None
+                    if ok:
+                        atendimento.hqa = f"{atendimento.hqa} (revisado pela estação {station_id})"
+                        try:
+                            ok = db.update_atendimento(atendimento)
+                        except db.DatabaseWriteError:
+                            ok = False
+                elif op == "history":
+                    now = datetime.now()
+                    start = (now - timedelta(hours=12)).strftime("%Y-%m-%d %H:%M:%S")
+                    ok = db.get_atendimentos_by_datetime_range(start, now.strftime("%Y-%m-%d %H:%M:%S")) is not None
+                    ok = ok and db.get_atendimentos_page(start)[0] is not None
+                else:
+                    week_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+                    ok = db.export_to_csv(export_path, week_ago, datetime.now().strftime("%Y-%m-%d")) is not None
+            except Exception as e:
+                print(f"Exceção não tratada em {op}: {e}")
+                ok = False
+        elapsed = (time.perf_counter() - t0) * 1000
+        tracer.end_operation()
+
+        text = output.getvalue().lower()
+        latencies[op].append(elapsed)
+        if not ok or "erro" in text:
+            errors[op] += 1
+        if "locked" in text or "busy" in text:
+            locked_messages += 1
+
+        if think_ms:
+            time.sleep(rng.expovariate(1.0 / think_ms) / 1000)
+
+    with contextlib.suppress(OSError):
+        os.remove(export_path)
+    db.close_connections()
+    results.put({
+        "station": station_id, "latencies": latencies, "errors": errors,
+        "locked_messages": locked_messages, "lock_waits": tracer.waits,
+        "saves_attempted": saves_attempted, "saves_acked": saves_acked,
+        "saves_reported_failed": saves_reported_failed, "write_stats": db.get_write_stats(),
+    })
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def _count_persisted(db_path, markers):
+    db.set_db_path(db_path)
+    conn = db._get_connection()
+    present = {r[0] for r in conn.execute(
+        "SELECT observacoes FROM atendimentos WHERE observacoes LIKE ?", (STRESS_MARKER + ":%",))}
+    db.close_connections()
+    return sum(1 for m in markers if m in present)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=4, help="Número de estações (processos)")
+    parser.add_argument("--duration", type=float, default=30, help="Duração em segundos")
+    parser.add_argument("--dir", help="Diretório onde criar o banco de teste (padrão: temporário local)")
+    parser.add_argument("--seed-rows", type=int, default=5000, help="Atendimentos pré-existentes no banco")
+    parser.add_argument("--busy-timeout", type=int, default=DEFAULT_BUSY_TIMEOUT_MS, help="busy_timeout em ms")
+    parser.add_argument("--write-retries", type=int, default=db.DEFAULT_WRITE_ATTEMPTS,
+                        help="Tentativas por gravação com o banco ocupado")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos das operações (padrão: {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=50, help="Pausa média entre operações (0 = sem pausa)")
+    parser.add_argument("--json", help="Grava o relatório também em JSON")
+    parser.add_argument("--keep", action="store_true", help="Não remove o banco de teste")
+    args = parser.parse_args()
+    mix = _parse_mix(args.mix)
+
+    work_dir = tempfile.mkdtemp(prefix="stress_", dir=args.dir)
+    db_path = os.path.join(work_dir, "stress.db")
+    try:
+        print(f"Gerando {args.seed_rows} atendimentos em {db_path}...")
+        generate(db_path, args.seed_rows)
+        max_id = db._get_connection().execute("SELECT MAX(id) FROM atendimentos").fetchone()[0] or 1
+        db.close_connections()
+
+        ctx = mp.get_context("spawn")
+        start_event, results = ctx.Event(), ctx.Queue()
+        procs = [ctx.Process(target=_station, args=(i, db_path, args.busy_timeout, args.write_retries,
+                                                     args.duration, mix, args.think_ms, max_id,
+                                                     start_event, results))
+                 for i in range(args.stations)]
+        for p in procs:
+            p.start()
+        print(f"{args.stations} estações, {args.duration:.0f} s, busy_timeout {args.busy_timeout} ms, mix {args.mix}")
+        start_event.set()
+        reports = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+        latencies = {op: [] for op in mix}
+        errors = {op: 0 for op in mix}
+        lock_waits, markers = [], []
+        locked_messages = acked = reported_failed = 0
+        write_stats = {"writes": 0, "retries": 0, "failures": 0}
+        for r in reports:
+            for op in mix:
+                latencies[op] += r["latencies"][op]
+                errors[op] += r["errors"][op]
+            lock_waits += r["lock_waits"]
+            markers += r["saves_attempted"]
+            locked_messages += r["locked_messages"]
+            acked += r["saves_acked"]
+            reported_failed += r["saves_reported_failed"]
+            for key in write_stats:
+                write_stats[key] += r["write_stats"][key]
+        persisted = _count_persisted(db_path, markers)
+
+        summary = {"stations": args.stations, "duration_s": args.duration, "busy_timeout_ms": args.busy_timeout,
+                   "mix": mix, "operations": {}}
+        print(f"\n{'operação':<10} {'total':>7} {'ops/s':>8} {'erros':>6} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        for op in mix:
+            samples = latencies[op]
+            stats = {"count": len(samples), "ops_per_s": round(len(samples) / args.duration, 2),
+                     "errors": errors[op], "p50_ms": round(_percentile(samples, 0.50), 3),
+                     "p99_ms": round(_percentile(samples, 0.99), 3)}
+            summary["operations"][op] = stats
+            print(f"{op:<10} {stats['count']:>7} {stats['ops_per_s']:>8.1f} {stats['errors']:>6} "
+                  f"{stats['p50_ms']:>10.2f} {stats['p99_ms']:>10.2f}")
+
+        total_wait = sum(lock_waits)
+        summary["lock_wait"] = {"acquisitions": len(lock_waits), "total_ms": round(total_wait, 1),
+                                "p50_ms": round(_percentile(lock_waits, 0.50), 3),
+                                "p99_ms": round(_percentile(lock_waits, 0.99), 3),
+                                "max_ms": round(max(lock_waits, default=0.0), 3)}
+        summary["locked_messages"] = locked_messages
+        summary["write_stats"] = write_stats
+        summary["saves"] = {"attempted": len(markers), "acked": acked, "reported_failed": reported_failed,
+                            "persisted": persisted, "lost": len(markers) - persisted,
+                            "lost_silently": acked - persisted if acked > persisted else 0}
+        print(f"\nEspera pelo lock de escrita: {len(lock_waits)} aquisições, total {total_wait / 1000:.2f} s, "
+              f"p50 {summary['lock_wait']['p50_ms']:.2f} ms, p99 {summary['lock_wait']['p99_ms']:.2f} ms, "
+              f"máx {summary['lock_wait']['max_ms']:.2f} ms")
+        print(f"Mensagens 'locked/busy' do db.py: {locked_messages}")
+        print(f"Gravações: {write_stats['writes']} concluídas, {write_stats['retries']} retentativas, "
+              f"{write_stats['failures']} falhas")
+        saves = summary["saves"]
+        print(f"Saves: {saves['attempted']} tentados, {saves['acked']} confirmados, "
+              f"{saves['persisted']} no banco -> {saves['lost']} perdidos "
+              f"({saves['reported_failed']} com erro informado, {saves['lost_silently']} silenciosos)")
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+            print(f"Relatório gravado em {args.json}")
+    finally:
+        db.close_connections()
+        if args.keep:
+            print(f"Banco mantido em {db_path}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    mp.freeze_support()
+    main()
@@ -0,0 +1,73 @@
+"""
+change_watcher.py
+-----------------
+Detecção de mudanças no banco compartilhado feitas por qualquer estação.
+
+Uma thread de fundo lê PRAGMA data_version a cada poucos segundos, em sua
+própria conexão. O valor muda sempre que outra conexão (outra estação, a
+fila de envio ou a própria tela) grava no banco. A thread do Tk só compara
+o contador `version` (sem acessar disco) e, quando ele muda, busca as
+alterações em db.get_changes_since().
+"""
+import threading
+
+import db
+
+POLL_INTERVAL_S = 2.0
+
+
+class ChangeWatcher:
+    """Thread que incrementa `version` quando o banco é alterado."""
+
+    def __init__(self, poll_interval_s=POLL_INTERVAL_S):
+        self.poll_interval_s = poll_interval_s
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._version = 0
+        self._last_data_version = None
+        self._last_db_path = None
+
+    @property
+    def version(self):
+        """Contador de mudanças detectadas (seguro na thread do Tk)."""
+        with self._lock:
+            return self._version
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def check_once(self):
+        """Lê data_version; retorna True (e incrementa version) se o banco mudou desde a última leitura."""
+        db_path = db.get_db_path()
+        if db_path is None:
+            return False
+        data_version = db.get_data_version()
+        changed = (self._last_data_version is not None
+                   and (data_version != self._last_data_version or db_path != self._last_db_path))
+        self._last_data_version, self._last_db_path = data_version, db_path
+        if changed:
+            with self._lock:
+                self._version += 1
+        return changed
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.check_once()
+                except Exception as e:
+                    # Banco inacessível: tenta de novo no próximo ciclo
+                    print(f"Erro ao verificar mudanças no banco: {e}")
+                self._stop.wait(self.poll_interval_s)
+        finally:
+            db.release_thread_connection()
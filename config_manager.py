@@ -3,6 +3,8 @@ import os
 import sys # Necessário para encontrar o caminho do .exe
 
 CONFIG_FILE = "atendimento_config.ini"
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_WRITE_RETRIES = 5
 
 # --- CORREÇÃO: Encontra o caminho absoluto para o .ini ---
 def get_config_path():
@@ -19,10 +21,22 @@ def get_config_path():
 
 CONFIG_FILE_PATH = get_config_path()
 
+# Fila local de envio (outbox.py): fica no disco da estação, ao lado do .ini
+OUTBOX_FILE = "atendimentos_outbox.db"
+
+def get_outbox_path():
+    """Retorna o caminho do banco local da fila de envio desta estação."""
+    return os.path.join(os.path.dirname(CONFIG_FILE_PATH), OUTBOX_FILE)
+
 def save_db_path(db_path):
     """Salva o caminho do banco de dados no arquivo de configuração."""
     config = configparser.ConfigParser()
-    config['Database'] = {'path': db_path}
+    # Preserva as demais opções já gravadas (ex.: busy_timeout)
+    if os.path.exists(CONFIG_FILE_PATH):
+        config.read(CONFIG_FILE_PATH, encoding='utf-8')
+    if 'Database' not in config:
+        config['Database'] = {}
+    config['Database']['path'] = db_path
     try:
         # --- CORREÇÃO: Usa o caminho absoluto ---
         with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as configfile:
@@ -56,3 +70,32 @@ def load_db_path():
         print(f"Erro ao ler configuração {CONFIG_FILE_PATH}: {e}")
         return None
 
+def _load_int_option(option, default):
+    """Lê um inteiro da seção [Database], com valor padrão se ausente ou inválido."""
+    config = configparser.ConfigParser()
+    try:
+        if os.path.exists(CONFIG_FILE_PATH):
+            config.read(CONFIG_FILE_PATH, encoding='utf-8')
+        return config.getint('Database', option, fallback=default)
+    except (configparser.Error, ValueError) as e:
+        print(f"{option} inválido em {CONFIG_FILE_PATH}: {e}. Usando {default}.")
+        return default
+
+def load_busy_timeout():
+    """Lê o busy_timeout (ms) do arquivo de configuração, com valor padrão."""
+    return _load_int_option('busy_timeout', DEFAULT_BUSY_TIMEOUT_MS)
+
+def load_write_retries():
+    """Lê quantas tentativas fazer em cada gravação com o banco ocupado (write_retries)."""
+    return _load_int_option('write_retries', DEFAULT_WRITE_RETRIES)
+
+def load_outbox_enabled():
+    """Indica se os novos atendimentos passam pela fila local (opção outbox, padrão: sim)."""
+    config = configparser.ConfigParser()
+    try:
+        if os.path.exists(CONFIG_FILE_PATH):
+            config.read(CONFIG_FILE_PATH, encoding='utf-8')
+        return config.getboolean('Database', 'outbox', fallback=True)
+    except (configparser.Error, ValueError) as e:
+        print(f"outbox inválido em {CONFIG_FILE_PATH}: {e}. Usando a fila local.")
+        return True
@@ -0,0 +1,150 @@
+"""
+connection_manager.py
+---------------------
+Gerenciador de conexões SQLite reutilizáveis.
+
+Abrir uma conexão e executar os PRAGMAs a cada consulta custa caro quando o
+banco fica em um drive compartilhado. Este módulo mantém uma conexão aberta
+por thread, com cache de statements preparados, e reabre as conexões quando
+o caminho do banco é trocado: cada thread fecha a sua conexão antiga na
+próxima chamada, para não fechar uma conexão que outra thread ainda usa.
+
+Em modo somente leitura (usado pelos processos da exportação paralela) as
+conexões são abertas com mode=ro e query_only, sem alterar o journal_mode.
+"""
+import pathlib
+import sqlite3
+import threading
+
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionManager:
+    """Mantém uma conexão reutilizável por thread para o banco configurado."""
+
+    def __init__(self, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, cached_statements=STATEMENT_CACHE_SIZE):
+        self._db_path = None
+        self._busy_timeout_ms = busy_timeout_ms
+        self._read_only = False
+        self._cached_statements = cached_statements
+        # Incrementada a cada troca de configuração; conexões de gerações antigas são descartadas
+        self._generation = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # thread ident -> conexão da geração atual, para close_all() e threads que terminaram
+        self._connections = {}
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    @property
+    def busy_timeout_ms(self):
+        return self._busy_timeout_ms
+
+    @property
+    def read_only(self):
+        return self._read_only
+
+    def configure(self, db_path=None, busy_timeout_ms=None, read_only=None):
+        """Altera o caminho do banco, o busy_timeout e/ou o modo somente leitura.
+
+        As conexões abertas não são fechadas aqui: outra thread pode estar no
+        meio de uma consulta (um fetchmany da exportação, o ChangeWatcher).
+        Cada thread descarta a sua em get_connection() ou
+        release_thread_connection(); as de threads que já terminaram são
+        liberadas com o threading.local.
+        """
+        with self._lock:
+            if db_path is not None:
+                self._db_path = db_path
+            if busy_timeout_ms is not None:
+                self._busy_timeout_ms = int(busy_timeout_ms)
+            if read_only is not None:
+                self._read_only = bool(read_only)
+            self._generation += 1
+            self._connections.clear()
+
+    def get_connection(self):
+        """Retorna a conexão da thread atual, abrindo uma nova se necessário."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+        if conn is not None:
+            self._close_quietly(conn)
+            self._local.conn = None
+
+        if self._db_path is None:
+            raise ValueError("Caminho do banco de dados não foi definido. Chame set_db_path() primeiro.")
+
+        with self._lock:
+            generation = self._generation
+            db_path = self._db_path
+            busy_timeout_ms = self._busy_timeout_ms
+            read_only = self._read_only
+
+        conn = sqlite3.connect(
+            f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro" if read_only else db_path,
+            timeout=busy_timeout_ms / 1000.0,
+            cached_statements=self._cached_statements,
+            # Permite que close_all() e _prune_dead_threads() fechem conexões de outras threads
+            check_same_thread=False,
+            uri=read_only,
+        )
+        try:
+            if read_only:
+                conn.execute("PRAGMA query_only = ON;")
+            else:
+                conn.execute("PRAGMA journal_mode = WAL;")
+            # Habilita chaves estrangeiras
+            conn.execute("PRAGMA foreign_keys = ON;")
+            conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)};")
+        except sqlite3.Error:
+            conn.close()
+            raise
+
+        with self._lock:
+            self._prune_dead_threads()
+            if generation != self._generation:
+                # O banco foi trocado enquanto a conexão era aberta; tenta de novo
+                conn.close()
+                return self.get_connection()
+            self._connections[threading.get_ident()] = conn
+
+        self._local.conn = conn
+        self._local.generation = generation
+        return conn
+
+    def release_thread_connection(self):
+        """Fecha a conexão da thread atual (útil ao final de threads de trabalho)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            if self._connections.get(threading.get_ident()) is conn:
+                del self._connections[threading.get_ident()]
+        self._close_quietly(conn)
+
+    def close_all(self):
+        """Fecha todas as conexões abertas, de todas as threads (ao encerrar, sem consultas em andamento)."""
+        with self._lock:
+            self._generation += 1
+            old_connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in old_connections:
+            self._close_quietly(conn)
+
+    def _prune_dead_threads(self):
+        """Fecha conexões de threads que já terminaram. Chamar com o lock adquirido."""
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._connections if i not in alive]:
+            self._close_quietly(self._connections.pop(ident))
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
@@ -5,198 +5,336 @@ Módulo para gerenciamento do banco de dados SQLite.
 """
 import sqlite3
 from datetime import datetime, timedelta
+import calendar
 import csv
+import gzip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import importlib.util
 from models import Atendimento, Conduta
 import os
-import json # Importa json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from connection_manager import ConnectionManager
+import migrations
 # --- CORREÇÃO ERRO EXPORTAÇÃO ---
 # Importa SINTOMAS e REGIOES para a função de exportar CSV
 from gui.constants import SINTOMAS, REGIOES
 # --- FIM CORREÇÃO ---
 
 
-# Variável global para armazenar o caminho do DB
-_db_path = None
+# Conexões reutilizáveis (uma por thread) para o banco configurado
+_manager = ConnectionManager()
 
-def set_db_path(filepath):
-    """Define o caminho do banco de dados a ser usado."""
-    global _db_path
+# Cache LRU badge -> dados de identificação do último atendimento
+IDENTITY_CACHE_SIZE = 512
+_identity_cache = OrderedDict()
+_identity_cache_lock = threading.Lock()
+
+def invalidate_identity_cache(badge_number=None):
+    """Descarta a identidade em cache de um badge (ou de todos, se badge_number for None)."""
+    with _identity_cache_lock:
+        if badge_number is None:
+            _identity_cache.clear()
+        else:
+            _identity_cache.pop(badge_number, None)
+
+def set_db_path(filepath, read_only=False):
+    """Define o caminho do banco de dados a ser usado (read_only: conexões somente leitura)."""
     if filepath and os.path.exists(os.path.dirname(filepath)):
-        _db_path = filepath
+        # Fecha as conexões do banco anterior; serão reabertas sob demanda
+        _manager.configure(db_path=filepath, read_only=read_only)
+        invalidate_identity_cache()
         return True
     return False
 
+def set_busy_timeout(busy_timeout_ms):
+    """Define quanto tempo (ms) esperar por um lock de outra estação antes de falhar."""
+    _manager.configure(busy_timeout_ms=busy_timeout_ms)
+
+def get_db_path():
+    """Retorna o caminho do banco de dados em uso (ou None)."""
+    return _manager.db_path
+
+def release_thread_connection():
+    """Fecha a conexão da thread atual; para threads de trabalho que vão terminar."""
+    _manager.release_thread_connection()
+
+def close_connections():
+    """Fecha todas as conexões abertas (ex.: ao encerrar a aplicação)."""
+    _manager.close_all()
+
 def _get_connection():
-    """Retorna uma conexão com o banco de dados usando o caminho definido."""
-    if _db_path is None:
-        raise ValueError("Caminho do banco de dados não foi definido. Chame set_db_path() primeiro.")
+    """Retorna a conexão da thread atual com o banco de dados definido."""
     try:
-        conn = sqlite3.connect(_db_path)
-        conn.execute("PRAGMA journal_mode = WAL;")
-        # Habilita chaves estrangeiras
-        conn.execute("PRAGMA foreign_keys = ON;")
-        return conn
+        return _manager.get_connection()
     except sqlite3.OperationalError as e:
-        print(f"Erro ao conectar ao DB em {_db_path}: {e}")
+        print(f"Erro ao conectar ao DB em {_manager.db_path}: {e}")
         return None
 
+
+# --- Gravações com retry ---
+# Com várias estações no mesmo arquivo, um SQLITE_BUSY/LOCKED passageiro não
+# pode virar um atendimento perdido: a gravação é repetida algumas vezes com
+# espera exponencial e, se ainda assim falhar, levanta DatabaseWriteError
+# para que a tela avise o usuário.
+
+DEFAULT_WRITE_ATTEMPTS = 5
+WRITE_BACKOFF_BASE_S = 0.05
+WRITE_BACKOFF_MAX_S = 1.0
+
+_write_attempts = DEFAULT_WRITE_ATTEMPTS
+_write_stats = {"writes": 0, "retries": 0, "failures": 0}
+_write_stats_lock = threading.Lock()
+
+# Códigos primários do SQLite (os estendidos mantêm o primário nos 8 bits baixos)
+_SQLITE_BUSY = 5
+_SQLITE_LOCKED = 6
+
+
+class DatabaseWriteError(Exception):
+    """Uma gravação não foi concluída; nada dela ficou no banco."""
+
+
+def set_write_retries(max_attempts):
+    """Define quantas vezes uma gravação é tentada antes de desistir (mínimo 1)."""
+    global _write_attempts
+    _write_attempts = max(1, int(max_attempts))
+
+def get_write_stats():
+    """Retorna os contadores de gravações, retentativas e falhas desta aplicação."""
+    with _write_stats_lock:
+        return dict(_write_stats)
+
+def reset_write_stats():
+    with _write_stats_lock:
+        for key in _write_stats:
+            _write_stats[key] = 0
+
+def _count_write_event(key):
+    with _write_stats_lock:
+        _write_stats[key] += 1
+
+def _is_busy_error(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (_SQLITE_BUSY, _SQLITE_LOCKED)
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def _run_write(description, write_fn):
+    """Executa write_fn(cursor) em uma transação BEGIN IMMEDIATE e faz o commit.
+
+    O lock de escrita é pego logo no início (em vez de no meio da transação,
+    quando já há leituras feitas) e solto no commit; write_fn deve só executar
+    os comandos, com os parâmetros já prontos. Erros de banco ocupado são
+    repetidos com espera exponencial; qualquer falha final vira
+    DatabaseWriteError, sempre com rollback.
+    """
+    for attempt in range(1, _write_attempts + 1):
+        conn = None
+        try:
+            conn = _manager.get_connection()
+            if conn.in_transaction:
+                # Sobra de uma operação anterior interrompida nesta thread
+                conn.rollback()
+            conn.execute("BEGIN IMMEDIATE")
+            result = write_fn(conn.cursor())
+            conn.commit()
+            _count_write_event("writes")
+            return result
+        except sqlite3.Error as e:
+            _rollback_quietly(conn)
+            if _is_busy_error(e) and attempt < _write_attempts:
+                _count_write_event("retries")
+                delay = min(WRITE_BACKOFF_MAX_S, WRITE_BACKOFF_BASE_S * 2 ** (attempt - 1))
+                # Jitter para que estações em conflito não tentem de novo ao mesmo tempo
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+            _count_write_event("failures")
+            if _is_busy_error(e):
+                message = (f"Não foi possível {description}: o banco de dados está ocupado por outra estação "
+                           f"({attempt} tentativa(s)). Nada foi gravado; tente novamente.")
+            else:
+                message = f"Não foi possível {description}: {e}. Nada foi gravado."
+            print(message)
+            raise DatabaseWriteError(message) from e
+        except Exception as e:
+            _rollback_quietly(conn)
+            _count_write_event("failures")
+            message = f"Não foi possível {description}: {e}. Nada foi gravado."
+            print(message)
+            raise DatabaseWriteError(message) from e
+
+def _rollback_quietly(conn):
+    if conn is None:
+        return
+    try:
+        conn.rollback()
+    except sqlite3.Error:
+        pass
+
+def to_timestamp(data_hora_str):
+    """Converte 'YYYY-MM-DD HH:MM:SS' (ou só 'YYYY-MM-DD') no valor de ts_atendimento.
+
+    O horário é tratado como local, sem fuso: o resultado é o mesmo que
+    strftime('%s', ...) do SQLite, usado no preenchimento das linhas antigas.
+    """
+    formato = "%Y-%m-%d %H:%M:%S" if " " in data_hora_str.strip() else "%Y-%m-%d"
+    return calendar.timegm(datetime.strptime(data_hora_str.strip(), formato).timetuple())
+
+def _resumo_conduta_principal(atendimento):
+    """Resumo da primeira conduta, guardado em atendimentos para o histórico."""
+    return atendimento.condutas[0].resumo_conduta if atendimento.condutas else None
+
+# Versão do esquema de cada banco antes de init_db migrá-lo, para o VACUUM de run_maintenance()
+_versions_before_init = {}
+
 def init_db():
-    """Inicializa o banco de dados e cria as tabelas se não existirem."""
+    """Inicializa o banco de dados, aplicando as migrações de esquema pendentes.
+
+    Só as migrações (curtas) rodam aqui. Os backfills das colunas novas e o
+    VACUUM ficam para run_maintenance(), que a aplicação roda em segundo
+    plano depois de mostrar a janela.
+    """
     conn = None
     try:
         conn = _get_connection()
         if conn is None: return False
-        cursor = conn.cursor()
-
-        # Tabela para os atendimentos
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS atendimentos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                badge_number TEXT NOT NULL,
-                nome TEXT,
-                login TEXT,
-                gestor TEXT,
-                turno TEXT,
-                setor TEXT,
-                processo TEXT,
-                tenure TEXT,
-                -- MELHORIA: Adiciona tipo_atendimento
-                tipo_atendimento TEXT,
-                -- Campos de Queixa Atualizados
-                qp_sintoma TEXT,
-                qp_regiao TEXT,
-                qs_sintomas TEXT,
-                qs_regioes TEXT,
-                -- Fim Campos de Queixa
-                hqa TEXT,
-                tax TEXT,
-                pa_sistolica TEXT,
-                pa_diastolica TEXT,
-                fc TEXT,
-                sat TEXT,
-                doencas_preexistentes TEXT,
-                alergias TEXT,
-                medicamentos_em_uso TEXT,
-                observacoes TEXT,
-                data_atendimento TEXT NOT NULL,
-                hora_atendimento TEXT NOT NULL,
-                semana_iso INTEGER NOT NULL
-            )
-        """)
-        
-        # --- Verificação de Colunas Faltando (Migração Simples) ---
-        colunas_atendimento = [col[1] for col in cursor.execute("PRAGMA table_info(atendimentos)").fetchall()]
-        colunas_necessarias = ['tipo_atendimento', 'qp_sintoma', 'qp_regiao', 'qs_sintomas', 'qs_regioes']
-        
-        for col in colunas_necessarias:
-            if col not in colunas_atendimento:
-                try:
-                    cursor.execute(f"ALTER TABLE atendimentos ADD COLUMN {col} TEXT DEFAULT 'N/A'")
-                    print(f"Coluna '{col}' adicionada à tabela 'atendimentos'.")
-                except sqlite3.OperationalError as e:
-                    print(f"Aviso: Não foi possível adicionar a coluna {col}: {e}")
-
-        # Remove coluna antiga 'queixas_principais' se existir e novas colunas existirem
-        if 'queixas_principais' in colunas_atendimento and 'qp_sintoma' in colunas_atendimento:
-             try:
-                 # Renomeia para backup, em vez de apagar
-                 cursor.execute("ALTER TABLE atendimentos RENAME COLUMN queixas_principais TO queixas_principais_old")
-                 print("Coluna 'queixas_principais' antiga renomeada para 'queixas_principais_old'.")
-             except sqlite3.OperationalError as e:
-                 print(f"Aviso: Não foi possível renomear a coluna 'queixas_principais': {e}")
-        # --- Fim Migração Simples ---
-
-
-        # Tabela para as condutas
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS condutas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                atendimento_id INTEGER NOT NULL,
-                hipotese_diagnostica TEXT,
-                -- conduta_adotada TEXT, -- Removido
-                resumo_conduta TEXT,
-                medicamento_administrado TEXT,
-                posologia TEXT,
-                horario_medicacao TEXT,
-                observacoes TEXT,
-                FOREIGN KEY (atendimento_id) REFERENCES atendimentos (id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Verifica coluna 'conduta_adotada' e remove se existir
-        colunas_conduta = [col[1] for col in cursor.execute("PRAGMA table_info(condutas)").fetchall()]
-        if 'conduta_adotada' in colunas_conduta:
-            try:
-                # Renomeia para backup
-                cursor.execute("ALTER TABLE condutas RENAME COLUMN conduta_adotada TO conduta_adotada_old")
-                print("Coluna 'conduta_adotada_old' antiga renomeada.")
-            except sqlite3.OperationalError as e:
-                 print(f"Aviso: Não foi possível renomear a coluna 'conduta_adotada': {e}")
-
-
-        conn.commit()
+        version_before = migrations.get_schema_version(conn)
+        migrations.migrate(conn)
+        _versions_before_init.setdefault(get_db_path(), version_before)
+        prune_change_log(conn)
         return True
     except Exception as e:
         print(f"Erro em init_db: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
-def save_atendimento(atendimento: Atendimento):
-    """Salva um novo atendimento e suas condutas no banco de dados."""
-    conn = None
+def run_maintenance():
+    """Completa os backfills das migrações e roda VACUUM se alguma reescreveu a tabela.
+
+    Em um banco grande recém-migrado leva dezenas de segundos, por isso não
+    deve rodar na thread do Tk (ver start_background_maintenance). Cada lote
+    é uma transação curta e o progresso fica em `backfills`: interromper
+    (fechar o aplicativo) não perde nada, a próxima execução continua.
+    Enquanto isso a busca textual, os resumos e os filtros por queixa e
+    sinais vitais ainda não enxergam as linhas não preenchidas.
+    """
     try:
         conn = _get_connection()
-        if conn is None: return None
-        cursor = conn.cursor()
-
-        # Insere o atendimento principal
-        cursor.execute("""
-            INSERT INTO atendimentos (
-                badge_number, nome, login, gestor, turno, setor, processo, tenure,
-                tipo_atendimento, qp_sintoma, qp_regiao, qs_sintomas, qs_regioes,
-                hqa, tax, pa_sistolica, pa_diastolica, fc, sat, doencas_preexistentes,
-                alergias, medicamentos_em_uso, observacoes, data_atendimento,
-                hora_atendimento, semana_iso
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            atendimento.badge_number, atendimento.nome, atendimento.login, atendimento.gestor,
-            atendimento.turno, atendimento.setor, atendimento.processo, atendimento.tenure,
-            # --- MELHORIA: Salva tipo_atendimento e novas queixas ---
-            atendimento.tipo_atendimento, atendimento.qp_sintoma, atendimento.qp_regiao,
-            atendimento.qs_sintomas, atendimento.qs_regioes,
-            # --- Fim ---
-            atendimento.hqa, atendimento.tax, atendimento.pa_sistolica,
-            atendimento.pa_diastolica, atendimento.fc, atendimento.sat, atendimento.doencas_preexistentes,
-            atendimento.alergias, atendimento.medicamentos_em_uso, atendimento.observacoes,
-            atendimento.data_atendimento, atendimento.hora_atendimento, atendimento.semana_iso
-        ))
-        atendimento_id = cursor.lastrowid
-
-        # Insere todas as condutas associadas
-        for conduta in atendimento.condutas:
-            cursor.execute("""
-                INSERT INTO condutas (
-                    atendimento_id, hipotese_diagnostica, resumo_conduta,
-                    medicamento_administrado, posologia, horario_medicacao,
-                    observacoes
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                atendimento_id, conduta.hipotese_diagnostica,
-                conduta.resumo_conduta, conduta.medicamento_administrado,
-                conduta.posologia, conduta.horario_medicacao, conduta.observacoes
-            ))
-
-        conn.commit()
-        return atendimento_id
+        if conn is None: return False
+        db_path = get_db_path()
+        migrations.run_backfills(conn)
+        version_before = _versions_before_init.pop(db_path, None)
+        if version_before is not None:
+            migrations.compact_if_rewritten(conn, version_before)
+        return True
     except Exception as e:
-        print(f"Erro ao salvar atendimento: {e}")
-        if conn: conn.rollback()
-        return None
-    finally:
-        if conn:
-            conn.close()
+        print(f"Erro na manutenção do banco: {e}")
+        return False
+
+def start_background_maintenance():
+    """Roda run_maintenance() em uma thread de fundo, com conexão própria. Retorna a thread."""
+    def run():
+        try:
+            run_maintenance()
+        finally:
+            release_thread_connection()
+    thread = threading.Thread(target=run, name="manutencao-banco", daemon=True)
+    thread.start()
+    return thread
+
+# Colunas categóricas guardadas como id em tabelas de dicionário (migração 7)
+_LOOKUP_COLUMNS = list(migrations.LOOKUP_TABLES.items())
+
+def _lookup_id_sql(coluna):
+    return f"(SELECT id FROM {migrations.LOOKUP_TABLES[coluna]} WHERE nome = ?)"
+
+def _ensure_lookup_values(cursor, atendimento):
+    """Cadastra nas tabelas de dicionário os valores categóricos novos do atendimento."""
+    for coluna, tabela in _LOOKUP_COLUMNS:
+        valor = getattr(atendimento, coluna)
+        if valor is not None:
+            cursor.execute(f"INSERT OR IGNORE INTO {tabela} (nome) VALUES (?)", (valor,))
+
+def _insert_atendimento(cursor, atendimento: Atendimento):
+    """Insere o atendimento e suas condutas usando o cursor dado, sem commit. Retorna o id."""
+    _ensure_lookup_values(cursor, atendimento)
+    cursor.execute(f"""
+        INSERT INTO atendimentos_base (
+            badge_number, nome, login, gestor_id, turno_id, setor_id, processo_id, tenure,
+            tipo_atendimento_id, qp_sintoma, qp_regiao, qs_sintomas, qs_regioes,
+            hqa, tax, pa_sistolica, pa_diastolica, fc, sat, doencas_preexistentes,
+            alergias, medicamentos_em_uso, observacoes, data_atendimento,
+            hora_atendimento, semana_iso, ts_atendimento, resumo_conduta_principal, record_key
+        ) VALUES (?, ?, ?, {_lookup_id_sql('gestor')}, {_lookup_id_sql('turno')}, {_lookup_id_sql('setor')},
+                  {_lookup_id_sql('processo')}, ?, {_lookup_id_sql('tipo_atendimento')},
+                  ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        atendimento.badge_number, atendimento.nome, atendimento.login, atendimento.gestor,
+        atendimento.turno, atendimento.setor, atendimento.processo, atendimento.tenure,
+        atendimento.tipo_atendimento, atendimento.qp_sintoma, atendimento.qp_regiao,
+        atendimento.qs_sintomas, atendimento.qs_regioes,
+        atendimento.hqa, atendimento.tax, atendimento.pa_sistolica,
+        atendimento.pa_diastolica, atendimento.fc, atendimento.sat, atendimento.doencas_preexistentes,
+        atendimento.alergias, atendimento.medicamentos_em_uso, atendimento.observacoes,
+        atendimento.data_atendimento, atendimento.hora_atendimento, atendimento.semana_iso,
+        to_timestamp(f"{atendimento.data_atendimento} {atendimento.hora_atendimento}"),
+        _resumo_conduta_principal(atendimento), atendimento.record_key
+    ))
+    atendimento_id = cursor.lastrowid
+    _insert_condutas(cursor, atendimento_id, atendimento.condutas)
+    return atendimento_id
+
+def _insert_condutas(cursor, atendimento_id, condutas):
+    """Insere as condutas de um atendimento, sem commit."""
+    cursor.executemany("""
+        INSERT INTO condutas (
+            atendimento_id, hipotese_diagnostica, resumo_conduta,
+            medicamento_administrado, posologia, horario_medicacao,
+            observacoes
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(
+        atendimento_id, conduta.hipotese_diagnostica,
+        conduta.resumo_conduta, conduta.medicamento_administrado,
+        conduta.posologia, conduta.horario_medicacao, conduta.observacoes
+    ) for conduta in condutas])
+
+def save_atendimento(atendimento: Atendimento):
+    """Salva um novo atendimento e suas condutas no banco de dados.
+
+    Retorna o id gravado; se não for possível gravar, levanta DatabaseWriteError.
+    """
+    atendimento_id = _run_write("salvar o atendimento", lambda cursor: _insert_atendimento(cursor, atendimento))
+    invalidate_identity_cache(atendimento.badge_number)
+    return atendimento_id
+
+def save_atendimentos_batch(atendimentos):
+    """Grava vários atendimentos (com record_key) em uma única transação.
+
+    Idempotente: um record_key que já está no banco não é inserido de novo,
+    então o mesmo lote pode ser reenviado após uma falha sem criar duplicatas.
+    Retorna {record_key: id}; levanta DatabaseWriteError se não gravar.
+    """
+    def write(cursor):
+        ids = {}
+        for atendimento in atendimentos:
+            row = cursor.execute("SELECT id FROM atendimentos_base WHERE record_key = ?",
+                                 (atendimento.record_key,)).fetchone()
+            ids[atendimento.record_key] = row[0] if row else _insert_atendimento(cursor, atendimento)
+        return ids
+
+    if not atendimentos:
+        return {}
+    ids = _run_write(f"enviar {len(atendimentos)} atendimento(s)", write)
+    for atendimento in atendimentos:
+        invalidate_identity_cache(atendimento.badge_number)
+    return ids
 
 
 def get_atendimento_by_id(atendimento_id):
@@ -205,9 +343,9 @@ def get_atendimento_by_id(atendimento_id):
     try:
         conn = _get_connection()
         if conn is None: return None
-        # Configura a conexão para retornar dicionários
-        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
+        # Configura o cursor para retornar dicionários (a conexão é compartilhada)
+        cursor.row_factory = sqlite3.Row
 
         # Busca o atendimento
         cursor.execute("SELECT * FROM atendimentos WHERE id = ?", (atendimento_id,))
@@ -238,38 +376,46 @@ def get_atendimento_by_id(atendimento_id):
     except Exception as e:
         print(f"Erro em get_atendimento_by_id: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def get_last_atendimento_by_badge(badge_number):
-    """Busca os dados de identificação do último atendimento de um paciente."""
+    """Busca os dados de identificação do último atendimento de um paciente.
+
+    O resultado fica em um cache LRU, invalidado quando este processo grava
+    um atendimento do mesmo badge.
+    """
+    with _identity_cache_lock:
+        if badge_number in _identity_cache:
+            _identity_cache.move_to_end(badge_number)
+            cached = _identity_cache[badge_number]
+            return dict(cached) if cached else None
+
     conn = None
     try:
         conn = _get_connection()
         if conn is None: return None
-        conn.row_factory = sqlite3.Row # Retorna como dict
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row # Retorna como dict
         
         # Seleciona apenas os campos de identificação
         cursor.execute("""
             SELECT nome, login, gestor, turno, setor, processo, tenure
             FROM atendimentos
             WHERE badge_number = ?
-            ORDER BY data_atendimento DESC, hora_atendimento DESC
+            ORDER BY ts_atendimento DESC
             LIMIT 1
         """, (badge_number,))
         
         data = cursor.fetchone()
-        if data:
-            return dict(data) # Retorna um dicionário
-        return None
+        identity = dict(data) if data else None
+        with _identity_cache_lock:
+            _identity_cache[badge_number] = identity
+            _identity_cache.move_to_end(badge_number)
+            while len(_identity_cache) > IDENTITY_CACHE_SIZE:
+                _identity_cache.popitem(last=False)
+        return dict(identity) if identity else None # Retorna um dicionário
     except Exception as e:
         print(f"Erro em get_last_atendimento_by_badge: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 
 def get_atendimentos_by_badge(badge_number=None, days_ago=15):
@@ -282,17 +428,16 @@ def get_atendimentos_by_badge(badge_number=None, days_ago=15):
         
         date_limit = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
 
-        query_params = [date_limit]
-        # --- MELHORIA: Adiciona qp_sintoma e resumo_conduta (via subquery) ---
+        query_params = [to_timestamp(date_limit)]
+        # resumo_conduta vem da coluna desnormalizada (primeira conduta), sem subquery por linha
         query_str = """
             SELECT
                 a.id, a.badge_number, a.nome, a.login,
                 a.data_atendimento, a.hora_atendimento,
                 a.qp_sintoma,
-                (SELECT c.resumo_conduta FROM condutas c
-                 WHERE c.atendimento_id = a.id LIMIT 1) as resumo_conduta
+                a.resumo_conduta_principal as resumo_conduta
             FROM atendimentos a
-            WHERE a.data_atendimento >= ?
+            WHERE a.ts_atendimento >= ?
         """
         # --- Fim Melhoria ---
         
@@ -300,7 +445,7 @@ def get_atendimentos_by_badge(badge_number=None, days_ago=15):
             query_str += " AND a.badge_number = ?"
             query_params.append(badge_number)
         
-        query_str += " ORDER BY a.data_atendimento DESC, a.hora_atendimento DESC"
+        query_str += " ORDER BY a.ts_atendimento DESC, a.id DESC"
         
         cursor.execute(query_str, query_params)
         
@@ -309,9 +454,6 @@ def get_atendimentos_by_badge(badge_number=None, days_ago=15):
     except Exception as e:
         print(f"Erro em get_atendimentos_by_badge: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
 def get_atendimentos_by_datetime_range(start_datetime_str, end_datetime_str, badge_number=None):
     """Busca atendimentos dentro de um intervalo de data e hora."""
@@ -321,17 +463,16 @@ def get_atendimentos_by_datetime_range(start_datetime_str, end_datetime_str, bad
         if conn is None: return []
         cursor = conn.cursor()
         
-        query_params = [start_datetime_str, end_datetime_str]
-        # --- MELHORIA: Adiciona qp_sintoma e resumo_conduta (via subquery) ---
+        query_params = [to_timestamp(start_datetime_str), to_timestamp(end_datetime_str)]
+        # resumo_conduta vem da coluna desnormalizada (primeira conduta), sem subquery por linha
         query_str = """
             SELECT
                 a.id, a.badge_number, a.nome, a.login,
                 a.data_atendimento, a.hora_atendimento,
                 a.qp_sintoma,
-                (SELECT c.resumo_conduta FROM condutas c
-                 WHERE c.atendimento_id = a.id LIMIT 1) as resumo_conduta
+                a.resumo_conduta_principal as resumo_conduta
             FROM atendimentos a
-            WHERE (a.data_atendimento || ' ' || a.hora_atendimento) BETWEEN ? AND ?
+            WHERE a.ts_atendimento BETWEEN ? AND ?
         """
         # --- Fim Melhoria ---
         
@@ -339,7 +480,7 @@ def get_atendimentos_by_datetime_range(start_datetime_str, end_datetime_str, bad
             query_str += " AND a.badge_number = ?"
             query_params.append(badge_number)
         
-        query_str += " ORDER BY a.data_atendimento DESC, a.hora_atendimento DESC"
+        query_str += " ORDER BY a.ts_atendimento DESC, a.id DESC"
         
         cursor.execute(query_str, query_params)
         
@@ -348,186 +489,1179 @@ def get_atendimentos_by_datetime_range(start_datetime_str, end_datetime_str, bad
     except Exception as e:
         print(f"Erro em get_atendimentos_by_datetime_range: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
 
-def update_atendimento(atendimento: Atendimento):
-    """Atualiza um atendimento existente no banco de dados."""
+HISTORY_PAGE_SIZE = 100
+
+def get_atendimentos_page(start_datetime_str, end_datetime_str=None, badge_number=None,
+                          after=None, limit=HISTORY_PAGE_SIZE):
+    """Busca uma página do histórico, do mais recente para o mais antigo (paginação keyset).
+
+    A ordem é (data+hora, id) decrescente. `after` é o cursor devolvido pela
+    página anterior; None busca a primeira página. Retorna (linhas, cursor),
+    onde cursor é None quando não há mais páginas. As linhas têm as mesmas
+    colunas de get_atendimentos_by_datetime_range.
+    """
     conn = None
     try:
         conn = _get_connection()
-        if conn is None: return
+        if conn is None: return [], None
         cursor = conn.cursor()
 
+        query_params = [to_timestamp(start_datetime_str)]
+        query_str = """
+            SELECT
+                a.id, a.badge_number, a.nome, a.login,
+                a.data_atendimento, a.hora_atendimento,
+                a.qp_sintoma,
+                a.resumo_conduta_principal as resumo_conduta,
+                a.ts_atendimento
+            FROM atendimentos a
+            WHERE a.ts_atendimento >= ?
+        """
+        if end_datetime_str is not None:
+            query_str += " AND a.ts_atendimento <= ?"
+            query_params.append(to_timestamp(end_datetime_str))
+        if badge_number is not None:
+            query_str += " AND a.badge_number = ?"
+            query_params.append(badge_number)
+        if after is not None:
+            # Continua logo depois da última linha da página anterior
+            query_str += " AND (a.ts_atendimento, a.id) < (?, ?)"
+            query_params.extend(after)
+
+        query_str += " ORDER BY a.ts_atendimento DESC, a.id DESC LIMIT ?"
+        query_params.append(limit)
+
+        rows = cursor.execute(query_str, query_params).fetchall()
+        next_cursor = (rows[-1][8], rows[-1][0]) if len(rows) == limit else None
+        return [row[:8] for row in rows], next_cursor
+    except Exception as e:
+        print(f"Erro em get_atendimentos_page: {e}")
+        return [], None
+
+# --- Detecção de mudanças (migração 11) ---
+# Alterações mantidas no registro; quem estiver mais atrasado que isso recarrega tudo
+CHANGE_LOG_KEEP = 50000
+# Acima disso é mais barato recarregar o histórico do que aplicar as alterações uma a uma
+CHANGES_MAX = 500
+
+def prune_change_log(conn=None, keep=CHANGE_LOG_KEEP):
+    """Apaga do registro de alterações tudo menos as `keep` mais recentes (melhor esforço)."""
+    try:
+        conn = conn or _get_connection()
+        with conn:
+            conn.execute("DELETE FROM alteracoes WHERE seq <= (SELECT MAX(seq) FROM alteracoes) - ?", (keep,))
+    except sqlite3.Error as e:
+        # Banco ocupado: a poda fica para a próxima inicialização
+        print(f"Registro de alterações não podado: {e}")
+
+def get_data_version():
+    """PRAGMA data_version da conexão desta thread: muda quando outra conexão grava no banco.
+
+    Custa uma leitura do índice do WAL, sem tocar nas tabelas; serve para
+    saber se vale a pena consultar de novo.
+    """
+    return _get_connection().execute("PRAGMA data_version").fetchone()[0]
+
+def get_change_seq():
+    """Última posição do registro de alterações (0 se vazio)."""
+    return _get_connection().execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+
+def get_changes_since(seq, limit=CHANGES_MAX):
+    """Alterações de atendimentos depois de `seq`: ({id: 'I'|'U'|'D'}, nova_seq).
+
+    Para cada atendimento vale a última operação. Retorna None se as
+    alterações desde `seq` já foram podadas ou passam de `limit`: nesse caso
+    é preciso recarregar tudo.
+    """
+    try:
+        conn = _get_connection()
+        primeira = conn.execute("SELECT MIN(seq) FROM alteracoes").fetchone()[0]
+        if primeira is not None and seq < primeira - 1:
+            return None
+        rows = conn.execute(
+            "SELECT seq, atendimento_id, operacao FROM alteracoes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (seq, limit + 1)).fetchall()
+        if len(rows) > limit:
+            return None
+        return {atendimento_id: operacao for _, atendimento_id, operacao in rows}, (rows[-1][0] if rows else seq)
+    except Exception as e:
+        print(f"Erro em get_changes_since: {e}")
+        return None
+
+def get_atendimentos_by_ids(ids):
+    """Linhas de histórico (colunas de get_atendimentos_page mais ts_atendimento) dos ids que existem."""
+    ids = list(ids)
+    if not ids:
+        return []
+    try:
+        return _get_connection().execute(f"""
+            SELECT
+                a.id, a.badge_number, a.nome, a.login,
+                a.data_atendimento, a.hora_atendimento,
+                a.qp_sintoma,
+                a.resumo_conduta_principal as resumo_conduta,
+                a.ts_atendimento
+            FROM atendimentos_base a
+            WHERE a.id IN ({', '.join('?' * len(ids))})
+        """, ids).fetchall()
+    except Exception as e:
+        print(f"Erro em get_atendimentos_by_ids: {e}")
+        return []
+
+def qs_mask(itens, opcoes):
+    """Máscara de bits de uma lista de queixas (bit i = opcoes[i], SINTOMAS ou REGIOES)."""
+    mask = 0
+    for item in itens:
+        if item not in opcoes:
+            raise ValueError(f"Queixa desconhecida: {item}")
+        mask |= 1 << opcoes.index(item)
+    return mask
+
+def qs_from_mask(mask, opcoes):
+    """Lista de queixas de uma máscara de bits, na ordem de opcoes."""
+    return [item for i, item in enumerate(opcoes) if mask and mask >> i & 1]
+
+def get_atendimentos_by_queixa(sintomas=(), regioes=(), start_datetime_str=None, end_datetime_str=None,
+                               badge_number=None, incluir_principal=True):
+    """Busca atendimentos com algum dos sintomas e alguma das regiões informados.
+
+    Compara as máscaras qs_sintomas_mask / qs_regioes_mask (e, com
+    incluir_principal, também qp_sintoma / qp_regiao). Com período, o
+    filtro de data usa o índice de ts_atendimento e as máscaras são testadas
+    só nas linhas do período. Retorna as mesmas colunas de
+    get_atendimentos_by_datetime_range, do mais recente para o mais antigo.
+    """
+    conn = None
+    try:
+        conn = _get_connection()
+        if conn is None: return []
+
+        conditions, query_params = [], []
+        if start_datetime_str is not None:
+            conditions.append("a.ts_atendimento >= ?")
+            query_params.append(to_timestamp(start_datetime_str))
+        if end_datetime_str is not None:
+            conditions.append("a.ts_atendimento <= ?")
+            query_params.append(to_timestamp(end_datetime_str))
+        if badge_number is not None:
+            conditions.append("a.badge_number = ?")
+            query_params.append(badge_number)
+        for itens, opcoes, mask_col, qp_col in ((sintomas, SINTOMAS, "qs_sintomas_mask", "qp_sintoma"),
+                                                (regioes, REGIOES, "qs_regioes_mask", "qp_regiao")):
+            if not itens:
+                continue
+            condition = f"(a.{mask_col} & ?) != 0"
+            query_params.append(qs_mask(itens, opcoes))
+            if incluir_principal:
+                condition = f"({condition} OR a.{qp_col} IN ({', '.join('?' * len(itens))}))"
+                query_params.extend(itens)
+            conditions.append(condition)
+
+        query_str = f"""
+            SELECT
+                a.id, a.badge_number, a.nome, a.login,
+                a.data_atendimento, a.hora_atendimento,
+                a.qp_sintoma,
+                a.resumo_conduta_principal as resumo_conduta
+            FROM atendimentos a
+            WHERE {' AND '.join(conditions) or '1=1'}
+            ORDER BY a.ts_atendimento DESC, a.id DESC
+        """
+        return conn.execute(query_str, query_params).fetchall()
+    except Exception as e:
+        print(f"Erro em get_atendimentos_by_queixa: {e}")
+        return []
+
+SEARCH_PAGE_SIZE = 50
+SEARCH_ORDERS = ("relevancia", "recentes")
+
+def _fts_query(texto):
+    """Converte o texto digitado em uma consulta FTS5: todas as palavras, cada uma como prefixo.
+
+    Aspas e operadores do FTS5 são descartados, então qualquer texto é uma
+    consulta válida. Retorna None se não houver nenhuma palavra.
+    """
+    palavras = re.findall(r"\w+", texto or "")
+    return " ".join(f'"{p}"*' for p in palavras) or None
+
+def search_atendimentos(texto, start_datetime_str=None, end_datetime_str=None, badge_number=None,
+                        ordem="relevancia", after=None, limit=SEARCH_PAGE_SIZE):
+    """Busca textual no HQA, observações, doenças, alergias, medicamentos e hipóteses diagnósticas.
+
+    Acentos e maiúsculas são ignorados e cada palavra casa como prefixo
+    ("cefal" encontra "Cefaléia"); o atendimento precisa conter todas as
+    palavras. `ordem` é 'relevancia' (bm25) ou 'recentes' (ordem de registro,
+    a mais rápida: não precisa calcular a relevância de todos os resultados,
+    o que custa centenas de ms quando um termo casa com 100 mil+ atendimentos).
+    Retorna (linhas, cursor) e `after` é o cursor da página anterior (None
+    quando não há mais páginas). Em 'recentes' a paginação é keyset, como em
+    get_atendimentos_page: o cursor é o id da última linha. Em 'relevancia' o
+    cursor é um OFFSET, porque o bm25 de um atendimento muda a cada gravação
+    (depende das estatísticas do índice inteiro) e não serve de chave estável.
+    As linhas têm as colunas de get_atendimentos_by_datetime_range mais
+    `trecho`, um pedaço do texto com as palavras encontradas entre colchetes.
+    """
+    if ordem not in SEARCH_ORDERS:
+        raise ValueError(f"Ordem de busca desconhecida: {ordem}")
+    consulta = _fts_query(texto)
+    if consulta is None:
+        return [], None
+    conn = None
+    try:
+        conn = _get_connection()
+        if conn is None: return [], None
+
+        conditions, query_params = ["atendimentos_fts MATCH ?"], [consulta]
+        if start_datetime_str is not None:
+            conditions.append("a.ts_atendimento >= ?")
+            query_params.append(to_timestamp(start_datetime_str))
+        if end_datetime_str is not None:
+            conditions.append("a.ts_atendimento <= ?")
+            query_params.append(to_timestamp(end_datetime_str))
+        if badge_number is not None:
+            conditions.append("a.badge_number = ?")
+            query_params.append(badge_number)
+        # Só ORDER BY rank ou rowid é resolvido pelo próprio FTS5; qualquer outra ordem
+        # obrigaria a ordenar (e gerar o trecho de) todos os resultados antes do LIMIT
+        if ordem == "relevancia":
+            order_by, offset = "f.rank", after or 0
+        else:
+            order_by, offset = "f.rowid DESC", 0
+            if after is not None:
+                # Continua logo depois da última linha da página anterior
+                conditions.append("f.rowid < ?")
+                query_params.append(after)
+
+        query_str = f"""
+            SELECT
+                a.id, a.badge_number, a.nome, a.login,
+                a.data_atendimento, a.hora_atendimento,
+                a.qp_sintoma,
+                a.resumo_conduta_principal as resumo_conduta,
+                snippet(atendimentos_fts, -1, '[', ']', '…', 12) as trecho
+            FROM atendimentos_fts f
+            JOIN atendimentos_base a ON a.id = f.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+        """
+        query_params.extend((limit, offset))
+        rows = conn.execute(query_str, query_params).fetchall()
+        if len(rows) < limit:
+            return rows, None
+        return rows, (offset + limit if ordem == "relevancia" else rows[-1][0])
+    except Exception as e:
+        print(f"Erro em search_atendimentos: {e}")
+        return [], None
+
+# Sinais vitais com coluna numérica <vital>_valor (migração 8)
+VITAIS = tuple(migrations.VITAL_COLUMNS)
+VITAL_GROUP_COLUMNS = tuple(migrations.LOOKUP_TABLES) + ("data_atendimento",)
+
+def _vital_column(vital):
+    if vital not in migrations.VITAL_COLUMNS:
+        raise ValueError(f"Sinal vital desconhecido: {vital}")
+    return f"{vital}_valor"
+
+def _vital_conditions(coluna, minimo, maximo, start_datetime_str, end_datetime_str):
+    conditions, params = [f"a.{coluna} IS NOT NULL"], []
+    if minimo is not None:
+        conditions.append(f"a.{coluna} >= ?")
+        params.append(minimo)
+    if maximo is not None:
+        conditions.append(f"a.{coluna} <= ?")
+        params.append(maximo)
+    if start_datetime_str is not None:
+        conditions.append("a.ts_atendimento >= ?")
+        params.append(to_timestamp(start_datetime_str))
+    if end_datetime_str is not None:
+        conditions.append("a.ts_atendimento <= ?")
+        params.append(to_timestamp(end_datetime_str))
+    return conditions, params
+
+def get_atendimentos_by_vital(vital, minimo=None, maximo=None, start_datetime_str=None,
+                              end_datetime_str=None, badge_number=None):
+    """Busca atendimentos com o sinal vital entre minimo e maximo (inclusive; None = sem limite).
+
+    `vital` é um de VITAIS ('tax', 'pa_sistolica', 'pa_diastolica', 'fc',
+    'sat'); atendimentos sem o valor ("N/A") nunca entram. Ex.: SAT abaixo de
+    92 na semana = get_atendimentos_by_vital('sat', maximo=91, start_datetime_str=...).
+    Retorna as colunas de get_atendimentos_by_queixa mais `valor`, do mais
+    recente para o mais antigo.
+    """
+    coluna = _vital_column(vital)
+    conn = None
+    try:
+        conn = _get_connection()
+        if conn is None: return []
+
+        conditions, query_params = _vital_conditions(coluna, minimo, maximo, start_datetime_str, end_datetime_str)
+        if badge_number is not None:
+            conditions.append("a.badge_number = ?")
+            query_params.append(badge_number)
+        query_str = f"""
+            SELECT
+                a.id, a.badge_number, a.nome, a.login,
+                a.data_atendimento, a.hora_atendimento,
+                a.qp_sintoma,
+                a.resumo_conduta_principal as resumo_conduta,
+                a.{coluna} as valor
+            FROM atendimentos a
+            WHERE {' AND '.join(conditions)}
+            ORDER BY a.ts_atendimento DESC, a.id DESC
+        """
+        return conn.execute(query_str, query_params).fetchall()
+    except Exception as e:
+        print(f"Erro em get_atendimentos_by_vital: {e}")
+        return []
+
+def get_vital_stats(vital, agrupar_por="setor", start_datetime_str=None, end_datetime_str=None,
+                    minimo=None, maximo=None):
+    """Resumo de um sinal vital por grupo: [(grupo, quantidade, média, mínimo, máximo), ...].
+
+    `agrupar_por` é um de VITAL_GROUP_COLUMNS (gestor, turno, setor,
+    processo, tipo_atendimento ou data_atendimento). Atendimentos sem o valor
+    não entram na conta. Ordenado pelo grupo.
+    """
+    coluna = _vital_column(vital)
+    if agrupar_por not in VITAL_GROUP_COLUMNS:
+        raise ValueError(f"Agrupamento não suportado: {agrupar_por}")
+    conn = None
+    try:
+        conn = _get_connection()
+        if conn is None: return []
+
+        conditions, query_params = _vital_conditions(coluna, minimo, maximo, start_datetime_str, end_datetime_str)
+        query_str = f"""
+            SELECT a.{agrupar_por}, COUNT(*), ROUND(AVG(a.{coluna}), 1), MIN(a.{coluna}), MAX(a.{coluna})
+            FROM atendimentos a
+            WHERE {' AND '.join(conditions)}
+            GROUP BY a.{agrupar_por}
+            ORDER BY a.{agrupar_por}
+        """
+        return conn.execute(query_str, query_params).fetchall()
+    except Exception as e:
+        print(f"Erro em get_vital_stats: {e}")
+        return []
+
+# Resumos pré-calculados por dia / semana (migração 10)
+SUMMARY_DIMENSIONS = tuple(migrations.SUMMARY_DIMENSIONS) + ("medicamento",)
+SUMMARY_GRANULARITIES = {"dia": ("resumo_diario", "dia"), "semana": ("resumo_semanal", "semana")}
+
+def iso_week_start(ano, semana):
+    """Data (YYYY-MM-DD) da segunda-feira da semana ISO, que identifica a semana em resumo_semanal."""
+    return datetime.fromisocalendar(ano, semana, 1).strftime("%Y-%m-%d")
+
+def _summary_query(dimensao, start_date, end_date, granularidade):
+    """FROM/WHERE comum às consultas de resumo, com o nome legível do valor em `nome`."""
+    if dimensao not in SUMMARY_DIMENSIONS:
+        raise ValueError(f"Dimensão de resumo desconhecida: {dimensao}")
+    if granularidade not in SUMMARY_GRANULARITIES:
+        raise ValueError(f"Granularidade desconhecida: {granularidade}")
+    tabela, periodo = SUMMARY_GRANULARITIES[granularidade]
+
+    conditions, params = ["r.dimensao = ?", "r.quantidade != 0"], [dimensao]
+    for data_str, operador in ((start_date, ">="), (end_date, "<=")):
+        if data_str is None:
+            continue
+        if granularidade == "semana":
+            # A semana é a da data informada (identificada pela sua segunda-feira)
+            data = datetime.strptime(data_str, "%Y-%m-%d")
+            data_str = (data - timedelta(days=data.weekday())).strftime("%Y-%m-%d")
+        conditions.append(f"r.{periodo} {operador} ?")
+        params.append(data_str)
+
+    if dimensao in migrations.LOOKUP_TABLES:
+        origem = f"{tabela} r LEFT JOIN {migrations.LOOKUP_TABLES[dimensao]} l ON l.id = r.valor"
+        nome = "COALESCE(l.nome, NULLIF(r.valor, ''))"
+    else:
+        origem, nome = f"{tabela} r", "NULLIF(r.valor, '')"
+    return periodo, nome, f"FROM {origem} WHERE {' AND '.join(conditions)}", params
+
+def get_summary(dimensao, start_date=None, end_date=None, granularidade="dia"):
+    """Contagem de atendimentos por período e valor: [(período, valor, quantidade), ...].
+
+    `dimensao` é um de SUMMARY_DIMENSIONS ('total', 'setor', 'turno',
+    'gestor', 'tipo_atendimento', 'qp_sintoma' ou 'medicamento', este
+    contado por conduta). `granularidade` é 'dia' ou 'semana'; na semanal o
+    período é a data da segunda-feira (ver iso_week_start). Lê as tabelas de
+    resumo, sem varrer atendimentos: o custo depende do número de períodos,
+    não de atendimentos. Valor None = campo vazio.
+    """
+    try:
+        periodo, nome, from_where, params = _summary_query(dimensao, start_date, end_date, granularidade)
+        conn = _get_connection()
+        if conn is None: return []
+        return conn.execute(f"""
+            SELECT r.{periodo}, {nome}, r.quantidade {from_where}
+            ORDER BY r.{periodo}, r.quantidade DESC
+        """, params).fetchall()
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Erro em get_summary: {e}")
+        return []
+
+def get_summary_totals(dimensao, start_date=None, end_date=None, granularidade="dia", limit=None):
+    """Total de cada valor no intervalo: [(valor, quantidade), ...], do maior para o menor.
+
+    Com granularidade 'semana' o intervalo é arredondado para semanas
+    inteiras, e a soma lê uma linha por semana e valor (o mais barato para
+    intervalos de meses ou anos).
+    """
+    try:
+        periodo, nome, from_where, params = _summary_query(dimensao, start_date, end_date, granularidade)
+        conn = _get_connection()
+        if conn is None: return []
+        query_str = f"SELECT {nome}, SUM(r.quantidade) {from_where} GROUP BY 1 ORDER BY 2 DESC, 1"
+        if limit is not None:
+            query_str += " LIMIT ?"
+            params.append(limit)
+        return conn.execute(query_str, params).fetchall()
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Erro em get_summary_totals: {e}")
+        return []
+
+def get_period_totals(dimensao, start_datetime_str, end_datetime_str, limit=None):
+    """Como get_summary_totals, mas contado direto dos atendimentos de um intervalo de data+hora.
+
+    Para períodos curtos que não são dias inteiros (ex.: a escala atual, que
+    vira a meia-noite): usa o índice de ts_atendimento e lê só as linhas do
+    intervalo.
+    """
+    if dimensao not in SUMMARY_DIMENSIONS:
+        raise ValueError(f"Dimensão de resumo desconhecida: {dimensao}")
+    conn = None
+    try:
+        conn = _get_connection()
+        if conn is None: return []
+
+        if dimensao == "medicamento":
+            valor = "c.medicamento_administrado"
+            origem = "atendimentos a JOIN condutas c ON c.atendimento_id = a.id"
+        else:
+            valor = "NULL" if dimensao == "total" else f"a.{dimensao}"
+            origem = "atendimentos a"
+        query_str = f"""
+            SELECT NULLIF({valor}, ''), COUNT(*)
+            FROM {origem}
+            WHERE a.ts_atendimento BETWEEN ? AND ?
+            GROUP BY 1 ORDER BY 2 DESC, 1
+        """
+        query_params = [to_timestamp(start_datetime_str), to_timestamp(end_datetime_str)]
+        if limit is not None:
+            query_str += " LIMIT ?"
+            query_params.append(limit)
+        return conn.execute(query_str, query_params).fetchall()
+    except Exception as e:
+        print(f"Erro em get_period_totals: {e}")
+        return []
+
+def update_atendimento(atendimento: Atendimento):
+    """Atualiza um atendimento existente no banco de dados.
+
+    Retorna True; se não for possível gravar, levanta DatabaseWriteError.
+    """
+    params = (
+        atendimento.nome, atendimento.login, atendimento.gestor, atendimento.turno,
+        atendimento.setor, atendimento.processo, atendimento.tenure,
+        # --- MELHORIA: Salva tipo_atendimento e novas queixas ---
+        atendimento.tipo_atendimento, atendimento.qp_sintoma, atendimento.qp_regiao,
+        atendimento.qs_sintomas, atendimento.qs_regioes,
+        # --- Fim ---
+        atendimento.hqa, atendimento.tax, atendimento.pa_sistolica,
+        atendimento.pa_diastolica, atendimento.fc, atendimento.sat, atendimento.doencas_preexistentes,
+        atendimento.alergias, atendimento.medicamentos_em_uso,
+        atendimento.observacoes, _resumo_conduta_principal(atendimento), atendimento.id
+    )
+
+    def write(cursor):
+        _ensure_lookup_values(cursor, atendimento)
         # Atualiza o atendimento principal
-        cursor.execute("""
-            UPDATE atendimentos SET
-                nome = ?, login = ?, gestor = ?, turno = ?, setor = ?, processo = ?,
+        cursor.execute(f"""
+            UPDATE atendimentos_base SET
+                nome = ?, login = ?, gestor_id = {_lookup_id_sql('gestor')}, turno_id = {_lookup_id_sql('turno')},
+                setor_id = {_lookup_id_sql('setor')}, processo_id = {_lookup_id_sql('processo')},
                 tenure = ?, 
-                tipo_atendimento = ?, qp_sintoma = ?, qp_regiao = ?, qs_sintomas = ?, qs_regioes = ?,
+                tipo_atendimento_id = {_lookup_id_sql('tipo_atendimento')}, qp_sintoma = ?, qp_regiao = ?, qs_sintomas = ?, qs_regioes = ?,
                 hqa = ?, tax = ?, pa_sistolica = ?,
                 pa_diastolica = ?, fc = ?, sat = ?, doencas_preexistentes = ?, alergias = ?,
-                medicamentos_em_uso = ?, observacoes = ?
+                medicamentos_em_uso = ?, observacoes = ?,
+                ts_atendimento = CAST(strftime('%s', data_atendimento || ' ' || hora_atendimento) AS INTEGER),
+                resumo_conduta_principal = ?
             WHERE id = ?
-        """, (
-            atendimento.nome, atendimento.login, atendimento.gestor, atendimento.turno,
-            atendimento.setor, atendimento.processo, atendimento.tenure,
-            # --- MELHORIA: Salva tipo_atendimento e novas queixas ---
-            atendimento.tipo_atendimento, atendimento.qp_sintoma, atendimento.qp_regiao,
-            atendimento.qs_sintomas, atendimento.qs_regioes,
-            # --- Fim ---
-            atendimento.hqa, atendimento.tax, atendimento.pa_sistolica,
-            atendimento.pa_diastolica, atendimento.fc, atendimento.sat, atendimento.doencas_preexistentes,
-            atendimento.alergias, atendimento.medicamentos_em_uso,
-            atendimento.observacoes, atendimento.id
-        ))
+        """, params)
 
         # Remove as condutas antigas e insere as novas
         cursor.execute("DELETE FROM condutas WHERE atendimento_id = ?", (atendimento.id,))
-        for conduta in atendimento.condutas:
-            cursor.execute("""
-                INSERT INTO condutas (
-                    atendimento_id, hipotese_diagnostica, resumo_conduta,
-                    medicamento_administrado, posologia, horario_medicacao,
-                    observacoes
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                atendimento.id, conduta.hipotese_diagnostica,
-                conduta.resumo_conduta, conduta.medicamento_administrado,
-                conduta.posologia, conduta.horario_medicacao, conduta.observacoes
-            ))
-
-        conn.commit()
-    except Exception as e:
-        print(f"Erro ao atualizar atendimento: {e}")
-        if conn: conn.rollback()
-    finally:
-        if conn:
-            conn.close()
+        _insert_condutas(cursor, atendimento.id, atendimento.condutas)
+
+    _run_write("atualizar o atendimento", write)
+    invalidate_identity_cache(atendimento.badge_number or None)
+    return True
 
 def delete_atendimento(atendimento_id: int):
-    """Apaga um atendimento do banco de dados pelo seu ID."""
+    """Apaga um atendimento do banco de dados pelo seu ID.
+
+    Retorna True; se não for possível apagar, levanta DatabaseWriteError.
+    """
+    _run_write("apagar o atendimento",
+               lambda cursor: cursor.execute("DELETE FROM atendimentos_base WHERE id = ?", (atendimento_id,)))
+    # O "último atendimento" do badge pode ter mudado; apagar é raro, limpa tudo
+    invalidate_identity_cache()
+    return True
+
+def rename_lookup_value(coluna, nome_antigo, nome_novo):
+    """Renomeia um valor categórico (gestor, turno, setor, processo ou tipo_atendimento) em todo o histórico.
+
+    É um UPDATE de uma linha na tabela de dicionário. Se nome_novo já existir,
+    os atendimentos de nome_antigo passam para ele (os dois são mesclados).
+    Retorna False se nome_antigo não existir; levanta DatabaseWriteError se
+    não gravar.
+    """
+    if coluna not in migrations.LOOKUP_TABLES:
+        raise ValueError(f"Coluna sem dicionário: {coluna}")
+    tabela = migrations.LOOKUP_TABLES[coluna]
+
+    def write(cursor):
+        antigo = cursor.execute(f"SELECT id FROM {tabela} WHERE nome = ?", (nome_antigo,)).fetchone()
+        if antigo is None:
+            return False
+        novo = cursor.execute(f"SELECT id FROM {tabela} WHERE nome = ?", (nome_novo,)).fetchone()
+        if novo is None:
+            cursor.execute(f"UPDATE {tabela} SET nome = ? WHERE id = ?", (nome_novo, antigo[0]))
+            # O nome exportado mudou: marca os atendimentos como alterados (exportação incremental)
+            cursor.execute(f"UPDATE atendimentos_base SET {coluna}_id = {coluna}_id WHERE {coluna}_id = ?",
+                           (antigo[0],))
+        elif novo[0] != antigo[0]:
+            cursor.execute(f"UPDATE atendimentos_base SET {coluna}_id = ? WHERE {coluna}_id = ?", (novo[0], antigo[0]))
+            cursor.execute(f"DELETE FROM {tabela} WHERE id = ?", (antigo[0],))
+        return True
+
+    renamed = _run_write(f"renomear {coluna}", write)
+    invalidate_identity_cache()
+    return renamed
+
+# --- Layout da exportação CSV (calculado uma única vez) ---
+EXPORT_BATCH_SIZE = 2000
+
+# Compressão opcional dos arquivos exportados: nome -> extensão acrescentada ao arquivo.
+# zstd precisa do pacote zstandard (pip install zstandard), importado só quando usado
+EXPORT_COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_LEVELS = {"gzip": (1, 9), "zstd": (1, 19)}
+DEFAULT_COMPRESSION_LEVELS = {"gzip": 6, "zstd": 3}
+
+def compression_available(compression):
+    """Indica se a compressão pode ser usada (zstd depende do zstandard instalado)."""
+    if compression == "zstd":
+        return importlib.util.find_spec("zstandard") is not None
+    return compression is None or compression in EXPORT_COMPRESSIONS
+
+def _open_export_file(filepath, compression=None, level=None, bom=True):
+    """Abre o arquivo de exportação para escrever o CSV, passando pelo compressor se pedido.
+
+    As linhas são comprimidas à medida que são escritas; a versão sem
+    compressão nunca vai para o disco. bom=False omite o BOM do UTF-8 (partes
+    que serão juntadas depois de outra).
+    """
+    encoding = 'utf-8-sig' if bom else 'utf-8'
+    if compression is None:
+        return open(filepath, 'w', newline='', encoding=encoding)
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f"Compressão desconhecida: {compression}")
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.open(filepath, 'wt', compresslevel=level, newline='', encoding=encoding)
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("Compressão zstd requer o pacote zstandard (pip install zstandard).") from e
+    return zstandard.open(filepath, 'wt', cctx=zstandard.ZstdCompressor(level=level),
+                          newline='', encoding=encoding)
+
+_EXPORT_ATENDIMENTO_FIELDS = [
+    "id", "badge_number", "nome", "login", "gestor", "turno", "setor", "processo", "tenure",
+    "tipo_atendimento", "qp_sintoma", "qp_regiao",
+    "hqa", "tax", "pa_sistolica", "pa_diastolica", "fc", "sat",
+    "doencas_preexistentes", "alergias", "medicamentos_em_uso", "observacoes",
+    "data_atendimento", "hora_atendimento", "semana_iso"
+]
+
+def _one_hot_header(prefixo, valor):
+    return f"{prefixo}_{valor.replace(' ', '_').replace('/', '_')}"
+
+# Campos de Queixa Secundária (One-Hot)
+QS_SINTOMA_HEADERS = [_one_hot_header("qs_sintoma", s) for s in SINTOMAS]
+QS_REGIAO_HEADERS = [_one_hot_header("qs_regiao", r) for r in REGIOES]
+
+# (cabeçalho no CSV, coluna em condutas)
+_EXPORT_CONDUTA_FIELDS = [
+    ("conduta_id", "id"), ("hipotese_diagnostica", "hipotese_diagnostica"),
+    ("resumo_conduta", "resumo_conduta"), ("medicamento_administrado", "medicamento_administrado"),
+    ("posologia", "posologia"), ("horario_medicacao", "horario_medicacao"),
+    ("observacoes_conduta", "observacoes")
+]
+
+EXPORT_FIELDNAMES = (_EXPORT_ATENDIMENTO_FIELDS + QS_SINTOMA_HEADERS + QS_REGIAO_HEADERS
+                     + [header for header, _ in _EXPORT_CONDUTA_FIELDS])
+
+# Formato largo (uma linha por atendimento): as condutas viram grupos conduta_1_*, conduta_2_*, ...
+_WIDE_ATENDIMENTO_FIELDNAMES = _EXPORT_ATENDIMENTO_FIELDS + QS_SINTOMA_HEADERS + QS_REGIAO_HEADERS
+
+def wide_export_fieldnames(max_condutas):
+    """Cabeçalho do CSV largo com `max_condutas` grupos de colunas de conduta."""
+    return _WIDE_ATENDIMENTO_FIELDNAMES + [f"conduta_{n}_{col}" for n in range(1, max_condutas + 1)
+                                           for _, col in _EXPORT_CONDUTA_FIELDS]
+
+# Exportação incremental: colunas extras no fim de cada linha. operacao é 'U' (inserir ou
+# substituir as linhas do atendimento) ou 'D' (apagado; updated_at traz o horário da exclusão)
+EXPORT_CHANGE_FIELDS = ["operacao", "alteracao_seq", "created_at", "updated_at"]
+EXPORT_CHANGES_FIELDNAMES = EXPORT_FIELDNAMES + EXPORT_CHANGE_FIELDS
+# Nome da marca d'água usada quando a exportação incremental não informa outro
+DEFAULT_EXPORT_WATERMARK = "csv"
+
+# Colunas one-hot calculadas no SQL a partir das máscaras de bits (bit i = SINTOMAS[i] / REGIOES[i])
+_QS_ONE_HOT_SQL = ", ".join(
+    [f"(COALESCE(a.qs_sintomas_mask, 0) >> {i}) & 1" for i in range(len(SINTOMAS))]
+    + [f"(COALESCE(a.qs_regioes_mask, 0) >> {i}) & 1" for i in range(len(REGIOES))])
+
+_EXPORT_SELECT_SQL = (", ".join(f"a.{f}" for f in _EXPORT_ATENDIMENTO_FIELDS) + ", " + _QS_ONE_HOT_SQL + ", "
+                      + ", ".join(f"c.{col}" for _, col in _EXPORT_CONDUTA_FIELDS))
+
+def _export_filter(start_date=None, end_date=None, week_iso=None):
+    """Monta a cláusula WHERE (sobre o alias 'a') e os parâmetros do período exportado."""
+    if start_date and end_date:
+        return ("a.ts_atendimento BETWEEN ? AND ?",
+                [to_timestamp(f"{start_date} 00:00:00"), to_timestamp(f"{end_date} 23:59:59")])
+    if week_iso:
+        return "a.semana_iso = ?", [week_iso]
+    # Se nenhum filtro, exporta TUDO
+    return "1=1", []
+
+def count_export_atendimentos(start_date=None, end_date=None, week_iso=None):
+    """Conta quantos atendimentos entram na exportação do período (usa o índice de ts)."""
+    conn = _get_connection()
+    if conn is None: return 0
+    where, query_params = _export_filter(start_date, end_date, week_iso)
+    return conn.execute(f"SELECT COUNT(*) FROM atendimentos a WHERE {where}", query_params).fetchone()[0]
+
+def max_condutas_export(start_date=None, end_date=None, week_iso=None):
+    """Maior número de condutas de um atendimento do período (contadas pelo índice de condutas)."""
+    conn = _get_connection()
+    if conn is None: return 0
+    where, query_params = _export_filter(start_date, end_date, week_iso)
+    return conn.execute(f"""
+        SELECT COALESCE(MAX((SELECT COUNT(*) FROM condutas c WHERE c.atendimento_id = a.id)), 0)
+        FROM atendimentos_base a WHERE {where}
+    """, query_params).fetchone()[0]
+
+def export_to_csv(filepath, start_date=None, end_date=None, week_iso=None,
+                  progress_callback=None, cancel_event=None, wide=False,
+                  compression=None, compression_level=None, header=True):
+    """Exporta os dados de atendimentos e condutas para um arquivo CSV.
+
+    Uma linha por conduta (ou uma linha sem conduta), lidas de um único JOIN
+    ordenado e gravadas em lotes, sem carregar o período inteiro na memória.
+    Com wide=True, uma linha por atendimento: as linhas do mesmo JOIN são
+    agrupadas por id e as condutas viram os grupos de colunas conduta_N_*,
+    tantos quanto o máximo do período (ver wide_export_fieldnames).
+
+    compression ('gzip' ou 'zstd', ver EXPORT_COMPRESSIONS) comprime as
+    linhas enquanto são escritas, no nível compression_level (padrão em
+    DEFAULT_COMPRESSION_LEVELS). header=False omite o cabeçalho e o BOM
+    (partes da exportação paralela que vão depois da primeira).
+
+    progress_callback(exportados, total) é chamado a cada lote. Se
+    cancel_event (threading.Event) for sinalizado, a exportação para no
+    próximo lote e o arquivo parcial é removido.
+
+    Retorna o número de atendimentos exportados, ou None em caso de erro ou
+    cancelamento.
+    """
     conn = None
+    file_opened = completed = False
     try:
         conn = _get_connection()
-        if conn is None: return
+        if conn is None: return None
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM atendimentos WHERE id = ?", (atendimento_id,))
-        conn.commit()
+
+        where, query_params = _export_filter(start_date, end_date, week_iso)
+        expected = count_export_atendimentos(start_date, end_date, week_iso) if progress_callback else None
+        # Cada linha do SELECT já é a linha do CSV, na ordem de EXPORT_FIELDNAMES;
+        # sem conduta, o LEFT JOIN devolve NULLs e as colunas saem vazias
+        cursor.execute(f"""
+            SELECT {_EXPORT_SELECT_SQL}
+            FROM atendimentos a
+            LEFT JOIN condutas c ON c.atendimento_id = a.id
+            WHERE {where}
+            ORDER BY a.ts_atendimento, a.id, c.id
+        """, query_params)
+
+        # Depois do execute: o SELECT já abriu a transação de leitura da conexão, então a contagem
+        # vê o mesmo estado do banco e nenhum atendimento terá mais condutas que o cabeçalho
+        max_condutas = max_condutas_export(start_date, end_date, week_iso) if wide else None
+
+        with _open_export_file(filepath, compression, compression_level, bom=header) as csvfile:
+            file_opened = True
+            writer = csv.writer(csvfile)
+            if wide:
+                if header:
+                    writer.writerow(wide_export_fieldnames(max_condutas))
+                total = _write_wide_export_rows(writer, cursor, max_condutas, expected, progress_callback, cancel_event)
+            else:
+                if header:
+                    writer.writerow(EXPORT_FIELDNAMES)
+                total = _write_export_rows(writer, cursor, 0, expected, progress_callback, cancel_event)
+            if total is None:
+                return None
+        completed = True
+        return total
     except Exception as e:
-        print(f"Erro ao deletar atendimento: {e}")
-        if conn: conn.rollback()
+        print(f"Erro ao exportar CSV: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
     finally:
-        if conn:
-            conn.close()
+        if file_opened and not completed:
+            _remove_partial_file(filepath)
 
-def export_to_csv(filepath, start_date=None, end_date=None, week_iso=None):
-    """Exporta os dados de atendimentos e condutas para um arquivo CSV."""
-    conn = None
-    
-    # --- CORREÇÃO ERRO EXPORTAÇÃO: Garante que SINTOMAS e REGIOES estão disponíveis ---
-    # (Eles já estão importados no topo do arquivo)
-    # --- FIM CORREÇÃO ---
-    
+def _write_export_rows(writer, cursor, total, expected, progress_callback, cancel_event):
+    """Grava em lotes as linhas de um SELECT de exportação, agrupadas por atendimento (id na 1ª coluna).
+
+    Retorna o total de atendimentos (somado a `total`), ou None se cancel_event foi sinalizado.
+    """
+    last_id = None
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not batch:
+            return total
+        writer.writerows(batch)
+        # Linhas vêm agrupadas por atendimento: conta as trocas de id
+        for rec in batch:
+            if rec[0] != last_id:
+                last_id = rec[0]
+                total += 1
+        if progress_callback:
+            progress_callback(total, expected)
+
+def _write_wide_export_rows(writer, cursor, max_condutas, expected, progress_callback, cancel_event):
+    """Como _write_export_rows, mas junta as linhas de cada atendimento em uma só (formato largo).
+
+    As linhas de um atendimento são consecutivas (ORDER BY ..., a.id, c.id),
+    então basta acumular as condutas até o id mudar; um atendimento pode
+    começar em um lote e terminar no seguinte.
+    """
+    n_atendimento = len(_WIDE_ATENDIMENTO_FIELDNAMES)
+    vazio = [None] * (max_condutas * len(_EXPORT_CONDUTA_FIELDS))
+    total = 0
+    atual = None
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        linhas = []
+        for rec in batch:
+            if atual is None or rec[0] != atual[0]:
+                if atual is not None:
+                    linhas.append(atual + vazio[len(atual) - n_atendimento:])
+                atual = list(rec[:n_atendimento])
+                total += 1
+            if rec[n_atendimento] is not None:  # LEFT JOIN sem conduta: conduta_id NULL
+                atual.extend(rec[n_atendimento:])
+        if not batch and atual is not None:
+            linhas.append(atual + vazio[len(atual) - n_atendimento:])
+        writer.writerows(linhas)
+        if progress_callback and batch:
+            progress_callback(total, expected)
+        if not batch:
+            return total
+
+def get_export_watermark(nome=DEFAULT_EXPORT_WATERMARK):
+    """Marca d'água da exportação incremental `nome`: (alteracao_seq, exportado_em), ou None se nunca exportou."""
+    try:
+        return _get_connection().execute(
+            "SELECT alteracao_seq, exportado_em FROM marcas_exportacao WHERE nome = ?", (nome,)).fetchone()
+    except Exception as e:
+        print(f"Erro em get_export_watermark: {e}")
+        return None
+
+def reset_export_watermark(nome=DEFAULT_EXPORT_WATERMARK):
+    """Esquece a marca d'água: a próxima exportação incremental `nome` volta a ser completa."""
+    _run_write("apagar a marca da exportação",
+               lambda cursor: cursor.execute("DELETE FROM marcas_exportacao WHERE nome = ?", (nome,)))
+
+def export_changes_to_csv(filepath, nome=DEFAULT_EXPORT_WATERMARK, progress_callback=None, cancel_event=None,
+                          compression=None, compression_level=None):
+    """Exporta só os atendimentos inseridos, alterados ou apagados desde a última exportação `nome`.
+
+    As linhas têm o layout de export_to_csv mais EXPORT_CHANGE_FIELDS. Para
+    cada atendimento com operacao 'U', o destino substitui todas as linhas
+    daquele id pelas do arquivo (uma por conduta); 'D' traz só o id e indica
+    que o atendimento foi apagado. A primeira exportação de uma marca é
+    completa (inclui os atendimentos anteriores ao controle de alterações).
+
+    A marca d'água é a alteracao_seq (ver migração 12), lida antes das
+    consultas: o que for gravado durante a exportação fica para a próxima.
+    Ela só avança depois que o arquivo foi escrito por inteiro. compression e
+    compression_level funcionam como em export_to_csv.
+
+    Retorna o número de atendimentos exportados (alterados + apagados), ou
+    None em caso de erro ou cancelamento.
+    """
+    file_opened = completed = False
     try:
         conn = _get_connection()
-        if conn is None: return
-        conn.row_factory = sqlite3.Row # Facilita acesso por nome de coluna
-        cursor = conn.cursor()
+        if conn is None: return None
+        watermark = get_export_watermark(nome)
+        desde = watermark[0] if watermark else None
+        ate = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+        if desde is None:
+            # Primeira exportação: tudo, inclusive as linhas sem alteracao_seq
+            where, apagados_where, query_params = ("(a.alteracao_seq IS NULL OR a.alteracao_seq <= ?)",
+                                                   "p.alteracao_seq <= ?", [ate])
+            order = "a.id, c.id"
+        else:
+            where, apagados_where, query_params = ("a.alteracao_seq > ? AND a.alteracao_seq <= ?",
+                                                   "p.alteracao_seq > ? AND p.alteracao_seq <= ?", [desde, ate])
+            order = "a.alteracao_seq, c.id"
+        expected = None
+        if progress_callback:
+            expected = (conn.execute(f"SELECT COUNT(*) FROM atendimentos_base a WHERE {where}", query_params).fetchone()[0]
+                        + conn.execute(f"SELECT COUNT(*) FROM atendimentos_apagados p WHERE {apagados_where}",
+                                       query_params).fetchone()[0])
 
-        query_params = []
-        query_str = "SELECT * FROM atendimentos WHERE 1=1"
+        with _open_export_file(filepath, compression, compression_level) as csvfile:
+            file_opened = True
+            writer = csv.writer(csvfile)
+            writer.writerow(EXPORT_CHANGES_FIELDNAMES)
+            cursor = conn.execute(f"""
+                SELECT {_EXPORT_SELECT_SQL}, 'U', a.alteracao_seq, a.created_at, a.updated_at
+                FROM atendimentos a
+                LEFT JOIN condutas c ON c.atendimento_id = a.id
+                WHERE {where}
+                ORDER BY {order}
+            """, query_params)
+            total = _write_export_rows(writer, cursor, 0, expected, progress_callback, cancel_event)
+            if total is None:
+                return None
+            vazias = ", ".join(["NULL"] * (len(EXPORT_FIELDNAMES) - 1))
+            cursor = conn.execute(f"""
+                SELECT p.id, {vazias}, 'D', p.alteracao_seq, NULL, p.deleted_at
+                FROM atendimentos_apagados p
+                WHERE {apagados_where}
+                ORDER BY p.alteracao_seq
+            """, query_params)
+            total = _write_export_rows(writer, cursor, total, expected, progress_callback, cancel_event)
+            if total is None:
+                return None
 
-        if start_date and end_date:
-            query_str += " AND data_atendimento BETWEEN ? AND ?"
-            query_params.extend([start_date, end_date])
-        elif week_iso:
-            query_str += " AND semana_iso = ?"
-            query_params.append(week_iso)
-        # Se nenhum filtro, exporta TUDO (removido filtro de "Dia atual"
-        # else: # Dia atual
-        #     query_str += " AND data_atendimento = ?"
-        #     query_params.append(datetime.now().strftime("%Y-%m-%d"))
+        _run_write("gravar a marca da exportação", lambda cursor: cursor.execute("""
+            INSERT INTO marcas_exportacao (nome, alteracao_seq, exportado_em)
+            VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%S', 'now'))
+            ON CONFLICT (nome) DO UPDATE SET alteracao_seq = excluded.alteracao_seq,
+                                             exportado_em = excluded.exportado_em
+        """, (nome, ate)))
+        completed = True
+        return total
+    except Exception as e:
+        print(f"Erro ao exportar alterações em CSV: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        if file_opened and not completed:
+            _remove_partial_file(filepath)
 
-        cursor.execute(query_str, query_params)
-        atendimentos = cursor.fetchall() # Lista de sqlite3.Row (dicts)
-
-        fieldnames_atendimento = [
-            "id", "badge_number", "nome", "login", "gestor", "turno", "setor", "processo", "tenure",
-            "tipo_atendimento", "qp_sintoma", "qp_regiao",
-            "hqa", "tax", "pa_sistolica", "pa_diastolica", "fc", "sat",
-            "doencas_preexistentes", "alergias", "medicamentos_em_uso", "observacoes",
-            "data_atendimento", "hora_atendimento", "semana_iso"
-        ]
-        
-        # Campos de Queixa Secundária (One-Hot)
-        # Remove "Absorvente" e "Trabalho em altura" da exportação One-Hot? Não, deixa
-        qs_sintoma_headers = [f"qs_sintoma_{s.replace(' ', '_').replace('/', '_')}" for s in SINTOMAS]
-        qs_regiao_headers = [f"qs_regiao_{r.replace(' ', '_').replace('/', '_')}" for r in REGIOES]
-        
-        fieldnames_conduta = [
-            "conduta_id", "hipotese_diagnostica",
-            "resumo_conduta", "medicamento_administrado",
-            "posologia", "horario_medicacao", "observacoes_conduta"
-        ]
-        
-        # Junta todos os cabeçalhos
-        fieldnames = fieldnames_atendimento + qs_sintoma_headers + qs_regiao_headers + fieldnames_conduta
-
-        with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-            writer.writeheader()
-
-            for atendimento_row in atendimentos:
-                atendimento_dict = dict(atendimento_row)
-                atendimento_id = atendimento_dict.get("id")
-
-                # --- Processa One-Hot para Queixas Secundárias ---
-                try:
-                    qs_sintomas_list = json.loads(atendimento_dict.get('qs_sintomas', '[]'))
-                except: qs_sintomas_list = []
-                try:
-                    qs_regioes_list = json.loads(atendimento_dict.get('qs_regioes', '[]'))
-                except: qs_regioes_list = []
-
-                for s in SINTOMAS:
-                    col_name = f"qs_sintoma_{s.replace(' ', '_').replace('/', '_')}"
-                    atendimento_dict[col_name] = 1 if s in qs_sintomas_list else 0
-                for r in REGIOES:
-                    col_name = f"qs_regiao_{r.replace(' ', '_').replace('/', '_')}"
-                    atendimento_dict[col_name] = 1 if r in qs_regioes_list else 0
-                # --- Fim One-Hot ---
-
-                # Busca condutas para este atendimento
-                cursor.execute("SELECT * FROM condutas WHERE atendimento_id = ?", (atendimento_id,))
-                condutas = cursor.fetchall()
-                
-                if not condutas:
-                    # Escreve o atendimento principal mesmo sem conduta
-                    writer.writerow(atendimento_dict)
-                else:
-                    # Escreve uma linha para CADA conduta
-                    for conduta_row in condutas:
-                        conduta_dict = dict(conduta_row)
-                        # Renomeia chaves de conduta para evitar conflitos
-                        conduta_renamed = {
-                            "conduta_id": conduta_dict.get("id"),
-                            "hipotese_diagnostica": conduta_dict.get("hipotese_diagnostica"),
-                            "resumo_conduta": conduta_dict.get("resumo_conduta"),
-                            "medicamento_administrado": conduta_dict.get("medicamento_administrado"),
-                            "posologia": conduta_dict.get("posologia"),
-                            "horario_medicacao": conduta_dict.get("horario_medicacao"),
-                            "observacoes_conduta": conduta_dict.get("observacoes")
-                        }
-                        # Combina dict do atendimento com o da conduta e escreve
-                        combined_row = {**atendimento_dict, **conduta_renamed}
-                        writer.writerow(combined_row)
+# --- Exportação paralela por partes (semanas ISO ou meses) ---
+EXPORT_SHARD_UNITS = ("semana", "mes")
+# Intervalo com que a exportação paralela confere o cancelamento enquanto espera as partes
+EXPORT_SHARD_POLL_S = 0.2
+
+def export_shards(start_date, end_date, por="semana"):
+    """Divide o período em partes de uma semana ISO (segunda a domingo) ou um mês: [(rótulo, início, fim)].
+
+    A primeira e a última parte são cortadas nos limites do período; as datas
+    são 'YYYY-MM-DD' e os rótulos '2024-W01' ou '2024-01'.
+    """
+    if por not in EXPORT_SHARD_UNITS:
+        raise ValueError(f"Divisão desconhecida: {por}")
+    atual = datetime.strptime(start_date, "%Y-%m-%d").date()
+    fim = datetime.strptime(end_date, "%Y-%m-%d").date()
+    partes = []
+    while atual <= fim:
+        if por == "semana":
+            ano, semana, _ = atual.isocalendar()
+            rotulo = f"{ano}-W{semana:02d}"
+            proximo = atual + timedelta(days=7 - atual.weekday())
+        else:
+            rotulo = atual.strftime("%Y-%m")
+            proximo = (atual.replace(day=28) + timedelta(days=4)).replace(day=1)
+        partes.append((rotulo, atual.isoformat(), min(proximo - timedelta(days=1), fim).isoformat()))
+        atual = proximo
+    return partes
+
+def _export_shard_worker(db_path, filepath, start_date, end_date, compression, compression_level, header):
+    """Executada em um processo da exportação paralela: exporta uma parte com conexão somente leitura."""
+    set_db_path(db_path, read_only=True)
+    try:
+        return export_to_csv(filepath, start_date, end_date, compression=compression,
+                             compression_level=compression_level, header=header)
+    finally:
+        close_connections()
+
+def _concatenate_files(partes, filepath):
+    """Junta os arquivos das partes, em ordem, byte a byte (só a primeira tem cabeçalho)."""
+    with open(filepath, "wb") as destino:
+        for parte in partes:
+            with open(parte, "rb") as origem:
+                shutil.copyfileobj(origem, destino, 1024 * 1024)
+
+def export_to_csv_parallel(filepath, start_date, end_date, por="semana", workers=None, concatenate=True,
+                           progress_callback=None, cancel_event=None, compression=None, compression_level=None):
+    """Exporta um período longo (ex.: um ano) dividido em partes, cada uma em um processo separado.
+
+    Cada parte (export_shards) é exportada por export_to_csv em um processo
+    com sua própria conexão somente leitura, em até `workers` processos
+    (padrão: número de núcleos). Com concatenate=True as partes são juntadas
+    em ordem em `filepath` (o resultado é igual ao de export_to_csv no mesmo
+    período) e apagadas; com False ficam na pasta '<filepath sem extensão>_partes',
+    uma por semana/mês. Cada parte é lida de um estado consistente do banco,
+    mas partes diferentes podem ser lidas em momentos diferentes: atendimentos
+    gravados durante a exportação podem entrar ou não.
+
+    Com compression, cada processo comprime a sua parte e as partes
+    comprimidas são juntadas como estão: gzip e zstd aceitam vários blocos
+    (members/frames) seguidos em um arquivo (no zstandard do Python, open()
+    lê todos; um stream_reader precisa de read_across_frames=True).
+
+    progress_callback(exportados, total) é chamado a cada parte concluída; o
+    cancelamento (cancel_event) descarta as partes que ainda não começaram e
+    espera as que estão em andamento.
+
+    Retorna o número de atendimentos exportados, ou None em caso de erro ou
+    cancelamento (os arquivos parciais são removidos).
+    """
+    partes = export_shards(start_date, end_date, por)
+    db_path = get_db_path()
+    if concatenate:
+        pasta = tempfile.mkdtemp(prefix=".export_partes_", dir=os.path.dirname(os.path.abspath(filepath)))
+    else:
+        pasta = os.path.splitext(filepath)[0] + "_partes"
+        os.makedirs(pasta, exist_ok=True)
+    extensao = ".csv" + EXPORT_COMPRESSIONS.get(compression, "")
+    arquivos = [os.path.join(pasta, f"atendimentos_{rotulo}{extensao}") for rotulo, _, _ in partes]
+    file_opened = completed = False
+    try:
+        expected = count_export_atendimentos(start_date, end_date) if progress_callback else None
+        total = 0
+        # spawn (e não fork) em todas as plataformas: o processo pai tem threads e o Tk
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, min(workers or os.cpu_count() or 1, len(partes))),
+                                 mp_context=contexto) as executor:
+            # Juntadas, só a primeira parte leva cabeçalho; separadas, todas levam
+            pendentes = {executor.submit(_export_shard_worker, db_path, arquivo, inicio, fim,
+                                         compression, compression_level, i == 0 or not concatenate)
+                         for i, (arquivo, (_, inicio, fim)) in enumerate(zip(arquivos, partes))}
+            while pendentes:
+                if cancel_event is not None and cancel_event.is_set():
+                    for futuro in pendentes:
+                        futuro.cancel()
+                    return None
+                prontos, pendentes = wait(pendentes, timeout=EXPORT_SHARD_POLL_S, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    exportados = futuro.result()
+                    if exportados is None:
+                        raise RuntimeError("falha ao exportar uma das partes (veja o log do processo)")
+                    total += exportados
+                if prontos and progress_callback:
+                    progress_callback(total, expected)
+        if concatenate:
+            file_opened = True
+            _concatenate_files(arquivos, filepath)
+        completed = True
+        return total
     except Exception as e:
-        print(f"Erro ao exportar CSV: {e}")
+        print(f"Erro na exportação paralela: {e}")
         import traceback
         traceback.print_exc()
+        return None
     finally:
-        if conn:
-            conn.close()
+        if concatenate or not completed:
+            for arquivo in arquivos:
+                _remove_partial_file(arquivo)
+            try:
+                os.rmdir(pasta)
+            except OSError:
+                pass  # pasta já existia com outros arquivos
+        if file_opened and not completed:
+            _remove_partial_file(filepath)
+
+# --- Exportação colunar (Parquet) ---
+# Opcional: precisa do pyarrow (pip install pyarrow), importado só quando usado
+PARQUET_ROW_GROUP_SIZE = 50000
+PARQUET_COMPRESSION = "zstd"
+
+# (coluna no arquivo, tipo, expressão no SELECT). "categoria" vira dictionary<int32, string>;
+# os sinais vitais saem das colunas numéricas <vital>_valor (NULL quando não numéricos)
+_PARQUET_ATENDIMENTO_COLUMNS = [
+    ("id", "int64", "a.id"), ("badge_number", "string", "a.badge_number"),
+    ("nome", "string", "a.nome"), ("login", "string", "a.login"),
+    ("gestor", "categoria", "a.gestor"), ("turno", "categoria", "a.turno"),
+    ("setor", "categoria", "a.setor"), ("processo", "categoria", "a.processo"),
+    ("tenure", "categoria", "a.tenure"), ("tipo_atendimento", "categoria", "a.tipo_atendimento"),
+    ("qp_sintoma", "categoria", "a.qp_sintoma"), ("qp_regiao", "categoria", "a.qp_regiao"),
+    ("hqa", "string", "a.hqa"),
+    ("tax", "float64", "a.tax_valor"), ("pa_sistolica", "int32", "a.pa_sistolica_valor"),
+    ("pa_diastolica", "int32", "a.pa_diastolica_valor"), ("fc", "int32", "a.fc_valor"),
+    ("sat", "int32", "a.sat_valor"),
+    ("doencas_preexistentes", "string", "a.doencas_preexistentes"), ("alergias", "string", "a.alergias"),
+    ("medicamentos_em_uso", "string", "a.medicamentos_em_uso"), ("observacoes", "string", "a.observacoes"),
+    ("data_atendimento", "date32", "a.data_atendimento"), ("hora_atendimento", "string", "a.hora_atendimento"),
+    ("semana_iso", "int16", "a.semana_iso"),
+]
+_PARQUET_CONDUTA_COLUMNS = [
+    ("conduta_id", "int64", "c.id"), ("hipotese_diagnostica", "string", "c.hipotese_diagnostica"),
+    ("resumo_conduta", "string", "c.resumo_conduta"),
+    ("medicamento_administrado", "categoria", "c.medicamento_administrado"),
+    ("posologia", "string", "c.posologia"), ("horario_medicacao", "string", "c.horario_medicacao"),
+    ("observacoes_conduta", "string", "c.observacoes"),
+]
+# As queixas secundárias saem como colunas booleanas (mesmos nomes do CSV), calculadas das máscaras
+PARQUET_COLUMNS = ([nome for nome, _, _ in _PARQUET_ATENDIMENTO_COLUMNS] + QS_SINTOMA_HEADERS + QS_REGIAO_HEADERS
+                   + [nome for nome, _, _ in _PARQUET_CONDUTA_COLUMNS])
+
+def parquet_available():
+    """Indica se o pyarrow está instalado (necessário para export_to_parquet), sem importá-lo."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+def _parquet_schema(pa):
+    tipos = {"int64": pa.int64(), "int32": pa.int32(), "int16": pa.int16(), "float64": pa.float64(),
+             "string": pa.string(), "date32": pa.date32(), "categoria": pa.dictionary(pa.int32(), pa.string())}
+    return pa.schema(
+        [pa.field(nome, tipos[tipo]) for nome, tipo, _ in _PARQUET_ATENDIMENTO_COLUMNS]
+        + [pa.field(nome, pa.bool_()) for nome in QS_SINTOMA_HEADERS + QS_REGIAO_HEADERS]
+        + [pa.field(nome, tipos[tipo]) for nome, tipo, _ in _PARQUET_CONDUTA_COLUMNS])
+
+def _parquet_batch(pa, pc, schema, batch):
+    """Converte um lote de linhas do SELECT em uma tabela Arrow com o esquema do arquivo."""
+    colunas = list(zip(*batch))
+    n_atendimento = len(_PARQUET_ATENDIMENTO_COLUMNS)
+    arrays = []
+    for (nome, tipo, _), valores in zip(_PARQUET_ATENDIMENTO_COLUMNS, colunas):
+        arrays.append(_parquet_array(pa, pc, tipo, valores, schema.field(nome).type))
+    for mascaras, opcoes in ((colunas[n_atendimento], SINTOMAS), (colunas[n_atendimento + 1], REGIOES)):
+        mascaras = pa.array(mascaras, pa.int64())
+        arrays.extend(pc.not_equal(pc.bit_wise_and(mascaras, pa.scalar(1 << i, pa.int64())), 0)
+                      for i in range(len(opcoes)))
+    for (nome, tipo, _), valores in zip(_PARQUET_CONDUTA_COLUMNS, colunas[n_atendimento + 2:]):
+        arrays.append(_parquet_array(pa, pc, tipo, valores, schema.field(nome).type))
+    return pa.Table.from_arrays(arrays, schema=schema)
 
+def _parquet_array(pa, pc, tipo, valores, tipo_arrow):
+    if tipo == "categoria":
+        return pa.array(valores, pa.string()).dictionary_encode()
+    if tipo == "date32":
+        # Datas fora do formato YYYY-MM-DD ficam nulas em vez de interromper a exportação
+        texto = pa.array(valores, pa.string())
+        return pc.strptime(texto, format="%Y-%m-%d", unit="s", error_is_null=True).cast(pa.date32())
+    if tipo == "string":
+        return pa.array(valores, pa.string())
+    # Colunas numéricas do SQLite podem trazer texto antigo; o que não converter fica nulo
+    try:
+        return pa.array(valores, tipo_arrow)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([v if isinstance(v, (int, float)) else None for v in valores], tipo_arrow)
+
+def export_to_parquet(filepath, start_date=None, end_date=None, week_iso=None,
+                      progress_callback=None, cancel_event=None,
+                      compression=PARQUET_COMPRESSION, compression_level=None):
+    """Exporta atendimentos e condutas do período para um arquivo Parquet (colunar, tipado e comprimido).
+
+    Mesmas linhas e filtros de export_to_csv (uma linha por conduta), com
+    tipos: categorias em dicionário, queixas secundárias booleanas, sinais
+    vitais numéricos e data_atendimento como data. Cada lote de
+    PARQUET_ROW_GROUP_SIZE linhas lido do cursor vira um row group, então a
+    memória não cresce com o período. compression é o codec interno do
+    Parquet ('zstd', 'gzip', 'snappy' ou None) e compression_level o seu
+    nível. Precisa do pyarrow; sem ele, levanta RuntimeError (ver
+    parquet_available()).
+
+    Retorna o número de atendimentos exportados, ou None em caso de erro ou
+    cancelamento (o arquivo parcial é removido).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Exportação em Parquet requer o pacote pyarrow (pip install pyarrow).") from e
+
+    file_opened = completed = False
+    writer = None
+    try:
+        conn = _get_connection()
+        if conn is None: return None
+        where, query_params = _export_filter(start_date, end_date, week_iso)
+        expected = count_export_atendimentos(start_date, end_date, week_iso) if progress_callback else None
+        colunas_sql = ", ".join(
+            [sql for _, _, sql in _PARQUET_ATENDIMENTO_COLUMNS]
+            + ["COALESCE(a.qs_sintomas_mask, 0)", "COALESCE(a.qs_regioes_mask, 0)"]
+            + [sql for _, _, sql in _PARQUET_CONDUTA_COLUMNS])
+        cursor = conn.execute(f"""
+            SELECT {colunas_sql}
+            FROM atendimentos a
+            LEFT JOIN condutas c ON c.atendimento_id = a.id
+            WHERE {where}
+            ORDER BY a.ts_atendimento, a.id, c.id
+        """, query_params)
+
+        schema = _parquet_schema(pa)
+        file_opened = True
+        writer = pq.ParquetWriter(filepath, schema, compression=compression or "none",
+                                  compression_level=compression_level)
+        last_id = None
+        total = 0
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            batch = cursor.fetchmany(PARQUET_ROW_GROUP_SIZE)
+            if not batch:
+                break
+            writer.write_table(_parquet_batch(pa, pc, schema, batch))
+            for rec in batch:
+                if rec[0] != last_id:
+                    last_id = rec[0]
+                    total += 1
+            if progress_callback:
+                progress_callback(total, expected)
+        writer.close()
+        writer = None
+        completed = True
+        return total
+    except Exception as e:
+        print(f"Erro ao exportar Parquet: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+    finally:
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception:
+                pass
+        if file_opened and not completed:
+            _remove_partial_file(filepath)
+
+def _remove_partial_file(filepath):
+    """Apaga o arquivo de uma exportação que não terminou."""
+    try:
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
+    except OSError as e:
+        print(f"Não foi possível remover o arquivo parcial {filepath}: {e}")
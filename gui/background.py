@@ -0,0 +1,149 @@
+"""
+gui/background.py
+-----------------
+Execução de tarefas demoradas fora da thread do Tk.
+
+O Tkinter não pode ser chamado de outras threads. As tarefas publicam
+mensagens em uma queue.Queue, que é lida na thread do Tk com after().
+"""
+import queue
+import threading
+import tkinter as tk
+
+
+class BackgroundTask:
+    """Roda uma função em uma thread de trabalho e entrega o resultado na thread do Tk.
+
+    A função recebe a própria tarefa como primeiro argumento, para publicar
+    progresso com post() e consultar cancel_event. Os callbacks on_message,
+    on_done e on_error são sempre chamados na thread do Tk.
+    """
+
+    def __init__(self, widget, target, *args, on_message=None, on_done=None, on_error=None, poll_ms=50):
+        self.widget = widget
+        self.target = target
+        self.args = args
+        self.on_message = on_message
+        self.on_done = on_done
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+        self.cancel_event = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._finished = False
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._finished
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.widget.after(self.poll_ms, self._poll)
+        return self
+
+    def cancel(self):
+        """Pede o cancelamento; a função deve verificar cancel_event e retornar."""
+        self.cancel_event.set()
+
+    def post(self, message):
+        """Publica uma mensagem (ex.: progresso) para on_message. Chamado na thread de trabalho."""
+        self._queue.put(("message", message))
+
+    def _run(self):
+        try:
+            result = self.target(self, *self.args)
+            self._queue.put(("done", result))
+        except Exception as e:
+            self._queue.put(("error", e))
+
+    def _poll(self):
+        try:
+            if not self.widget.winfo_exists():
+                # A janela foi fechada: não há mais para quem entregar o resultado
+                self.cancel()
+                return
+        except tk.TclError:
+            self.cancel()
+            return
+
+        try:
+            while True:
+                kind, payload = self._queue.get_nowait()
+                if kind == "message":
+                    if self.on_message: self.on_message(payload)
+                else:
+                    self._finished = True
+                    callback = self.on_done if kind == "done" else self.on_error
+                    if callback: callback(payload)
+                    return
+        except queue.Empty:
+            pass
+        self.widget.after(self.poll_ms, self._poll)
+
+
+class SerialWorker:
+    """Thread de trabalho única que executa funções em ordem, fora da thread do Tk.
+
+    Por ser sempre a mesma thread, reaproveita a conexão SQLite dela em vez de
+    abrir uma nova a cada consulta. on_done/on_error são chamados na thread do Tk.
+    """
+
+    def __init__(self, widget, poll_ms=30):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._pending = 0
+        self._polling = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, on_done=None, on_error=None):
+        """Enfileira fn(*args); o resultado vai para on_done (ou a exceção para on_error)."""
+        self._pending += 1
+        self._jobs.put((fn, args, on_done, on_error))
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+
+    def stop(self):
+        self._jobs.put(None)
+
+    def _loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            fn, args, on_done, on_error = job
+            try:
+                self._results.put((on_done, fn(*args)))
+            except Exception as e:
+                if on_error is None:
+                    print(f"Erro em tarefa de segundo plano {getattr(fn, '__name__', fn)}: {e}")
+                self._results.put((on_error, e))
+
+    def _poll(self):
+        try:
+            while True:
+                callback, payload = self._results.get_nowait()
+                self._pending -= 1
+                if callback:
+                    try:
+                        callback(payload)
+                    except Exception as e:
+                        # Um callback com erro não pode interromper a entrega dos próximos
+                        print(f"Erro ao aplicar resultado de tarefa de segundo plano: {e}")
+        except queue.Empty:
+            pass
+        try:
+            if self._pending > 0 and self.widget.winfo_exists():
+                self.widget.after(self.poll_ms, self._poll)
+                return
+        except tk.TclError:
+            pass
+        self._polling = False
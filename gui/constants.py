@@ -93,6 +93,9 @@ def save_options(options_dict):
 OPTIONS = load_options()
 
 # --- Listas de Sintomas e Regiões (mantidas) ---
+# A posição de cada item é o bit dele em qs_sintomas_mask / qs_regioes_mask
+# (migrations.py). Itens novos só podem entrar no FINAL da lista, junto com
+# uma migração que recrie os triggers das máscaras; nunca reordene ou remova.
 SINTOMAS = [
     "Dor", "Ardência/Queimação", "Coçeira/Irritaçao", "Corte",
     "Torção/Distensão", "Vertigem", "Vômito", "Náuseas", "Fraqueza",
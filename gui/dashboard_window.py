@@ -0,0 +1,159 @@
+"""
+gui/dashboard_window.py
+-----------------------
+Painel com os números da escala atual, da semana e do mês: atendimentos por
+turno, queixas principais, ocupacional x não ocupacional e medicamentos
+administrados.
+
+Semana e mês vêm das tabelas de resumo (db.get_summary_totals) e a escala
+de uma contagem pelo índice de data+hora (db.get_period_totals), então o
+painel não depende do tamanho do histórico. As consultas rodam em uma
+thread de trabalho; o formulário de registro nunca espera pelo painel.
+
+Com o ChangeWatcher da janela principal, o painel só recarrega quando o
+banco muda (nesta ou em outra estação) ou quando começa outra escala.
+"""
+import time
+import tkinter as tk
+from tkinter import ttk
+from datetime import datetime, timedelta
+import db
+import utils
+from gui.background import SerialWorker
+
+# Intervalo entre atualizações automáticas do painel quando não há ChangeWatcher
+DASHBOARD_REFRESH_MS = 10000
+# Frequência com que o painel confere o ChangeWatcher (sem acessar disco)
+DASHBOARD_POLL_MS = 1000
+TOP_QUEIXAS = 10
+
+# (dimensão do resumo, título do quadro, cabeçalho da coluna de valores, limite de linhas)
+PAINEIS = [
+    ("turno", "Atendimentos por turno", "Turno", None),
+    ("qp_sintoma", "Queixas principais", "Queixa", TOP_QUEIXAS),
+    ("tipo_atendimento", "Ocupacional x Não ocupacional", "Tipo", None),
+    ("medicamento", "Medicamentos administrados", "Medicamento", None),
+]
+PERIODOS = ("escala", "semana", "mes")
+
+
+def _load_dashboard(now):
+    """Executada na thread de trabalho: {dimensão: [(valor, escala, semana, mês), ...]} e o tempo gasto."""
+    t0 = time.perf_counter()
+    escala_inicio, escala_fim = utils.escala_atual(now)
+    escala = (escala_inicio.strftime("%Y-%m-%d %H:%M:%S"), escala_fim.strftime("%Y-%m-%d %H:%M:%S"))
+    hoje = now.strftime("%Y-%m-%d")
+    semana_inicio = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+    mes_inicio = now.replace(day=1).strftime("%Y-%m-%d")
+
+    def totais(dimensao):
+        por_periodo = {
+            "escala": dict(db.get_period_totals(dimensao, *escala)),
+            "semana": dict(db.get_summary_totals(dimensao, semana_inicio, hoje)),
+            "mes": dict(db.get_summary_totals(dimensao, mes_inicio, hoje)),
+        }
+        valores = set().union(*por_periodo.values())
+        linhas = [(valor if valor is not None else "(vazio)",) + tuple(por_periodo[p].get(valor, 0) for p in PERIODOS)
+                  for valor in valores]
+        # Do mais frequente no mês para o menos frequente
+        linhas.sort(key=lambda linha: (-linha[3], -linha[2], -linha[1], str(linha[0])))
+        return linhas
+
+    dados = {"total": totais("total")}
+    for dimensao, _, _, limite in PAINEIS:
+        dados[dimensao] = totais(dimensao)[:limite]
+    return dados, (time.perf_counter() - t0) * 1000
+
+
+class DashboardWindow(tk.Toplevel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Painel de Atendimentos")
+        self.geometry("900x620")
+        self.parent = parent
+
+        self.worker = SerialWorker(self)
+        self._loading = False
+        self._after_id = None
+        self.change_watcher = getattr(parent, "change_watcher", None)
+        self._watched_version = None
+        self._escala_inicio = None
+
+        main_frame = ttk.Frame(self, padding="10")
+        main_frame.pack(fill="both", expand=True)
+        main_frame.columnconfigure((0, 1), weight=1)
+        main_frame.rowconfigure((1, 2), weight=1)
+
+        header = ttk.Frame(main_frame)
+        header.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 10))
+        self.total_label = ttk.Label(header, text="Carregando...", font=("Arial", 12, "bold"))
+        self.total_label.pack(side="left")
+        ttk.Button(header, text="Atualizar", command=self.refresh).pack(side="right")
+        self.status_label = ttk.Label(header, text="")
+        self.status_label.pack(side="right", padx=10)
+
+        self.trees = {}
+        for i, (dimensao, titulo, cabecalho, _) in enumerate(PAINEIS):
+            frame = ttk.LabelFrame(main_frame, text=titulo, padding="5")
+            frame.grid(row=1 + i // 2, column=i % 2, sticky="nsew", padx=5, pady=5)
+            tree = ttk.Treeview(frame, columns=("valor",) + PERIODOS, show="headings", height=8)
+            tree.heading("valor", text=cabecalho); tree.column("valor", width=200)
+            for periodo, texto in zip(PERIODOS, ("Escala", "Semana", "Mês")):
+                tree.heading(periodo, text=texto); tree.column(periodo, width=60, anchor="center", stretch=False)
+            tree.pack(fill="both", expand=True)
+            self.trees[dimensao] = tree
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.refresh()
+
+    def refresh(self):
+        """Recarrega o painel em segundo plano e agenda a próxima verificação."""
+        self._schedule()
+        if self._loading:
+            return
+        self._loading = True
+        now = datetime.now()
+        if self.change_watcher is not None:
+            self._watched_version = self.change_watcher.version
+        self._escala_inicio = utils.escala_atual(now)[0]
+        self.worker.submit(_load_dashboard, now, on_done=self._apply, on_error=self._on_error)
+
+    def _schedule(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        if self.change_watcher is None:
+            self._after_id = self.after(DASHBOARD_REFRESH_MS, self.refresh)
+        else:
+            self._after_id = self.after(DASHBOARD_POLL_MS, self._poll_changes)
+
+    def _poll_changes(self):
+        if (self.change_watcher.version != self._watched_version
+                or utils.escala_atual()[0] != self._escala_inicio):
+            self.refresh()
+        else:
+            self._schedule()
+
+    def _apply(self, result):
+        self._loading = False
+        dados, elapsed_ms = result
+        try:
+            _, escala, semana, mes = dados["total"][0] if dados["total"] else (None, 0, 0, 0)
+            self.total_label.config(text=f"Atendimentos — escala: {escala}   semana: {semana}   mês: {mes}")
+            for dimensao, tree in self.trees.items():
+                tree.delete(*tree.get_children())
+                for linha in dados[dimensao]:
+                    tree.insert("", "end", values=linha)
+            self.status_label.config(text=f"Atualizado às {datetime.now():%H:%M:%S} ({elapsed_ms:.0f} ms)")
+        except tk.TclError as e:
+            print(f"Erro ao preencher o painel: {e}")
+
+    def _on_error(self, e):
+        self._loading = False
+        self.status_label.config(text=f"Erro ao atualizar: {e}")
+
+    def on_close(self):
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+        self.worker.submit(db.release_thread_connection)
+        self.worker.stop()
+        self.destroy()
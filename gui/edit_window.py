@@ -667,6 +667,8 @@ class EditWindow(tk.Toplevel):
             self.callback()
             self.changed = False
             self.destroy()
+        except db.DatabaseWriteError as e:
+            messagebox.showerror("Alterações NÃO salvas", f"{e}\n\nAs alterações continuam na janela.", parent=self)
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao salvar: {e}", parent=self)
             print(f"Erro detalhado ao salvar (edit): {e}")
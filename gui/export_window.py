@@ -1,19 +1,24 @@
 """
 gui/export_window.py
 --------------------
-Janela modal para exportação de dados para CSV.
+Janela modal para exportação de dados para CSV ou Parquet.
 """
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime, timedelta
 import db
 import utils
+from gui.background import BackgroundTask
+
+# formato -> (extensão, descrição no diálogo de salvar)
+EXPORT_FORMATS = {"csv": (".csv", "Arquivos CSV"), "parquet": (".parquet", "Arquivos Parquet")}
+SEM_COMPRESSAO = "Nenhuma"
 
 class ExportWindow(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.title("Exportar Dados")
-        self.geometry("400x300") # Tamanho original
+        self.geometry("420x560")
         self.parent = parent
         self.resizable(False, False) # Original
 
@@ -23,6 +28,7 @@ class ExportWindow(tk.Toplevel):
         # main_frame.columnconfigure(1, weight=1) # Removido
 
         self.placeholders = {}
+        self.export_task = None
 
         self.periodo_var = tk.StringVar(value="hoje")
 
@@ -63,13 +69,86 @@ class ExportWindow(tk.Toplevel):
         self.placeholders["end_date_entry"] = "YYYY-MM-DD"
         utils.setup_placeholder(self.end_date_entry, self.placeholders["end_date_entry"])
 
+        # Só o que mudou desde a última exportação incremental (inclui os apagados)
+        ttk.Radiobutton(main_frame, text="Alterações desde a última exportação incremental",
+                        variable=self.periodo_var, value="incremental").pack(anchor="w", padx=20)
+        watermark = db.get_export_watermark()
+        ultima = f"Última: {watermark[1]} (UTC)" if watermark else "Primeira vez: exporta todo o histórico"
+        ttk.Label(main_frame, text=ultima, foreground="gray").pack(anchor="w", padx=40)
+
+        # Parquet (colunar, tipado e comprimido) só aparece habilitado com o pyarrow instalado
+        self.formato_var = tk.StringVar(value="csv")
+        formato_frame = ttk.Frame(main_frame)
+        formato_frame.pack(anchor="w", padx=20, pady=(10, 0))
+        ttk.Label(formato_frame, text="Formato:").pack(side="left")
+        ttk.Radiobutton(formato_frame, text="CSV", variable=self.formato_var, value="csv").pack(side="left", padx=5)
+        parquet_ok = db.parquet_available()
+        ttk.Radiobutton(formato_frame, text="Parquet" if parquet_ok else "Parquet (requer pyarrow)",
+                        variable=self.formato_var, value="parquet",
+                        state="normal" if parquet_ok else "disabled").pack(side="left", padx=5)
+
+        # Compressão em streaming do arquivo (no Parquet, troca o codec interno; "Nenhuma" mantém o padrão)
+        compressao_frame = ttk.Frame(main_frame)
+        compressao_frame.pack(anchor="w", padx=20, pady=(5, 0))
+        ttk.Label(compressao_frame, text="Compressão:").pack(side="left")
+        self.compressao_var = tk.StringVar(value=SEM_COMPRESSAO)
+        opcoes = [SEM_COMPRESSAO] + [c for c in db.EXPORT_COMPRESSIONS if db.compression_available(c)]
+        compressao_combo = ttk.Combobox(compressao_frame, textvariable=self.compressao_var, values=opcoes,
+                                        state="readonly", width=8)
+        compressao_combo.pack(side="left", padx=5)
+        compressao_combo.bind("<<ComboboxSelected>>", self.on_compression_selected)
+        ttk.Label(compressao_frame, text="Nível:").pack(side="left", padx=(10, 0))
+        self.nivel_var = tk.StringVar(value="")
+        self.nivel_spin = ttk.Spinbox(compressao_frame, textvariable=self.nivel_var, from_=1, to=9, width=4,
+                                      state="disabled")
+        self.nivel_spin.pack(side="left", padx=5)
+
+        # CSV largo: condutas em colunas conduta_1_*, conduta_2_*, ... em vez de uma linha por conduta
+        self.wide_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="Uma linha por atendimento (condutas em colunas)",
+                        variable=self.wide_var).pack(anchor="w", padx=20, pady=(5, 0))
+
+        # Períodos longos (ex.: um ano): uma parte por semana ISO, exportadas em processos paralelos
+        self.parallel_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="Em paralelo (uma parte por semana, um processo por núcleo)",
+                        variable=self.parallel_var).pack(anchor="w", padx=20)
+
         # Botão original
-        ttk.Button(main_frame, text="Gerar CSV", command=self.generate_csv).pack(pady=20)
+        self.generate_button = ttk.Button(main_frame, text="Exportar", command=self.generate_csv)
+        self.generate_button.pack(pady=(20, 10))
+
+        # Progresso da exportação (roda em segundo plano)
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill="x", padx=20)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate", maximum=1)
+        self.progress_bar.pack(side="left", fill="x", expand=True)
+        self.cancel_button = ttk.Button(progress_frame, text="Cancelar", command=self.cancel_export, state="disabled")
+        self.cancel_button.pack(side="left", padx=(5, 0))
+        self.progress_label = ttk.Label(main_frame, text="")
+        self.progress_label.pack(anchor="w", padx=20, pady=(2, 0))
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
 
+    def on_compression_selected(self, event=None):
+        """Ajusta a faixa e o valor padrão do nível à compressão escolhida."""
+        compressao = self.compressao_var.get()
+        if compressao == SEM_COMPRESSAO:
+            self.nivel_var.set("")
+            self.nivel_spin.config(state="disabled")
+            return
+        minimo, maximo = db.COMPRESSION_LEVELS[compressao]
+        self.nivel_spin.config(state="normal", from_=minimo, to=maximo)
+        self.nivel_var.set(str(db.DEFAULT_COMPRESSION_LEVELS[compressao]))
+
     def generate_csv(self):
-        """Executa a exportação com base no período selecionado."""
+        """Executa a exportação com base no período e no formato selecionados."""
         periodo = self.periodo_var.get()
+        formato = self.formato_var.get()
+        wide = self.wide_var.get()
+        parallel = self.parallel_var.get()
+        compression = None if self.compressao_var.get() == SEM_COMPRESSAO else self.compressao_var.get()
+        compression_level = None
         start_date, end_date, week_iso = None, None, None
 
         try:
@@ -84,6 +163,9 @@ class ExportWindow(tk.Toplevel):
             elif periodo == "30dias":
                 end_date = datetime.now().strftime("%Y-%m-%d")
                 start_date = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+            elif periodo == "incremental":
+                if formato != "csv" or wide:
+                    raise ValueError("A exportação incremental é feita apenas em CSV, uma linha por conduta.")
             elif periodo == "personalizado":
                 start_date = self.start_date_entry.get()
                 end_date = self.end_date_entry.get()
@@ -95,26 +177,118 @@ class ExportWindow(tk.Toplevel):
                 datetime.strptime(end_date, "%Y-%m-%d")
             else:
                 raise ValueError("Período de exportação inválido selecionado.")
+            if wide and formato != "csv":
+                raise ValueError("Uma linha por atendimento está disponível apenas em CSV.")
+            if parallel and (formato != "csv" or wide or not (start_date and end_date)):
+                raise ValueError("A exportação em paralelo é feita em CSV, uma linha por conduta, "
+                                 "para um período com data de início e fim.")
+            if compression:
+                minimo, maximo = db.COMPRESSION_LEVELS[compression]
+                compression_level = int(self.nivel_var.get())
+                if not minimo <= compression_level <= maximo:
+                    raise ValueError(f"O nível de compressão {compression} vai de {minimo} a {maximo}.")
 
         except ValueError as e:
             messagebox.showerror("Erro de Formato", f"Entrada inválida: {e}", parent=self)
             return
 
+        extensao, descricao = EXPORT_FORMATS[formato]
+        if formato == "csv" and compression:
+            extensao += db.EXPORT_COMPRESSIONS[compression]
         filepath = filedialog.asksaveasfilename(
             parent=self,
-            defaultextension=".csv",
-            filetypes=[("Arquivos CSV", "*.csv")],
-            initialfile=f"atendimentos_export_{datetime.now().strftime('%Y-%m-%d')}.csv" # Formato original
+            defaultextension=extensao,
+            filetypes=[(descricao, f"*{extensao}")],
+            initialfile=(f"atendimentos_alteracoes_{datetime.now().strftime('%Y-%m-%d_%H%M')}{extensao}"
+                         if periodo == "incremental" else
+                         f"atendimentos_export_{datetime.now().strftime('%Y-%m-%d')}{extensao}") # Formato original
         )
 
         if filepath:
-            try:
-                db.export_to_csv(filepath, start_date=start_date, end_date=end_date, week_iso=week_iso)
-                messagebox.showinfo("Sucesso", f"Dados exportados com sucesso para:\n{filepath}", parent=self)
-                self.destroy()
-            except Exception as e:
-                messagebox.showerror("Erro de Exportação", f"Ocorreu um erro ao exportar os dados: {e}", parent=self)
-                print(f"Erro detalhado export: {e}")
-                import traceback
-                traceback.print_exc()
+            self.start_export(filepath, start_date, end_date, week_iso, {
+                "incremental": periodo == "incremental", "formato": formato, "wide": wide, "parallel": parallel,
+                "compression": compression, "compression_level": compression_level,
+            })
 
+    def start_export(self, filepath, start_date, end_date, week_iso, options=None):
+        """Inicia a exportação em uma thread de trabalho, mantendo a janela responsiva.
+
+        options: incremental, formato ('csv' ou 'parquet'), wide, parallel,
+        compression e compression_level (ver _run_export).
+        """
+        self.generate_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.progress_bar.config(value=0, maximum=1)
+        self.progress_label.config(text="Preparando exportação...")
+        self.export_task = BackgroundTask(
+            self, _run_export, filepath, start_date, end_date, week_iso, options or {},
+            on_message=self.on_export_progress,
+            on_done=lambda result: self.on_export_done(filepath, result),
+            on_error=self.on_export_error
+        ).start()
+
+    def on_export_progress(self, progress):
+        exported, total = progress
+        self.progress_bar.config(maximum=max(total or 0, 1), value=exported)
+        self.progress_label.config(text=f"{exported} de {total} atendimentos exportados")
+
+    def cancel_export(self):
+        if self.export_task and self.export_task.running:
+            self.export_task.cancel()
+            self.cancel_button.config(state="disabled")
+            self.progress_label.config(text="Cancelando...")
+
+    def on_export_done(self, filepath, result):
+        self.cancel_button.config(state="disabled")
+        self.generate_button.config(state="normal")
+        if self.export_task.cancelled:
+            self.progress_bar.config(value=0)
+            self.progress_label.config(text="Exportação cancelada.")
+        elif result is None:
+            self.progress_label.config(text="")
+            messagebox.showerror("Erro de Exportação", "Ocorreu um erro ao exportar os dados. Verifique o log.", parent=self)
+        else:
+            messagebox.showinfo("Sucesso", f"Dados exportados com sucesso para:\n{filepath}", parent=self)
+            self.destroy()
+
+    def on_export_error(self, error):
+        self.cancel_button.config(state="disabled")
+        self.generate_button.config(state="normal")
+        self.progress_label.config(text="")
+        messagebox.showerror("Erro de Exportação", f"Ocorreu um erro ao exportar os dados: {error}", parent=self)
+        print(f"Erro detalhado export: {error}")
+
+    def on_close(self):
+        """Cancela a exportação em andamento (o arquivo parcial é removido) antes de fechar."""
+        if self.export_task and self.export_task.running:
+            if not messagebox.askyesno("Exportação em andamento", "Cancelar a exportação e fechar?", parent=self):
+                return
+            self.export_task.cancel()
+        self.destroy()
+
+
+def _run_export(task, filepath, start_date, end_date, week_iso, options):
+    """Executada na thread de trabalho: exporta e publica o progresso na fila da tarefa."""
+    progress_callback = lambda exported, total: task.post((exported, total))
+    compression = {"compression": options.get("compression"), "compression_level": options.get("compression_level")}
+    try:
+        if options.get("incremental"):
+            return db.export_changes_to_csv(filepath, progress_callback=progress_callback,
+                                            cancel_event=task.cancel_event, **compression)
+        if options.get("parallel"):
+            return db.export_to_csv_parallel(filepath, start_date, end_date, progress_callback=progress_callback,
+                                             cancel_event=task.cancel_event, **compression)
+        if options.get("formato") == "parquet":
+            if compression["compression"] is None:
+                # Parquet sempre comprime internamente; "Nenhuma" mantém o codec padrão
+                compression = {}
+            return db.export_to_parquet(filepath, start_date=start_date, end_date=end_date, week_iso=week_iso,
+                                        progress_callback=progress_callback, cancel_event=task.cancel_event,
+                                        **compression)
+        return db.export_to_csv(
+            filepath, start_date=start_date, end_date=end_date, week_iso=week_iso,
+            progress_callback=progress_callback,
+            cancel_event=task.cancel_event, wide=options.get("wide", False), **compression
+        )
+    finally:
+        db.release_thread_connection()
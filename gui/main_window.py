@@ -6,8 +6,11 @@ import utils
 from models import Atendimento, Conduta
 from gui.edit_window import EditWindow
 from gui.export_window import ExportWindow
+from gui.search_window import SearchWindow
+from gui.dashboard_window import DashboardWindow
 from gui.constants import OPTIONS, SINTOMAS, REGIOES, load_options # Importa load_options
 from gui.options_editor_window import OptionsEditorWindow # Importa a nova janela
+from gui.background import SerialWorker
 import sqlite3
 import json
 import main
@@ -20,6 +23,24 @@ PERIODO_60_DIAS = "60 dias"
 PERIODO_YTD = "YTD"
 PERIODOS_FILTRO = [PERIODO_ESCALA_ATUAL, PERIODO_15_DIAS, PERIODO_30_DIAS, PERIODO_60_DIAS, PERIODO_YTD]
 
+# Espera após a última tecla no campo badge antes de consultar o banco
+BADGE_DEBOUNCE_MS = 300
+# Frequência da atualização do indicador de envio da fila local (outbox)
+OUTBOX_STATUS_POLL_MS = 1000
+# Frequência com que a tela confere se o ChangeWatcher viu mudanças no banco (sem acessar disco)
+CHANGE_POLL_MS = 1000
+# Linhas do histórico buscadas por página; a próxima só vem quando o usuário rola até perto do fim
+HISTORY_PAGE_SIZE = 100
+HISTORY_PREFETCH_FRACTION = 0.9
+
+def _history_key(at_id, data, hora):
+    """Chave de ordenação (ts_atendimento, id) de uma linha do histórico."""
+    try:
+        return db.to_timestamp(f"{data} {hora}"), at_id
+    except ValueError:
+        return 0, at_id
+
+
 class MainWindow(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -32,6 +53,28 @@ class MainWindow(tk.Tk):
         self.qs_regioes_vars = {}
         self.form_widgets = []
 
+        # Consultas ao banco disparadas pela digitação rodam fora da thread do Tk
+        self.db_worker = SerialWorker(self)
+        self._badge_after_id = None
+        self._badge_lookup_seq = 0
+        # Cada atualização do histórico recebe um número; cargas antigas são descartadas
+        self._history_seq = 0
+        self._history_filter = None
+        self._history_cursor = None
+        self._history_loading = False
+        self._history_rows = 0
+        # Posição no registro de alterações já refletida no histórico e (ts, id) de cada linha
+        # exibida, para aplicar só o que mudou (ChangeWatcher, definido por set_change_watcher())
+        self._history_change_seq = None
+        self._history_keys = {}
+        # Alteração detectada enquanto uma página carregava; aplicada quando ela chegar
+        self._history_changes_pending = False
+        self.change_watcher = None
+        self._watched_version = None
+        # Fila local de envio (outbox.Outbox), definida por set_outbox()
+        self.outbox = None
+        self._outbox_pending = 0
+
         self.create_widgets()
         self.refresh_history_tree()
         self.setup_menu() # Chama a função para criar o menu
@@ -170,8 +213,11 @@ class MainWindow(tk.Tk):
 
         self.comboboxes["qp_sintoma"].bind("<<ComboboxSelected>>", self.on_qp_sintoma_change)
 
-        ttk.Button(button_frame, text="Salvar Atendimento", command=self.save_atendimento).pack(side=tk.LEFT, padx=5)
+        self.save_button = ttk.Button(button_frame, text="Salvar Atendimento", command=self.save_atendimento)
+        self.save_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Limpar Campos", command=lambda: self.clear_form(clear_all=True)).pack(side=tk.LEFT, padx=5)
+        self.sync_status_label = ttk.Label(button_frame, text="")
+        self.sync_status_label.pack(side=tk.LEFT, padx=10)
 
         self.create_history_section()
         self.clear_form()
@@ -339,7 +385,8 @@ class MainWindow(tk.Tk):
         self.history_tree.column("data_hora", width=120)
 
         scroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.history_tree.yview)
-        self.history_tree.configure(yscrollcommand=scroll.set)
+        self.history_scroll = scroll
+        self.history_tree.configure(yscrollcommand=self._on_history_yscroll)
         # Pack original
         self.history_tree.pack(side="left", fill="both", expand=True); scroll.pack(side="right", fill="y")
 
@@ -351,6 +398,8 @@ class MainWindow(tk.Tk):
 
         ttk.Button(history_button_frame, text="Selecionar Banco de Dados", command=self.change_database).pack(side=tk.LEFT, padx=5)
         ttk.Button(history_button_frame, text="Exportar Dados", command=self.open_export_window).pack(side=tk.LEFT, padx=5)
+        ttk.Button(history_button_frame, text="Buscar no Texto", command=self.open_search_window).pack(side=tk.LEFT, padx=5)
+        ttk.Button(history_button_frame, text="Painel", command=self.open_dashboard_window).pack(side=tk.LEFT, padx=5)
 
     def set_current_time(self):
         if entry := self.entries.get("horario_medicao"):
@@ -470,10 +519,21 @@ class MainWindow(tk.Tk):
             pass
 
     def on_badge_number_change(self, event):
+        """Agenda a busca do badge para depois que a digitação parar (debounce)."""
+        if self._badge_after_id is not None:
+            self.after_cancel(self._badge_after_id)
+        self._badge_after_id = self.after(BADGE_DEBOUNCE_MS, self.lookup_badge)
+
+    def lookup_badge(self):
+        """Busca a identidade do badge atual em segundo plano."""
+        self._badge_after_id = None
         badge_entry = self.entries.get('badge_number')
         if not badge_entry: return
 
         badge = badge_entry.get()
+        # Invalida qualquer busca ainda em andamento: só a mais recente é aplicada
+        self._badge_lookup_seq += 1
+        seq = self._badge_lookup_seq
 
         # --- CORREÇÃO: Não limpar o campo badge ao preencher os outros ---
         if not badge or badge == self.placeholders.get("badge_number"):
@@ -481,7 +541,17 @@ class MainWindow(tk.Tk):
             self.refresh_history_tree() # Atualiza mesmo se limpar
             return # Sai se o badge estiver vazio ou for placeholder
 
-        last_data = db.get_last_atendimento_by_badge(badge)
+        self.db_worker.submit(
+            db.get_last_atendimento_by_badge, badge,
+            on_done=lambda last_data: self.apply_badge_lookup(seq, badge, last_data)
+        )
+
+    def apply_badge_lookup(self, seq, badge, last_data):
+        """Preenche a identificação com o resultado da busca, se ela ainda for a mais recente."""
+        badge_entry = self.entries.get('badge_number')
+        if seq != self._badge_lookup_seq or not badge_entry or badge_entry.get() != badge:
+            return
+
         if last_data:
             fields_to_fill = {'nome': 'nome', 'login': 'login', 'gestor': 'gestor', 'turno': 'turno',
                               'setor': 'setor', 'processo': 'processo', 'tenure': 'tenure'}
@@ -515,54 +585,200 @@ class MainWindow(tk.Tk):
         self.refresh_history_tree()
 
     def refresh_history_tree(self, event=None):
-        try:
-            for item in self.history_tree.get_children(): self.history_tree.delete(item)
+        """Recarrega o histórico a partir da primeira página, em segundo plano."""
+        self._history_seq += 1
 
-            badge_entry = self.entries.get('badge_number')
-            badge = badge_entry.get() if badge_entry else None
-            badge = None if not badge or badge == self.placeholders.get("badge_number") else badge
+        # Remove todos os itens de uma vez
+        self.history_tree.delete(*self.history_tree.get_children())
+        self.history_tree.insert("", "end", values=("Carregando...", "", ""))
 
-            period = self.history_period_var.get()
+        badge_entry = self.entries.get('badge_number')
+        badge = badge_entry.get() if badge_entry else None
+        badge = None if not badge or badge == self.placeholders.get("badge_number") else badge
 
-            atendimentos = []
+        period = self.history_period_var.get()
 
-            if period == PERIODO_ESCALA_ATUAL:
-                now = datetime.now()
-                if 7 <= now.hour < 19:
-                    start_dt = now.replace(hour=7, minute=0, second=0, microsecond=0)
-                    end_dt = now.replace(hour=18, minute=59, second=59, microsecond=999999)
-                else:
-                    if now.hour >= 19:
-                        start_dt = now.replace(hour=19, minute=0, second=0, microsecond=0)
-                        end_dt = (now + timedelta(days=1)).replace(hour=6, minute=59, second=59, microsecond=999999)
-                    else:
-                        start_dt = (now - timedelta(days=1)).replace(hour=19, minute=0, second=0, microsecond=0)
-                        end_dt = now.replace(hour=6, minute=59, second=59, microsecond=999999)
-                atendimentos = db.get_atendimentos_by_datetime_range(
-                    start_dt.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S"), badge)
-            else:
-                days = {PERIODO_15_DIAS: 15, PERIODO_30_DIAS: 30, PERIODO_60_DIAS: 60}.get(period, 15)
-                if period == PERIODO_YTD: days = (datetime.now() - datetime.now().replace(month=1, day=1)).days + 1
-                atendimentos = db.get_atendimentos_by_badge(badge, days)
-
-            if not atendimentos:
+        if period == PERIODO_ESCALA_ATUAL:
+            start_dt, end_dt = utils.escala_atual()
+            start_str, end_str = start_dt.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            days = {PERIODO_15_DIAS: 15, PERIODO_30_DIAS: 30, PERIODO_60_DIAS: 60}.get(period, 15)
+            if period == PERIODO_YTD: days = (datetime.now() - datetime.now().replace(month=1, day=1)).days + 1
+            start_str = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d") + " 00:00:00"
+            end_str = None
+
+        self._history_filter = (start_str, end_str, badge)
+        self._history_cursor = None
+        self._history_rows = 0
+        self._history_keys = {}
+        self._history_change_seq = None
+        self._history_changes_pending = False
+        # Lido antes da primeira página (o worker é serial): alterações feitas entre as duas
+        # consultas são aplicadas de novo depois, o que não tem efeito
+        seq = self._history_seq
+        self.db_worker.submit(db.get_change_seq,
+                              on_done=lambda change_seq: self._set_history_change_seq(seq, change_seq))
+        self._request_history_page()
+
+    def _request_history_page(self):
+        """Pede ao worker a próxima página do filtro atual."""
+        seq = self._history_seq
+        start_str, end_str, badge = self._history_filter
+        after = self._history_cursor
+        self._history_loading = True
+
+        def load():
+            # Se outra atualização foi pedida enquanto esta esperava na fila, nem consulta
+            if seq != self._history_seq: return None
+            return db.get_atendimentos_page(start_str, end_str, badge, after=after, limit=HISTORY_PAGE_SIZE)
+
+        self.db_worker.submit(
+            load,
+            on_done=lambda page: self._append_history_page(seq, page),
+            on_error=lambda e: self._on_history_error(seq, e)
+        )
+
+    def _append_history_page(self, seq, page):
+        """Acrescenta uma página à Treeview, se ela ainda pertencer à atualização mais recente."""
+        if seq != self._history_seq or page is None:
+            return
+        atendimentos, next_cursor = page
+        self._history_loading = False
+        self._history_cursor = next_cursor
+        if self._history_changes_pending:
+            # Vai para a fila do worker, depois desta página já estar na Treeview
+            self.refresh_history_changes()
+        try:
+            if self._history_rows == 0:
+                self.history_tree.delete(*self.history_tree.get_children())
+                if not atendimentos:
+                    self.history_tree.insert("", "end", values=("Sem registros", "", ""))
+                    return
+
+            for at in atendimentos:
+                at_id = at[0] if len(at) > 0 else "N/A"
+                badge_val = at[1] if len(at) > 1 else "N/A"
+                nome_val = at[2] if len(at) > 2 else "N/A"
+                data_val = at[4] if len(at) > 4 else "N/A"
+                hora_val = at[5] if len(at) > 5 else "N/A"
+                self.history_tree.insert("", "end", iid=at_id, values=(badge_val, nome_val, f"{data_val} {hora_val}"))
+                self._history_keys[str(at_id)] = _history_key(at_id, data_val, hora_val)
+            self._history_rows += len(atendimentos)
+
+            # Se a página ainda não preenche a área visível, não haverá rolagem para pedir a próxima
+            self.after_idle(lambda: self._on_history_yscroll(*self.history_tree.yview()))
+        except tk.TclError as e:
+            print(f"Erro ao preencher histórico: {e}")
+
+    def _set_history_change_seq(self, seq, change_seq):
+        if seq == self._history_seq:
+            self._history_change_seq = change_seq
+
+    def refresh_history_changes(self):
+        """Aplica ao histórico só os atendimentos inseridos, alterados ou apagados desde a última carga."""
+        if self._history_loading:
+            # A versão já foi registrada por _poll_changes: sem isso a alteração se perderia
+            self._history_changes_pending = True
+            return
+        if self._history_change_seq is None:
+            self.refresh_history_tree()
+            return
+        self._history_changes_pending = False
+        seq = self._history_seq
+        since = self._history_change_seq
+
+        def load():
+            if seq != self._history_seq: return None
+            result = db.get_changes_since(since)
+            if result is None:
+                return "recarregar"
+            changes, new_seq = result
+            return changes, new_seq, db.get_atendimentos_by_ids(i for i, op in changes.items() if op != "D")
+
+        self.db_worker.submit(
+            load,
+            on_done=lambda result: self._apply_history_changes(seq, result),
+            on_error=lambda e: print(f"Erro ao buscar alterações do histórico: {e}")
+        )
+
+    def _apply_history_changes(self, seq, result):
+        if seq != self._history_seq or result is None:
+            return
+        if result == "recarregar":
+            self.refresh_history_tree()
+            return
+        changes, new_seq, rows = result
+        self._history_change_seq = new_seq
+        if not changes:
+            return
+        start_str, end_str, badge = self._history_filter
+        low = db.to_timestamp(start_str)
+        high = db.to_timestamp(end_str) if end_str else float("inf")
+        try:
+            if self._history_rows == 0:
+                self.history_tree.delete(*self.history_tree.get_children())  # "Sem registros"
+            for at_id in changes:
+                if self._history_keys.pop(str(at_id), None) is not None:
+                    self.history_tree.delete(str(at_id))
+                    self._history_rows -= 1
+            for at_id, badge_val, nome_val, _login, data_val, hora_val, _qp, _resumo, ts in rows:
+                key = (ts, at_id)
+                if ts is None or not (low <= ts <= high) or (badge is not None and badge_val != badge):
+                    continue
+                # Linhas mais antigas que a última página carregada chegam quando o usuário rolar
+                if self._history_cursor is not None and key < tuple(self._history_cursor):
+                    continue
+                children = self.history_tree.get_children()
+                index = next((i for i, iid in enumerate(children) if self._history_keys.get(iid, key) < key),
+                             len(children))
+                self.history_tree.insert("", index, iid=at_id, values=(badge_val, nome_val, f"{data_val} {hora_val}"))
+                self._history_keys[str(at_id)] = key
+                self._history_rows += 1
+            if self._history_rows == 0:
                 self.history_tree.insert("", "end", values=("Sem registros", "", ""))
-            else:
-                for at in atendimentos:
-                    at_id = at[0] if len(at) > 0 else "N/A"
-                    badge_val = at[1] if len(at) > 1 else "N/A"
-                    nome_val = at[2] if len(at) > 2 else "N/A"
-                    data_val = at[4] if len(at) > 4 else "N/A"
-                    hora_val = at[5] if len(at) > 5 else "N/A"
-                    self.history_tree.insert("", "end", iid=at_id, values=(badge_val, nome_val, f"{data_val} {hora_val}"))
-        except Exception as e:
-            print(f"Erro ao atualizar histórico: {e}")
-            messagebox.showerror("Erro de Banco de Dados", f"Não foi possível carregar o histórico: {e}", parent=self)
-            try:
-                if not self.history_tree.get_children():
-                    self.history_tree.insert("", "end", values=("Erro ao carregar", "", ""))
-            except tk.TclError:
-                 pass
+        except tk.TclError as e:
+            print(f"Erro ao aplicar alterações no histórico: {e}")
+
+    def set_change_watcher(self, watcher):
+        """Passa a atualizar o histórico sozinho quando o ChangeWatcher detectar mudanças no banco."""
+        self.change_watcher = watcher
+        self._watched_version = watcher.version
+        self._poll_changes()
+
+    def _poll_changes(self):
+        if self.change_watcher is None:
+            return
+        version = self.change_watcher.version
+        if version != self._watched_version:
+            self._watched_version = version
+            self.refresh_history_changes()
+        self.after(CHANGE_POLL_MS, self._poll_changes)
+
+    def _on_history_yscroll(self, first, last):
+        """Atualiza a barra de rolagem e busca a próxima página perto do fim da lista."""
+        self.history_scroll.set(first, last)
+        if (float(last) >= HISTORY_PREFETCH_FRACTION and self._history_cursor is not None
+                and not self._history_loading):
+            self._request_history_page()
+
+    def _on_history_error(self, seq, e):
+        if seq != self._history_seq:
+            return
+        print(f"Erro ao atualizar histórico: {e}")
+        # A lista é trocada pela mensagem de erro: sem páginas a buscar nem alterações a aplicar.
+        # A próxima alteração detectada (change_seq None) recarrega tudo
+        self._history_loading = False
+        self._history_cursor = None
+        self._history_rows = 0
+        self._history_keys = {}
+        self._history_change_seq = None
+        self._history_changes_pending = False
+        messagebox.showerror("Erro de Banco de Dados", f"Não foi possível carregar o histórico: {e}", parent=self)
+        try:
+            self.history_tree.delete(*self.history_tree.get_children())
+            self.history_tree.insert("", "end", values=("Erro ao carregar", "", ""))
+        except tk.TclError:
+            pass
 
     def on_double_click_history(self, event):
         if item := self.history_tree.selection():
@@ -629,14 +845,77 @@ class MainWindow(tk.Tk):
                 hora_atendimento=now.strftime("%H:%M:%S"),
                 semana_iso=now.isocalendar()[1]
             )
-            db.save_atendimento(atendimento)
-            messagebox.showinfo("Sucesso", "Atendimento salvo!")
-            self.clear_form(clear_all=True); self.refresh_history_tree()
+            self._save_new_atendimento(atendimento)
         except Exception as e:
-            messagebox.showerror("Erro", f"Ocorreu um erro ao salvar o atendimento: {e}")
-            print(f"Erro detalhado ao salvar: {e}")
-            import traceback
-            traceback.print_exc()
+            self._on_save_error(e)
+
+    def _save_new_atendimento(self, atendimento):
+        """Grava na fila local (envio em segundo plano) ou, sem fila, direto no banco pelo worker.
+
+        A gravação direta pode esperar o lock de outra estação por vários
+        segundos (retries x busy_timeout), então não roda na thread do Tk; o
+        botão fica desabilitado até o resultado chegar.
+        """
+        if self.outbox is not None:
+            try:
+                self.outbox.enqueue(atendimento)
+                self._update_sync_status()
+                self._on_atendimento_saved()
+                return
+            except Exception as e:
+                # Disco local com problema: não perde o atendimento, grava direto
+                print(f"Erro ao gravar na fila local, gravando direto no banco: {e}")
+        self.save_button.config(state="disabled")
+        self.db_worker.submit(db.save_atendimento, atendimento,
+                              on_done=lambda _id: self._on_atendimento_saved(),
+                              on_error=self._on_save_error)
+
+    def _on_atendimento_saved(self):
+        self.save_button.config(state="normal")
+        messagebox.showinfo("Sucesso", "Atendimento salvo!")
+        self.clear_form(clear_all=True); self.refresh_history_changes()
+
+    def _on_save_error(self, e):
+        self.save_button.config(state="normal")
+        if isinstance(e, db.DatabaseWriteError):
+            # O formulário não é limpo: os dados continuam na tela para salvar de novo
+            messagebox.showerror("Atendimento NÃO salvo", f"{e}\n\nOs dados continuam no formulário.")
+            return
+        messagebox.showerror("Erro", f"Ocorreu um erro ao salvar o atendimento: {e}")
+        print(f"Erro detalhado ao salvar: {e}")
+        import traceback
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+    def set_outbox(self, outbox):
+        """Passa a gravar os novos atendimentos pela fila local e mostra os pendentes."""
+        self.outbox = outbox
+        self._outbox_pending = outbox.pending_count()
+        self._poll_outbox_status()
+
+    def _poll_outbox_status(self):
+        if self.outbox is None:
+            return
+        self._update_sync_status()
+        self.after(OUTBOX_STATUS_POLL_MS, self._poll_outbox_status)
+
+    def _update_sync_status(self):
+        status = self.outbox.status()
+        pending = status["pending"]
+        if pending == 0:
+            text = "Sincronizado" + (f" ({status['last_sync']})" if status["last_sync"] else "")
+        else:
+            text = f"{pending} atendimento(s) aguardando envio"
+            if status["last_error"]:
+                text += " - sem acesso ao banco, tentando novamente"
+        if status["other_pending"]:
+            text += f" - {status['other_pending']} para outro banco"
+        if status["rejected"]:
+            text += f" - {status['rejected']} recusado(s) pelo banco (fila local)"
+        self.sync_status_label.config(text=text)
+        if pending < self._outbox_pending:
+            # Atendimentos chegaram ao banco compartilhado: passam a aparecer no histórico
+            self.refresh_history_changes()
+        self._outbox_pending = pending
 
     def clear_form(self, clear_all=False, clear_badge=False, clear_id_fields=False, clear_anamnese_conduta=True, restore_placeholders=True):
         """Limpa os campos do formulário com mais controle."""
@@ -686,6 +965,7 @@ class MainWindow(tk.Tk):
         if new_path:
             try:
                 if db.init_db():
+                     db.start_background_maintenance()
                      self.refresh_history_tree()
                      self.clear_form(clear_all=True)
                      messagebox.showinfo("Banco de Dados Alterado", f"Aplicação agora usando:\n{new_path}", parent=self)
@@ -697,3 +977,7 @@ class MainWindow(tk.Tk):
 
     def open_export_window(self): ExportWindow(self)
 
+    def open_search_window(self): SearchWindow(self)
+
+    def open_dashboard_window(self): DashboardWindow(self)
+
@@ -0,0 +1,173 @@
+"""
+gui/search_window.py
+--------------------
+Janela de busca textual nos atendimentos (HQA, observações, doenças,
+alergias, medicamentos e hipóteses diagnósticas).
+"""
+import tkinter as tk
+from tkinter import ttk, messagebox
+from datetime import datetime, timedelta
+import db
+from gui.background import SerialWorker
+from gui.edit_window import EditWindow
+
+PERIODO_TODOS = "Todo o histórico"
+PERIODOS_BUSCA = [PERIODO_TODOS, "30 dias", "60 dias", "YTD"]
+# "Mais recentes" é o padrão: responde em milissegundos mesmo para termos muito comuns
+ORDENS_BUSCA = {"Mais recentes": "recentes", "Relevância": "relevancia"}
+
+# Como no histórico: a próxima página só é buscada quando o usuário rola até perto do fim
+SEARCH_PREFETCH_FRACTION = 0.9
+
+
+class SearchWindow(tk.Toplevel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Buscar Atendimentos")
+        self.geometry("900x550")
+        self.parent = parent
+
+        # Cada busca recebe um número; páginas de buscas antigas são descartadas
+        self.worker = SerialWorker(self)
+        self._seq = 0
+        self._filter = None
+        self._cursor = None
+        self._loading = False
+        self._rows = 0
+
+        main_frame = ttk.Frame(self, padding="10")
+        main_frame.pack(fill="both", expand=True)
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(1, weight=1)
+
+        controls = ttk.Frame(main_frame)
+        controls.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        ttk.Label(controls, text="Buscar:").pack(side="left")
+        self.query_entry = ttk.Entry(controls, width=40)
+        self.query_entry.pack(side="left", padx=5)
+        self.query_entry.bind("<Return>", self.run_search)
+        ttk.Button(controls, text="Buscar", command=self.run_search).pack(side="left")
+
+        self.order_var = tk.StringVar(value="Mais recentes")
+        order_combo = ttk.Combobox(controls, textvariable=self.order_var, values=list(ORDENS_BUSCA),
+                                   state="readonly", width=14)
+        order_combo.pack(side="right")
+        order_combo.bind("<<ComboboxSelected>>", self.run_search)
+        ttk.Label(controls, text="Ordem:").pack(side="right", padx=(10, 5))
+
+        self.period_var = tk.StringVar(value=PERIODO_TODOS)
+        period_combo = ttk.Combobox(controls, textvariable=self.period_var, values=PERIODOS_BUSCA,
+                                    state="readonly", width=16)
+        period_combo.pack(side="right")
+        period_combo.bind("<<ComboboxSelected>>", self.run_search)
+        ttk.Label(controls, text="Período:").pack(side="right", padx=(10, 5))
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.grid(row=1, column=0, sticky="nsew")
+        self.tree = ttk.Treeview(tree_frame, columns=("data_hora", "badge", "nome", "trecho"), show="headings")
+        self.tree.heading("data_hora", text="Data/Hora"); self.tree.heading("badge", text="Badge")
+        self.tree.heading("nome", text="Nome"); self.tree.heading("trecho", text="Trecho encontrado")
+        self.tree.column("data_hora", width=120, stretch=False)
+        self.tree.column("badge", width=80, anchor="center", stretch=False)
+        self.tree.column("nome", width=180, stretch=False)
+        self.tree.column("trecho", width=480)
+
+        self.scroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_yscroll)
+        self.tree.pack(side="left", fill="both", expand=True); self.scroll.pack(side="right", fill="y")
+        self.tree.bind("<Double-1>", self.on_double_click)
+
+        self.status_label = ttk.Label(main_frame, text="Digite uma ou mais palavras (acentos são ignorados).")
+        self.status_label.grid(row=2, column=0, sticky="w", pady=(5, 0))
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.query_entry.focus_set()
+
+    def _period_start(self):
+        period = self.period_var.get()
+        if period == PERIODO_TODOS:
+            return None
+        if period == "YTD":
+            start = datetime.now().replace(month=1, day=1)
+        else:
+            start = datetime.now() - timedelta(days=int(period.split()[0]))
+        return start.strftime("%Y-%m-%d") + " 00:00:00"
+
+    def run_search(self, event=None):
+        """Inicia uma nova busca a partir da primeira página."""
+        texto = self.query_entry.get().strip()
+        if not texto:
+            return
+        self._seq += 1
+        self._filter = (texto, self._period_start(), ORDENS_BUSCA[self.order_var.get()])
+        self._cursor = None
+        self._rows = 0
+        self.tree.delete(*self.tree.get_children())
+        self.status_label.config(text="Buscando...")
+        self._request_page()
+
+    def _request_page(self):
+        seq = self._seq
+        texto, start_str, ordem = self._filter
+        after = self._cursor
+        self._loading = True
+
+        def load():
+            if seq != self._seq: return None
+            return db.search_atendimentos(texto, start_str, ordem=ordem, after=after)
+
+        self.worker.submit(
+            load,
+            on_done=lambda page: self._append_page(seq, page),
+            on_error=lambda e: self._on_error(seq, e)
+        )
+
+    def _append_page(self, seq, page):
+        if seq != self._seq or page is None:
+            return
+        rows, next_cursor = page
+        self._loading = False
+        self._cursor = next_cursor
+        for row in rows:
+            at_id, badge, nome, _login, data, hora, _qp, _resumo, trecho = row
+            try:
+                # 'relevancia' pagina por OFFSET: uma gravação entre páginas pode repetir um resultado
+                if self.tree.exists(at_id):
+                    continue
+                self.tree.insert("", "end", iid=at_id,
+                                 values=(f"{data} {hora}", badge, nome, " ".join((trecho or "").split())))
+                self._rows += 1
+            except tk.TclError as e:
+                print(f"Erro ao mostrar o atendimento {at_id} na busca: {e}")
+        try:
+            if self._rows == 0:
+                self.status_label.config(text="Nenhum atendimento encontrado.")
+            else:
+                mais = " (role para ver mais)" if next_cursor is not None else ""
+                self.status_label.config(text=f"{self._rows} atendimento(s){mais}. Duplo clique para abrir.")
+            self.after_idle(lambda: self._on_yscroll(*self.tree.yview()))
+        except tk.TclError as e:
+            print(f"Erro ao atualizar o status da busca: {e}")
+
+    def _on_yscroll(self, first, last):
+        self.scroll.set(first, last)
+        if float(last) >= SEARCH_PREFETCH_FRACTION and self._cursor is not None and not self._loading:
+            self._request_page()
+
+    def _on_error(self, seq, e):
+        if seq != self._seq:
+            return
+        self._loading = False
+        self.status_label.config(text="")
+        messagebox.showerror("Erro de Banco de Dados", f"Não foi possível buscar: {e}", parent=self)
+
+    def on_double_click(self, event):
+        if item := self.tree.selection():
+            try: EditWindow(self, int(item[0]), self.run_search)
+            except (ValueError, IndexError): pass
+
+    def on_close(self):
+        # A conexão é da thread do worker: ela mesma a libera antes de parar
+        self.worker.submit(db.release_thread_connection)
+        self.worker.stop()
+        self.destroy()
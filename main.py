@@ -6,9 +6,12 @@ Ponto de entrada da aplicação de atendimentos médicos.
 import db
 import gui.main_window as main_window
 import config_manager
+import outbox
+import change_watcher
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
+import multiprocessing
 
 def select_database_path(initial=False, parent_window=None):
     """Pede ao usuário para selecionar o arquivo de banco de dados."""
@@ -56,6 +59,8 @@ def initialize_app():
         messagebox.showerror("Erro Crítico na GUI", f"Falha ao inicializar a interface gráfica:\n{e}")
         return
 
+    db.set_busy_timeout(config_manager.load_busy_timeout())
+    db.set_write_retries(config_manager.load_write_retries())
     db_path = config_manager.load_db_path()
     db_initialized = False
 
@@ -85,13 +90,36 @@ def initialize_app():
 
     # 5. DB está pronto, agora mostre a janela principal
     app.deiconify() # Mostra a janela
+    app.refresh_history_tree() # A carga feita no __init__ ainda não tinha banco definido
+    # Backfills das migrações e VACUUM: podem levar dezenas de segundos num banco grande
+    db.start_background_maintenance()
+
+    # Novos atendimentos vão primeiro para a fila local e são enviados em segundo plano
+    fila = None
+    if config_manager.load_outbox_enabled():
+        try:
+            fila = outbox.Outbox(config_manager.get_outbox_path()).start()
+            app.set_outbox(fila)
+        except Exception as e:
+            print(f"Fila local indisponível, gravando direto no banco: {e}")
+
+    # Atualiza o histórico quando outras estações gravam no banco
+    watcher = change_watcher.ChangeWatcher().start()
+    app.set_change_watcher(watcher)
     
     # O setup_menu() já é chamado dentro do __init__ da MainWindow
     # A atualização do histórico também
     
     app.mainloop()
+    watcher.stop()
+    if fila:
+        fila.stop()
+    db.close_connections()
 
 
 if __name__ == "__main__":
+    # Exportação paralela (db.export_to_csv_parallel): no executável do PyInstaller, os
+    # processos de exportação reabrem o .exe e precisam parar aqui em vez de abrir a janela
+    multiprocessing.freeze_support()
     initialize_app()
 
@@ -0,0 +1,927 @@
+"""
+migrations.py
+-------------
+Migrações versionadas do esquema do banco de dados.
+
+A versão do esquema fica em PRAGMA user_version. Cada migração numerada é
+aplicada exatamente uma vez, em sua própria transação; quando o banco já
+está na última versão, migrate() não faz nenhum trabalho além de ler o
+PRAGMA.
+"""
+import sqlite3
+
+from gui.constants import SINTOMAS, REGIOES
+
+# Linhas por transação ao preencher colunas novas em bancos grandes
+BACKFILL_CHUNK_SIZE = 5000
+
+# Colunas categóricas de atendimentos guardadas como id de uma tabela de dicionário
+# (coluna -> tabela). A partir da migração 7, `atendimentos` é uma view sobre
+# atendimentos_base que traz de volta os nomes.
+LOOKUP_TABLES = {
+    "gestor": "gestores",
+    "turno": "turnos",
+    "setor": "setores",
+    "processo": "processos",
+    "tipo_atendimento": "tipos_atendimento",
+}
+
+# Sinais vitais digitados como texto (coluna -> tipo da coluna numérica <coluna>_valor)
+VITAL_COLUMNS = {
+    "tax": "REAL",
+    "pa_sistolica": "INTEGER",
+    "pa_diastolica": "INTEGER",
+    "fc": "INTEGER",
+    "sat": "INTEGER",
+}
+
+
+def _m001_esquema_base(cursor):
+    """Cria as tabelas e ajusta colunas de versões antigas do aplicativo."""
+    # Tabela para os atendimentos
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS atendimentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            badge_number TEXT NOT NULL,
+            nome TEXT,
+            login TEXT,
+            gestor TEXT,
+            turno TEXT,
+            setor TEXT,
+            processo TEXT,
+            tenure TEXT,
+            tipo_atendimento TEXT,
+            qp_sintoma TEXT,
+            qp_regiao TEXT,
+            qs_sintomas TEXT,
+            qs_regioes TEXT,
+            hqa TEXT,
+            tax TEXT,
+            pa_sistolica TEXT,
+            pa_diastolica TEXT,
+            fc TEXT,
+            sat TEXT,
+            doencas_preexistentes TEXT,
+            alergias TEXT,
+            medicamentos_em_uso TEXT,
+            observacoes TEXT,
+            data_atendimento TEXT NOT NULL,
+            hora_atendimento TEXT NOT NULL,
+            semana_iso INTEGER NOT NULL
+        )
+    """)
+
+    # Bancos antigos podem não ter as colunas de queixa / tipo de atendimento
+    colunas_atendimento = [col[1] for col in cursor.execute("PRAGMA table_info(atendimentos)").fetchall()]
+    for col in ['tipo_atendimento', 'qp_sintoma', 'qp_regiao', 'qs_sintomas', 'qs_regioes']:
+        if col not in colunas_atendimento:
+            cursor.execute(f"ALTER TABLE atendimentos ADD COLUMN {col} TEXT DEFAULT 'N/A'")
+            print(f"Coluna '{col}' adicionada à tabela 'atendimentos'.")
+
+    # Renomeia a coluna antiga 'queixas_principais' para backup, em vez de apagar
+    if 'queixas_principais' in colunas_atendimento:
+        cursor.execute("ALTER TABLE atendimentos RENAME COLUMN queixas_principais TO queixas_principais_old")
+        print("Coluna 'queixas_principais' antiga renomeada para 'queixas_principais_old'.")
+
+    # Tabela para as condutas
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS condutas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            atendimento_id INTEGER NOT NULL,
+            hipotese_diagnostica TEXT,
+            resumo_conduta TEXT,
+            medicamento_administrado TEXT,
+            posologia TEXT,
+            horario_medicacao TEXT,
+            observacoes TEXT,
+            FOREIGN KEY (atendimento_id) REFERENCES atendimentos (id) ON DELETE CASCADE
+        )
+    """)
+
+    colunas_conduta = [col[1] for col in cursor.execute("PRAGMA table_info(condutas)").fetchall()]
+    if 'conduta_adotada' in colunas_conduta:
+        cursor.execute("ALTER TABLE condutas RENAME COLUMN conduta_adotada TO conduta_adotada_old")
+        print("Coluna 'conduta_adotada' antiga renomeada para 'conduta_adotada_old'.")
+
+
+def _m002_indices(cursor):
+    """Índices para o histórico, último atendimento por badge e busca de condutas."""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_atendimentos_badge_data
+        ON atendimentos (badge_number, data_atendimento, hora_atendimento)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_atendimentos_data
+        ON atendimentos (data_atendimento, hora_atendimento)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_condutas_atendimento
+        ON condutas (atendimento_id)
+    """)
+
+
+def _m003_timestamp_atendimento(cursor):
+    """Coluna inteira indexável com data+hora do atendimento (segundos, horário local).
+
+    Substitui o filtro por (data_atendimento || ' ' || hora_atendimento), que
+    nenhum índice consegue atender.
+    """
+    cursor.execute("ALTER TABLE atendimentos ADD COLUMN ts_atendimento INTEGER")
+    cursor.execute("""
+        UPDATE atendimentos
+        SET ts_atendimento = CAST(strftime('%s', data_atendimento || ' ' || hora_atendimento) AS INTEGER)
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_atendimentos_ts ON atendimentos (ts_atendimento)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_atendimentos_badge_ts
+        ON atendimentos (badge_number, ts_atendimento)
+    """)
+    # Os índices por data/hora em texto passam a ser redundantes
+    cursor.execute("DROP INDEX IF EXISTS idx_atendimentos_badge_data")
+    cursor.execute("DROP INDEX IF EXISTS idx_atendimentos_data")
+
+
+def _m004_resumo_conduta_principal(cursor):
+    """Copia o resumo da primeira conduta para atendimentos.
+
+    As consultas de histórico liam esse valor com uma subquery correlacionada
+    por linha; agora ele é mantido por save_atendimento/update_atendimento.
+    """
+    cursor.execute("ALTER TABLE atendimentos ADD COLUMN resumo_conduta_principal TEXT")
+    cursor.execute("""
+        UPDATE atendimentos
+        SET resumo_conduta_principal = (
+            SELECT c.resumo_conduta FROM condutas c
+            WHERE c.atendimento_id = atendimentos.id
+            ORDER BY c.id LIMIT 1
+        )
+    """)
+
+
+def _m005_record_key(cursor):
+    """Chave única por atendimento, gerada na estação que o registrou.
+
+    Permite que a fila local de envio (outbox.py) repita um envio sem criar
+    duplicatas. Atendimentos antigos ficam com NULL (o índice único ignora NULLs).
+    """
+    cursor.execute("ALTER TABLE atendimentos ADD COLUMN record_key TEXT")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_atendimentos_record_key ON atendimentos (record_key)")
+
+
+def qs_mask_sql(coluna, opcoes):
+    """Expressão SQL que converte a lista JSON em `coluna` na máscara de bits de `opcoes`.
+
+    O bit i corresponde a opcoes[i]; itens fora da lista e JSON inválido são
+    ignorados. SUM(DISTINCT ...) evita contar duas vezes um item repetido.
+    """
+    casos = " ".join("WHEN '{}' THEN {}".format(valor.replace("'", "''"), 1 << i)
+                     for i, valor in enumerate(opcoes))
+    return (f"(SELECT COALESCE(SUM(DISTINCT CASE j.value {casos} END), 0) "
+            f"FROM json_each(CASE WHEN json_valid({coluna}) THEN {coluna} ELSE '[]' END) j)")
+
+
+def _m006_qs_mascaras(cursor):
+    """Máscaras de bits para as queixas secundárias (qs_sintomas / qs_regioes).
+
+    O JSON continua sendo gravado (versões antigas do aplicativo o leem), e
+    as colunas qs_sintomas_mask / qs_regioes_mask são mantidas por triggers
+    a partir dele, inclusive quando quem grava é uma estação ainda na versão
+    antiga. O bit i é SINTOMAS[i] / REGIOES[i] de gui/constants.py.
+
+    As linhas existentes ficam com NULL aqui e são preenchidas em lotes por
+    backfill_qs_masks(), fora desta transação; o intervalo de ids pendente
+    fica em `backfills`, para que a inicialização não precise procurar NULLs.
+    """
+    cursor.execute("ALTER TABLE atendimentos ADD COLUMN qs_sintomas_mask INTEGER")
+    cursor.execute("ALTER TABLE atendimentos ADD COLUMN qs_regioes_mask INTEGER")
+    set_masks = (f"qs_sintomas_mask = {qs_mask_sql('NEW.qs_sintomas', SINTOMAS)}, "
+                 f"qs_regioes_mask = {qs_mask_sql('NEW.qs_regioes', REGIOES)}")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_qs_insert
+        AFTER INSERT ON atendimentos
+        BEGIN
+            UPDATE atendimentos SET {set_masks} WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_qs_update
+        AFTER UPDATE OF qs_sintomas, qs_regioes ON atendimentos
+        BEGIN
+            UPDATE atendimentos SET {set_masks} WHERE id = NEW.id;
+        END
+    """)
+    _create_backfills_table(cursor)
+    cursor.execute("""
+        INSERT OR IGNORE INTO backfills (nome, proximo_id, ultimo_id)
+        SELECT 'mascaras_queixas', MIN(id), MAX(id) FROM atendimentos HAVING COUNT(*) > 0
+    """)
+
+
+def _create_backfills_table(cursor):
+    """Tabela com o intervalo de ids que cada backfill (ver _backfill_by_id_range) ainda precisa tratar."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS backfills (
+            nome TEXT PRIMARY KEY,
+            proximo_id INTEGER NOT NULL,
+            ultimo_id INTEGER NOT NULL
+        )
+    """)
+
+
+def _m007_dicionarios(cursor):
+    """Move gestor, turno, setor, processo e tipo_atendimento para tabelas de dicionário.
+
+    A tabela física passa a se chamar atendimentos_base, com colunas
+    <coluna>_id; `atendimentos` vira uma view com os nomes, para que as
+    consultas existentes e o modelo Atendimento continuem funcionando.
+    Renomear um gestor passa a ser um UPDATE de uma linha em `gestores`.
+
+    As gravações do aplicativo vão direto para atendimentos_base (db.py).
+    As estações ainda em versões anteriores gravam na view, que passa a
+    aceitar INSERT/UPDATE/DELETE com os triggers da migração 14.
+    """
+    for coluna, tabela in LOOKUP_TABLES.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {tabela} (id INTEGER PRIMARY KEY, nome TEXT NOT NULL UNIQUE)")
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO {tabela} (nome)
+            SELECT DISTINCT {coluna} FROM atendimentos WHERE {coluna} IS NOT NULL ORDER BY {coluna}
+        """)
+
+    # RENAME mantém a tabela física (ids, índices e triggers) e atualiza a FK de condutas
+    cursor.execute("ALTER TABLE atendimentos RENAME TO atendimentos_base")
+    for coluna, tabela in LOOKUP_TABLES.items():
+        cursor.execute(f"ALTER TABLE atendimentos_base ADD COLUMN {coluna}_id INTEGER REFERENCES {tabela} (id)")
+    cursor.execute("UPDATE atendimentos_base SET " + ", ".join(
+        f"{coluna}_id = (SELECT id FROM {tabela} WHERE nome = atendimentos_base.{coluna})"
+        for coluna, tabela in LOOKUP_TABLES.items()))
+    for coluna in LOOKUP_TABLES:
+        cursor.execute(f"ALTER TABLE atendimentos_base DROP COLUMN {coluna}")
+
+    # b.* é expandido a cada uso da view: colunas novas em atendimentos_base aparecem sozinhas
+    joins = " ".join(f"LEFT JOIN {tabela} {coluna}_lk ON {coluna}_lk.id = b.{coluna}_id"
+                     for coluna, tabela in LOOKUP_TABLES.items())
+    nomes = ", ".join(f"{coluna}_lk.nome AS {coluna}" for coluna in LOOKUP_TABLES)
+    cursor.execute(f"CREATE VIEW atendimentos AS SELECT b.*, {nomes} FROM atendimentos_base b {joins}")
+
+
+def vital_value_sql(coluna, tipo):
+    """Expressão SQL que converte o texto digitado em `coluna` para número, ou NULL.
+
+    Aceita vírgula decimal e um "%" no final ("37,5", "98%"); "N/A", vazio e
+    qualquer outro texto viram NULL. Colunas INTEGER são arredondadas.
+    """
+    texto = f"replace(replace(trim({coluna}), ',', '.'), '%', '')"
+    numero = f"CAST({texto} AS REAL)"
+    if tipo == "INTEGER":
+        numero = f"CAST(round({numero}) AS INTEGER)"
+    return (f"CASE WHEN {texto} GLOB '[0-9]*' AND {texto} NOT GLOB '*[^0-9.]*' "
+            f"AND {texto} NOT GLOB '*.*.*' THEN {numero} END")
+
+
+def vital_values_set_sql(prefixo=""):
+    """Trecho `SET` que recalcula todas as colunas <vital>_valor a partir do texto."""
+    return ", ".join(f"{coluna}_valor = {vital_value_sql(prefixo + coluna, tipo)}"
+                     for coluna, tipo in VITAL_COLUMNS.items())
+
+
+def _m008_sinais_vitais_numericos(cursor):
+    """Colunas numéricas para os sinais vitais (tax_valor, pa_sistolica_valor, ...).
+
+    O texto digitado continua sendo a fonte (é o que a tela mostra e o CSV
+    exporta); as colunas <vital>_valor são mantidas por triggers e ficam NULL
+    quando o valor é "N/A" ou não é um número. Os índices (<vital>_valor,
+    ts_atendimento) atendem consultas de limiar como "SAT < 92 na semana".
+
+    As linhas existentes são preenchidas em lotes por backfill_vital_values(),
+    fora desta transação; o intervalo de ids pendente fica em `backfills`.
+    """
+    for coluna, tipo in VITAL_COLUMNS.items():
+        cursor.execute(f"ALTER TABLE atendimentos_base ADD COLUMN {coluna}_valor {tipo}")
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_atendimentos_{coluna}_valor
+            ON atendimentos_base ({coluna}_valor, ts_atendimento) WHERE {coluna}_valor IS NOT NULL
+        """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_vitais_insert
+        AFTER INSERT ON atendimentos_base
+        BEGIN
+            UPDATE atendimentos_base SET {vital_values_set_sql('NEW.')} WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_vitais_update
+        AFTER UPDATE OF {', '.join(VITAL_COLUMNS)} ON atendimentos_base
+        BEGIN
+            UPDATE atendimentos_base SET {vital_values_set_sql('NEW.')} WHERE id = NEW.id;
+        END
+    """)
+    _create_backfills_table(cursor)
+    cursor.execute("""
+        INSERT OR IGNORE INTO backfills (nome, proximo_id, ultimo_id)
+        SELECT 'sinais_vitais', MIN(id), MAX(id) FROM atendimentos_base HAVING COUNT(*) > 0
+    """)
+
+
+# Campos de texto livre de atendimentos indexados pela busca textual (FTS5); as
+# hipóteses diagnósticas das condutas entram juntas na coluna hipoteses_diagnosticas
+SEARCH_COLUMNS = ("hqa", "observacoes", "doencas_preexistentes", "alergias", "medicamentos_em_uso")
+SEARCH_HIPOTESES_SQL = ("(SELECT group_concat(hipotese_diagnostica, ' ') FROM condutas "
+                        "WHERE atendimento_id = {id})")
+
+
+def _m009_busca_textual(cursor):
+    """Índice FTS5 (atendimentos_fts) sobre o texto livre dos atendimentos e condutas.
+
+    Uma linha por atendimento, com rowid = atendimentos_base.id. O tokenizador
+    unicode61 com remove_diacritics 2 ignora acentos e maiúsculas ("cefaléia"
+    encontra "Cefaleia"); prefix='2 3' acelera a busca por começo de palavra.
+    Triggers em atendimentos_base e condutas mantêm o índice atualizado.
+
+    Os atendimentos existentes são indexados em lotes por
+    backfill_search_index(), fora desta transação.
+    """
+    colunas = ", ".join(SEARCH_COLUMNS)
+    novos = ", ".join("NEW." + c for c in SEARCH_COLUMNS)
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS atendimentos_fts USING fts5(
+            {colunas}, hipoteses_diagnosticas,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_fts_insert
+        AFTER INSERT ON atendimentos_base
+        BEGIN
+            INSERT INTO atendimentos_fts (rowid, {colunas}, hipoteses_diagnosticas)
+            VALUES (NEW.id, {novos}, {SEARCH_HIPOTESES_SQL.format(id='NEW.id')});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_fts_update
+        AFTER UPDATE OF {colunas} ON atendimentos_base
+        BEGIN
+            UPDATE atendimentos_fts SET ({colunas}) = ({novos}) WHERE rowid = NEW.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_fts_delete
+        AFTER DELETE ON atendimentos_base
+        BEGIN
+            DELETE FROM atendimentos_fts WHERE rowid = OLD.id;
+        END
+    """)
+    # Condutas: recalcula as hipóteses do atendimento afetado
+    for evento, linha in (("INSERT", "NEW"), ("DELETE", "OLD"), ("UPDATE OF hipotese_diagnostica", "NEW")):
+        nome = evento.split()[0].lower()
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_condutas_fts_{nome}
+            AFTER {evento} ON condutas
+            BEGIN
+                UPDATE atendimentos_fts
+                SET hipoteses_diagnosticas = {SEARCH_HIPOTESES_SQL.format(id=linha + '.atendimento_id')}
+                WHERE rowid = {linha}.atendimento_id;
+            END
+        """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO backfills (nome, proximo_id, ultimo_id)
+        SELECT 'busca_textual', MIN(id), MAX(id) FROM atendimentos_base HAVING COUNT(*) > 0
+    """)
+
+
+# Resumos pré-calculados: (tabela, coluna do período, expressão do período a partir do dia).
+# A semana é identificada pela data da sua segunda-feira (semana ISO).
+SUMMARY_TABLES = (
+    ("resumo_diario", "dia", "{dia}"),
+    ("resumo_semanal", "semana", "date({dia}, '-6 days', 'weekday 1')"),
+)
+# Dimensões contadas por atendimento -> coluna de atendimentos_base. Nas colunas de
+# dicionário o valor guardado é o id (renomear um gestor não invalida os resumos);
+# 'total' conta todos os atendimentos. 'medicamento' é contado por conduta.
+SUMMARY_DIMENSIONS = {
+    "total": None,
+    "setor": "setor_id",
+    "turno": "turno_id",
+    "gestor": "gestor_id",
+    "tipo_atendimento": "tipo_atendimento_id",
+    "qp_sintoma": "qp_sintoma",
+}
+
+
+def _summary_rows_sql():
+    """SELECT (dia, dimensao, valor) com uma linha por dimensão de cada atendimento de um intervalo de ids.
+
+    Usado pelo backfill dos resumos; recebe os parâmetros id_inicial, id_final.
+    """
+    partes = [f"""
+        SELECT data_atendimento AS dia, '{dimensao}' AS dimensao, {f"COALESCE({coluna}, '')" if coluna else "''"} AS valor
+        FROM atendimentos_base WHERE id >= ?1 AND id < ?2
+    """ for dimensao, coluna in SUMMARY_DIMENSIONS.items()]
+    partes.append("""
+        SELECT a.data_atendimento, 'medicamento', COALESCE(c.medicamento_administrado, '')
+        FROM condutas c JOIN atendimentos_base a ON a.id = c.atendimento_id
+        WHERE a.id >= ?1 AND a.id < ?2
+    """)
+    return " UNION ALL ".join(partes)
+
+
+def _summary_pending_sql(atendimento_id):
+    """Condição SQL: o atendimento ainda não foi contado pelo backfill dos resumos."""
+    return (f"EXISTS (SELECT 1 FROM backfills WHERE nome = 'resumos' "
+            f"AND {atendimento_id} BETWEEN proximo_id AND ultimo_id)")
+
+
+def _summary_upsert_sql(tabela, chave_col, chave, dimensao_sql, valor_sql, quantidade_sql, fonte_sql):
+    return f"""
+        INSERT INTO {tabela} ({chave_col}, dimensao, valor, quantidade)
+        SELECT {chave}, {dimensao_sql}, {valor_sql}, {quantidade_sql} {fonte_sql}
+        ON CONFLICT ({chave_col}, dimensao, valor) DO UPDATE SET quantidade = quantidade + excluded.quantidade;
+    """
+
+
+def _summary_atendimento_sql(linha, sinal):
+    """Comandos de trigger que somam (sinal 1) ou subtraem (sinal -1) o atendimento NEW/OLD dos resumos."""
+    pendente = _summary_pending_sql(f"{linha}.id")
+    valores = " UNION ALL ".join(
+        f"SELECT '{dimensao}' AS dimensao, {f'COALESCE({linha}.{coluna}, {chr(39) * 2})' if coluna else chr(39) * 2} AS valor"
+        for dimensao, coluna in SUMMARY_DIMENSIONS.items())
+    comandos = []
+    for tabela, chave_col, chave in SUMMARY_TABLES:
+        chave = chave.format(dia=f"{linha}.data_atendimento")
+        comandos.append(_summary_upsert_sql(
+            tabela, chave_col, chave, "d.dimensao", "d.valor", str(sinal),
+            f"FROM ({valores}) d WHERE {linha}.data_atendimento IS NOT NULL AND NOT {pendente}"))
+        # Medicamentos das condutas já gravadas (no INSERT ainda não há nenhuma)
+        comandos.append(_summary_upsert_sql(
+            tabela, chave_col, chave, "'medicamento'", "COALESCE(c.medicamento_administrado, '')",
+            f"{sinal} * COUNT(*)",
+            f"FROM condutas c WHERE c.atendimento_id = {linha}.id AND {linha}.data_atendimento IS NOT NULL "
+            f"AND NOT {pendente} GROUP BY 3"))
+    return "".join(comandos)
+
+
+def _summary_conduta_sql(linha, sinal):
+    """Comandos de trigger que somam/subtraem o medicamento da conduta NEW/OLD nos resumos.
+
+    O dia vem do atendimento; se ele está sendo apagado (ON DELETE CASCADE)
+    já não existe, e quem desconta os medicamentos é o trigger do próprio
+    atendimento.
+    """
+    pendente = _summary_pending_sql("a.id")
+    comandos = []
+    for tabela, chave_col, chave in SUMMARY_TABLES:
+        comandos.append(_summary_upsert_sql(
+            tabela, chave_col, chave.format(dia="a.data_atendimento"), "'medicamento'",
+            f"COALESCE({linha}.medicamento_administrado, '')", str(sinal),
+            f"FROM atendimentos_base a WHERE a.id = {linha}.atendimento_id "
+            f"AND a.data_atendimento IS NOT NULL AND NOT {pendente}"))
+    return "".join(comandos)
+
+
+def _m010_resumos(cursor):
+    """Tabelas de resumo por dia e por semana (resumo_diario / resumo_semanal).
+
+    Cada linha é (período, dimensão, valor, quantidade) e é mantida pelos
+    triggers de atendimentos_base e condutas, inclusive em UPDATE e DELETE:
+    relatórios semanais leem dezenas de linhas em vez de varrer anos de
+    atendimentos. Os atendimentos existentes são somados em lotes por
+    backfill_summaries(), fora desta transação.
+    """
+    for tabela, chave_col, _ in SUMMARY_TABLES:
+        # valor sem tipo declarado: guarda o id (INTEGER) das colunas de dicionário e o texto das demais
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {tabela} (
+                {chave_col} TEXT NOT NULL,
+                dimensao TEXT NOT NULL,
+                valor NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY ({chave_col}, dimensao, valor)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_dimensao ON {tabela} (dimensao, {chave_col})")
+
+    colunas = ["data_atendimento"] + [c for c in SUMMARY_DIMENSIONS.values() if c]
+    mudou = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in colunas)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_resumo_insert
+        AFTER INSERT ON atendimentos_base
+        BEGIN {_summary_atendimento_sql('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_resumo_update
+        AFTER UPDATE OF {', '.join(colunas)} ON atendimentos_base
+        WHEN {mudou}
+        BEGIN {_summary_atendimento_sql('OLD', -1)} {_summary_atendimento_sql('NEW', 1)} END
+    """)
+    # BEFORE: as condutas ainda existem (o ON DELETE CASCADE as apaga logo depois)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_resumo_delete
+        BEFORE DELETE ON atendimentos_base
+        BEGIN {_summary_atendimento_sql('OLD', -1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_condutas_resumo_insert
+        AFTER INSERT ON condutas
+        BEGIN {_summary_conduta_sql('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_condutas_resumo_delete
+        AFTER DELETE ON condutas
+        BEGIN {_summary_conduta_sql('OLD', -1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_condutas_resumo_update
+        AFTER UPDATE OF medicamento_administrado, atendimento_id ON condutas
+        BEGIN {_summary_conduta_sql('OLD', -1)} {_summary_conduta_sql('NEW', 1)} END
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO backfills (nome, proximo_id, ultimo_id)
+        SELECT 'resumos', MIN(id), MAX(id) FROM atendimentos_base HAVING COUNT(*) > 0
+    """)
+
+
+# Colunas de atendimentos_base gravadas pelo aplicativo (save/update). As demais são
+# derivadas (máscaras, sinais vitais numéricos) e mudam também nos backfills.
+TRACKED_COLUMNS = (
+    "badge_number", "nome", "login", "gestor_id", "turno_id", "setor_id", "processo_id", "tenure",
+    "tipo_atendimento_id", "qp_sintoma", "qp_regiao", "qs_sintomas", "qs_regioes", "hqa",
+    "tax", "pa_sistolica", "pa_diastolica", "fc", "sat", "doencas_preexistentes", "alergias",
+    "medicamentos_em_uso", "observacoes", "data_atendimento", "hora_atendimento", "semana_iso",
+    "ts_atendimento", "resumo_conduta_principal",
+)
+
+
+def _m011_registro_alteracoes(cursor):
+    """Registro de alterações (alteracoes): uma linha por INSERT/UPDATE/DELETE de atendimento.
+
+    seq só cresce; quem já mostrou o histórico até seq N busca apenas as
+    alterações com seq > N em vez de recarregar tudo. Mantido por triggers,
+    então inclui o que as outras estações gravam. Linhas antigas são podadas
+    (db.prune_change_log); quem ficou para trás recarrega tudo.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS alteracoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            atendimento_id INTEGER NOT NULL,
+            operacao TEXT NOT NULL CHECK (operacao IN ('I', 'U', 'D'))
+        )
+    """)
+    for evento, linha, operacao in (("INSERT", "NEW", "I"),
+                                    (f"UPDATE OF {', '.join(TRACKED_COLUMNS)}", "NEW", "U"),
+                                    ("DELETE", "OLD", "D")):
+        nome = evento.split()[0].lower()
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_atendimentos_alteracoes_{nome}
+            AFTER {evento} ON atendimentos_base
+            BEGIN
+                INSERT INTO alteracoes (atendimento_id, operacao) VALUES ({linha}.id, '{operacao}');
+            END
+        """)
+
+
+def _m012_controle_exportacao(cursor):
+    """Colunas created_at / updated_at / alteracao_seq e tombstones para a exportação incremental.
+
+    Um trigger no registro de alterações (migração 11) carimba o atendimento
+    alterado com o horário (UTC) e com a seq da alteração, e registra os
+    apagados em atendimentos_apagados. alteracao_seq é a marca d'água da
+    exportação incremental: ao contrário do relógio das estações, só cresce,
+    na ordem em que as gravações foram confirmadas. As linhas anteriores a
+    esta migração ficam com as três colunas NULL (entram só na exportação
+    completa). A última seq exportada fica em marcas_exportacao.
+    """
+    for coluna, tipo in (("created_at", "TEXT"), ("updated_at", "TEXT"), ("alteracao_seq", "INTEGER")):
+        cursor.execute(f"ALTER TABLE atendimentos_base ADD COLUMN {coluna} {tipo}")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_atendimentos_alteracao_seq
+        ON atendimentos_base (alteracao_seq) WHERE alteracao_seq IS NOT NULL
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS atendimentos_apagados (
+            id INTEGER PRIMARY KEY,
+            deleted_at TEXT NOT NULL,
+            alteracao_seq INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_atendimentos_apagados_seq ON atendimentos_apagados (alteracao_seq)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS marcas_exportacao (
+            nome TEXT PRIMARY KEY,
+            alteracao_seq INTEGER NOT NULL,
+            exportado_em TEXT NOT NULL
+        )
+    """)
+    # Nenhum trigger de atendimentos_base reage a estas três colunas, então o UPDATE não se propaga
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_alteracoes_controle_exportacao
+        AFTER INSERT ON alteracoes
+        BEGIN
+            UPDATE atendimentos_base SET
+                created_at = CASE WHEN NEW.operacao = 'I' THEN strftime('%Y-%m-%d %H:%M:%S', 'now')
+                                  ELSE created_at END,
+                updated_at = strftime('%Y-%m-%d %H:%M:%S', 'now'),
+                alteracao_seq = NEW.seq
+            WHERE id = NEW.atendimento_id AND NEW.operacao <> 'D';
+            INSERT OR REPLACE INTO atendimentos_apagados (id, deleted_at, alteracao_seq)
+            SELECT NEW.atendimento_id, strftime('%Y-%m-%d %H:%M:%S', 'now'), NEW.seq
+            WHERE NEW.operacao = 'D';
+        END
+    """)
+
+
+def _m013_backfill_mascaras_pendente(cursor):
+    """Registra em `backfills` as máscaras de queixas que ainda faltam em bancos migrados antes disso.
+
+    Até aqui a migração 6 não guardava o intervalo e o backfill procurava as
+    linhas com NULL varrendo a tabela a cada inicialização. A varredura é
+    feita uma única vez, aqui; se não faltar nada, nenhum intervalo é gravado.
+    """
+    cursor.execute("""
+        INSERT OR IGNORE INTO backfills (nome, proximo_id, ultimo_id)
+        SELECT 'mascaras_queixas', MIN(id), MAX(id) FROM atendimentos_base
+        WHERE qs_sintomas_mask IS NULL HAVING COUNT(*) > 0
+    """)
+
+
+def _m014_view_gravavel(cursor):
+    """Triggers INSTEAD OF que tornam a view `atendimentos` gravável pelas versões anteriores à 7.
+
+    Durante a troca estação por estação, as versões antigas continuam
+    gravando em `atendimentos`. Os triggers cadastram os nomes novos nas
+    tabelas de dicionário, gravam os <coluna>_id em atendimentos_base e
+    calculam ts_atendimento quando ele não vem preenchido.
+
+    Numa view, cursor.lastrowid fica 0 (o SQLite restaura last_insert_rowid
+    ao sair do trigger), e as versões antigas gravam as condutas do
+    atendimento novo com atendimento_id = 0. Um trigger em condutas as liga
+    ao último atendimento inserido: a transação de quem grava segura o lock
+    de escrita desde o INSERT, e com AUTOINCREMENT ele é o MAX(id).
+    """
+    colunas = [c for c in TRACKED_COLUMNS if c[:-3] not in LOOKUP_TABLES] + ["record_key"]
+    ts_sql = "CAST(strftime('%s', NEW.data_atendimento || ' ' || NEW.hora_atendimento) AS INTEGER)"
+    valores = {c: f"NEW.{c}" for c in colunas}
+    valores.update({f"{coluna}_id": f"(SELECT id FROM {tabela} WHERE nome = NEW.{coluna})"
+                    for coluna, tabela in LOOKUP_TABLES.items()})
+    cadastra_nomes = "".join(
+        f"INSERT OR IGNORE INTO {tabela} (nome) SELECT NEW.{coluna} WHERE NEW.{coluna} IS NOT NULL;\n"
+        for coluna, tabela in LOOKUP_TABLES.items())
+
+    insert_valores = dict(valores, ts_atendimento=f"COALESCE(NEW.ts_atendimento, {ts_sql})")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_view_insert
+        INSTEAD OF INSERT ON atendimentos
+        BEGIN
+            {cadastra_nomes}
+            INSERT INTO atendimentos_base (id, {', '.join(insert_valores)})
+            VALUES (NEW.id, {', '.join(insert_valores.values())});
+        END
+    """)
+    # As versões antigas não conhecem ts_atendimento: recalculado quando ele não foi alterado
+    update_valores = dict(valores, ts_atendimento=(
+        f"CASE WHEN NEW.ts_atendimento IS OLD.ts_atendimento THEN {ts_sql} ELSE NEW.ts_atendimento END"))
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_view_update
+        INSTEAD OF UPDATE ON atendimentos
+        BEGIN
+            {cadastra_nomes}
+            UPDATE atendimentos_base SET {', '.join(f'{c} = {v}' for c, v in update_valores.items())}
+            WHERE id = OLD.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_atendimentos_view_delete
+        INSTEAD OF DELETE ON atendimentos
+        BEGIN
+            DELETE FROM atendimentos_base WHERE id = OLD.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_condutas_sem_atendimento
+        BEFORE INSERT ON condutas
+        WHEN NEW.atendimento_id = 0
+        BEGIN
+            INSERT INTO condutas (
+                atendimento_id, hipotese_diagnostica, resumo_conduta,
+                medicamento_administrado, posologia, horario_medicacao, observacoes
+            ) VALUES (
+                (SELECT MAX(id) FROM atendimentos_base), NEW.hipotese_diagnostica, NEW.resumo_conduta,
+                NEW.medicamento_administrado, NEW.posologia, NEW.horario_medicacao, NEW.observacoes
+            );
+            UPDATE atendimentos_base SET resumo_conduta_principal = NEW.resumo_conduta
+            WHERE id = (SELECT MAX(id) FROM atendimentos_base) AND resumo_conduta_principal IS NULL;
+            SELECT RAISE(IGNORE);
+        END
+    """)
+
+
+# (versão, descrição, função). Nunca altere ou renumere uma migração já publicada;
+# mudanças de esquema entram sempre como uma nova migração no final da lista.
+MIGRATIONS = [
+    (1, "esquema base", _m001_esquema_base),
+    (2, "índices de histórico e condutas", _m002_indices),
+    (3, "coluna ts_atendimento indexada", _m003_timestamp_atendimento),
+    (4, "coluna resumo_conduta_principal", _m004_resumo_conduta_principal),
+    (5, "chave única record_key", _m005_record_key),
+    (6, "máscaras de bits das queixas secundárias", _m006_qs_mascaras),
+    (7, "tabelas de dicionário para gestor/turno/setor/processo/tipo", _m007_dicionarios),
+    (8, "colunas numéricas dos sinais vitais", _m008_sinais_vitais_numericos),
+    (9, "busca textual (FTS5) em atendimentos e condutas", _m009_busca_textual),
+    (10, "resumos por dia e semana mantidos por triggers", _m010_resumos),
+    (11, "registro de alterações para atualização incremental", _m011_registro_alteracoes),
+    (12, "colunas de controle para exportação incremental", _m012_controle_exportacao),
+    (13, "intervalo pendente do backfill das máscaras de queixas", _m013_backfill_mascaras_pendente),
+    (14, "view atendimentos gravável pelas versões anteriores", _m014_view_gravavel),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Retorna a versão atual do esquema (PRAGMA user_version)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Aplica as migrações pendentes e retorna a versão final do esquema."""
+    version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        if version > LATEST_VERSION:
+            print(f"Aviso: esquema do banco (v{version}) é mais novo que o suportado (v{LATEST_VERSION}).")
+        return version
+
+    for number, description, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            # BEGIN IMMEDIATE evita que duas estações apliquem a mesma migração ao mesmo tempo
+            conn.execute("BEGIN IMMEDIATE")
+            if get_schema_version(conn) >= number:
+                # Outra estação aplicou esta migração enquanto esperávamos o lock
+                conn.rollback()
+                version = get_schema_version(conn)
+                continue
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+            version = number
+            print(f"Migração {number} aplicada: {description}.")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return version
+
+
+def atendimentos_table(conn):
+    """Nome da tabela física de atendimentos (atendimentos_base a partir da migração 7)."""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'atendimentos'").fetchone()
+    return "atendimentos_base" if row and row[0] == "view" else "atendimentos"
+
+
+def backfill_qs_masks(conn, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Preenche qs_sintomas_mask / qs_regioes_mask das linhas antigas, em lotes.
+
+    Cada lote é uma transação curta, para não segurar o lock de escrita das
+    outras estações durante a conversão de um banco grande. O intervalo
+    pendente fica em `backfills` (migrações 6 e 13): pode ser interrompido e
+    chamado de novo, e com tudo preenchido não lê a tabela de atendimentos.
+    Retorna o número de linhas preenchidas.
+    """
+    if get_schema_version(conn) < 6:
+        return 0
+    tabela = atendimentos_table(conn)
+    filled = _backfill_by_id_range(conn, "mascaras_queixas", f"""
+        UPDATE {tabela}
+        SET qs_sintomas_mask = {qs_mask_sql('qs_sintomas', SINTOMAS)},
+            qs_regioes_mask = {qs_mask_sql('qs_regioes', REGIOES)}
+        WHERE id >= ? AND id < ? AND qs_sintomas_mask IS NULL
+    """, chunk_size)
+    if filled:
+        print(f"Máscaras de queixas preenchidas em {filled} atendimento(s).")
+    return filled
+
+
+def _backfill_by_id_range(conn, nome, sql, chunk_size):
+    """Executa `sql` (com parâmetros id_inicial, id_final) em lotes sobre o intervalo pendente de `nome`.
+
+    `sql` pode ser um comando ou uma lista de comandos, executados na mesma
+    transação. O intervalo fica na tabela `backfills` (criado pela migração)
+    e avança na mesma transação de cada lote: pode ser interrompido e
+    chamado de novo sem repetir trabalho. Retorna o número de linhas
+    alteradas pelo primeiro comando.
+    """
+    statements = [sql] if isinstance(sql, str) else list(sql)
+    row = conn.execute("SELECT proximo_id, ultimo_id FROM backfills WHERE nome = ?", (nome,)).fetchone()
+    if row is None:
+        return 0
+    start, last = row
+    filled = 0
+    while start <= last:
+        # Nunca passa de ultimo_id: linhas mais novas já foram tratadas pelos triggers
+        end = min(start + chunk_size, last + 1)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            filled += conn.execute(statements[0], (start, end)).rowcount
+            for statement in statements[1:]:
+                conn.execute(statement, (start, end))
+            if end > last:
+                conn.execute("DELETE FROM backfills WHERE nome = ?", (nome,))
+            else:
+                conn.execute("UPDATE backfills SET proximo_id = ? WHERE nome = ?", (end, nome))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        start = end
+    return filled
+
+
+def backfill_vital_values(conn, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Preenche as colunas <vital>_valor das linhas anteriores à migração 8, em lotes.
+
+    NULL é um valor legítimo ("N/A"), por isso o progresso fica na tabela
+    `backfills` em vez de ser deduzido das próprias colunas.
+    """
+    if get_schema_version(conn) < 8:
+        return 0
+    filled = _backfill_by_id_range(
+        conn, "sinais_vitais",
+        f"UPDATE atendimentos_base SET {vital_values_set_sql()} WHERE id >= ? AND id < ?", chunk_size)
+    if filled:
+        print(f"Sinais vitais numéricos preenchidos em {filled} atendimento(s).")
+    return filled
+
+
+def backfill_search_index(conn, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Indexa na busca textual os atendimentos anteriores à migração 9, em lotes.
+
+    Enquanto não termina, a busca simplesmente não encontra os atendimentos
+    antigos ainda não indexados.
+    """
+    if get_schema_version(conn) < 9:
+        return 0
+    filled = _backfill_by_id_range(conn, "busca_textual", f"""
+        INSERT INTO atendimentos_fts (rowid, {', '.join(SEARCH_COLUMNS)}, hipoteses_diagnosticas)
+        SELECT b.id, {', '.join('b.' + c for c in SEARCH_COLUMNS)}, {SEARCH_HIPOTESES_SQL.format(id='b.id')}
+        FROM atendimentos_base b
+        WHERE b.id >= ? AND b.id < ?
+    """, chunk_size)
+    if filled:
+        print(f"Busca textual: {filled} atendimento(s) indexado(s).")
+    return filled
+
+
+def run_backfills(conn, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Completa, em lotes curtos, o preenchimento de colunas e índices criados pelas migrações."""
+    backfill_qs_masks(conn, chunk_size)
+    backfill_vital_values(conn, chunk_size)
+    backfill_search_index(conn, chunk_size)
+    backfill_summaries(conn, chunk_size)
+
+
+def backfill_summaries(conn, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Soma aos resumos (resumo_diario / resumo_semanal) os atendimentos anteriores à migração 10, em lotes.
+
+    Enquanto não termina, os triggers ignoram os atendimentos ainda não
+    contados (ver _summary_pending_sql), e os resumos ficam apenas incompletos.
+    """
+    if get_schema_version(conn) < 10:
+        return 0
+    statements = []
+    for tabela, chave_col, chave in SUMMARY_TABLES:
+        chave = chave.format(dia="linhas.dia")
+        statements.append(f"""
+            INSERT INTO {tabela} ({chave_col}, dimensao, valor, quantidade)
+            SELECT {chave}, linhas.dimensao, linhas.valor, COUNT(*)
+            FROM ({_summary_rows_sql()}) linhas
+            WHERE linhas.dia IS NOT NULL
+            GROUP BY 1, 2, 3
+            ON CONFLICT ({chave_col}, dimensao, valor) DO UPDATE SET quantidade = quantidade + excluded.quantidade
+        """)
+    # Retorna o número de linhas de resumo_diario criadas ou atualizadas
+    filled = _backfill_by_id_range(conn, "resumos", statements, chunk_size)
+    if filled:
+        print("Resumos por dia e semana calculados para os atendimentos existentes.")
+    return filled
+
+
+# Migrações que reescrevem a tabela de atendimentos deixam páginas livres no arquivo
+COMPACT_AFTER_VERSIONS = (7,)
+
+
+def compact_if_rewritten(conn, version_before):
+    """Roda VACUUM uma vez se alguma migração que reescreve a tabela acabou de ser aplicada.
+
+    Bancos novos (versão 0) não têm o que compactar. Se outra estação estiver
+    com o banco aberto o VACUUM falha; o banco continua correto, só não
+    encolhe, e a tentativa se repete na próxima migração desse tipo.
+    """
+    if version_before == 0 or not any(version_before < v <= get_schema_version(conn)
+                                       for v in COMPACT_AFTER_VERSIONS):
+        return False
+    try:
+        conn.execute("VACUUM")
+        print("Banco compactado após a migração.")
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"VACUUM não executado ({e}); o espaço livre será reaproveitado pelo próprio banco.")
+        return False
@@ -37,6 +37,7 @@ class Atendimento:
                  data_atendimento: Optional[str] = None,
                  hora_atendimento: Optional[str] = None,
                  semana_iso: Optional[int] = None,
+                 record_key: Optional[str] = None, # Chave única gerada na estação (outbox)
                  id: Optional[int] = None, **kwargs): # Aceita kwargs para ignorar extras
         self.id = id
         self.badge_number = badge_number
@@ -68,6 +69,7 @@ class Atendimento:
         self.data_atendimento = data_atendimento
         self.hora_atendimento = hora_atendimento
         self.semana_iso = semana_iso
+        self.record_key = record_key
 
 class Conduta:
     """Representa uma conduta médica."""
@@ -0,0 +1,258 @@
+"""
+outbox.py
+---------
+Fila local de envio (write-behind) para estações em drive compartilhado.
+
+O atendimento novo é gravado primeiro em um SQLite pequeno no disco da
+própria estação (rápido e sempre disponível) e uma thread de fundo o envia
+em lotes para o banco compartilhado. Cada atendimento leva um record_key
+único; o envio é idempotente (db.save_atendimentos_batch), então repetir um
+lote depois de uma queda de rede nunca cria duplicatas.
+
+Cada item guarda o caminho do banco de destino: se a estação trocar de
+banco, os itens pendentes continuam indo para o banco original quando ele
+voltar a ser o configurado.
+
+Um item que o banco recusa pelos dados (não por estar ocupado ou
+inacessível) é tentado MAX_DATA_ATTEMPTS vezes e depois movido para a
+tabela outbox_recusados, onde fica para análise sem segurar a fila.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import db
+from models import Atendimento, Conduta
+
+DEFAULT_BATCH_SIZE = 50
+IDLE_INTERVAL_S = 5.0
+MAX_BACKOFF_S = 60.0
+# Recusas por erro nos dados antes de o item sair da fila (outbox_recusados)
+MAX_DATA_ATTEMPTS = 5
+
+
+def _normalize_path(path):
+    return os.path.normcase(os.path.abspath(path)) if path else None
+
+
+def _is_access_error(error):
+    """True se a gravação falhou por banco ocupado/inacessível, não pelos dados do item."""
+    return isinstance(error.__cause__, sqlite3.OperationalError)
+
+
+def _to_payload(atendimento):
+    data = dict(vars(atendimento))
+    data["condutas"] = [dict(vars(c)) for c in atendimento.condutas]
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _from_payload(payload):
+    data = json.loads(payload)
+    condutas = [Conduta(**c) for c in data.pop("condutas", [])]
+    return Atendimento(condutas=condutas, **data)
+
+
+class Outbox:
+    """Fila local de atendimentos a enviar, com uma thread que a esvazia em lotes."""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, idle_interval_s=IDLE_INTERVAL_S,
+                 max_backoff_s=MAX_BACKOFF_S):
+        self.path = path
+        self.batch_size = batch_size
+        self.idle_interval_s = idle_interval_s
+        self.max_backoff_s = max_backoff_s
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_error = None
+        self._last_sync = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        # Disco local: o custo do fsync é pequeno e o item não pode se perder
+        self._conn.execute("PRAGMA synchronous = FULL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_key TEXT NOT NULL UNIQUE,
+                db_path TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        # attempts conta só as recusas por erro nos dados; falhas de acesso ao banco não
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox_recusados (
+                id INTEGER PRIMARY KEY,
+                record_key TEXT NOT NULL UNIQUE,
+                db_path TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                rejected_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        # Pendentes por banco de destino: só os do banco configurado são enviados agora
+        self._pending = dict(self._conn.execute("SELECT db_path, COUNT(*) FROM outbox GROUP BY db_path"))
+        self._rejected = self._conn.execute("SELECT COUNT(*) FROM outbox_recusados").fetchone()[0]
+
+    # --- Thread do Tk ---
+
+    def enqueue(self, atendimento):
+        """Grava o atendimento na fila local e acorda o envio. Retorna o record_key."""
+        target = _normalize_path(db.get_db_path())
+        if target is None:
+            raise ValueError("Caminho do banco de dados não foi definido.")
+        if not atendimento.record_key:
+            atendimento.record_key = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (record_key, db_path, payload, created_at) VALUES (?, ?, ?, ?)",
+                (atendimento.record_key, target, _to_payload(atendimento), time.strftime("%Y-%m-%d %H:%M:%S")))
+            self._conn.commit()
+            self._pending[target] = self._pending.get(target, 0) + 1
+        self._wake.set()
+        return atendimento.record_key
+
+    def status(self):
+        """Retorna {'pending', 'other_pending', 'rejected', 'last_error', 'last_sync'} sem acessar disco.
+
+        `pending` conta só os itens do banco configurado, os únicos que o envio
+        tenta agora; `other_pending` são os de outros bancos, que esperam ele
+        voltar a ser o configurado. `rejected` são os movidos para
+        outbox_recusados. `last_error` é só a falha de acesso ao banco.
+        Seguro na thread do Tk.
+        """
+        target = _normalize_path(db.get_db_path())
+        with self._lock:
+            pending = self._pending.get(target, 0)
+            return {"pending": pending, "other_pending": sum(self._pending.values()) - pending,
+                    "rejected": self._rejected, "last_error": self._last_error, "last_sync": self._last_sync}
+
+    def pending_count(self):
+        return self.status()["pending"]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Para a thread de envio. Itens ainda pendentes ficam no disco para a próxima execução."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            self._conn.close()
+
+    # --- Thread de envio ---
+
+    def drain_once(self):
+        """Envia um lote para o banco configurado e o remove da fila. Retorna quantos foram enviados.
+
+        Levanta db.DatabaseWriteError se o banco compartilhado estiver ocupado
+        ou inacessível. Itens recusados pelos dados não levantam: contam uma
+        tentativa e, na MAX_DATA_ATTEMPTS-ésima, vão para outbox_recusados.
+        """
+        target = _normalize_path(db.get_db_path())
+        if target is None:
+            return 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM outbox WHERE db_path = ? ORDER BY id LIMIT ?",
+                (target, self.batch_size)).fetchall()
+        if not rows:
+            return 0
+
+        access_error = None
+        try:
+            db.save_atendimentos_batch([_from_payload(payload) for _, payload in rows])
+            sent = rows
+        except db.DatabaseWriteError as e:
+            if _is_access_error(e):
+                # Banco ocupado/inacessível: o lote inteiro espera a próxima tentativa
+                self._record_failure([row_id for row_id, _ in rows], e)
+                raise
+            # Erro nos dados de algum item: ele não pode segurar os demais, tenta um por um
+            sent = []
+            if len(rows) == 1:
+                self._record_rejection(target, rows[0][0], e)
+                rows = []
+            for row_id, payload in rows:
+                try:
+                    db.save_atendimentos_batch([_from_payload(payload)])
+                    sent.append((row_id, payload))
+                except db.DatabaseWriteError as item_error:
+                    if _is_access_error(item_error):
+                        self._record_failure([row_id], item_error)
+                        access_error = item_error
+                        break
+                    self._record_rejection(target, row_id, item_error)
+
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id, _ in sent])
+            self._conn.commit()
+            self._pending[target] -= len(sent)
+        if access_error is not None:
+            raise access_error
+        return len(sent)
+
+    def _record_failure(self, row_ids, error):
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET last_error = ? WHERE id = ?",
+                                   [(str(error), row_id) for row_id in row_ids])
+            self._conn.commit()
+
+    def _record_rejection(self, target, row_id, error):
+        """Conta uma recusa por erro nos dados; na MAX_DATA_ATTEMPTS-ésima move o item para outbox_recusados."""
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                               (str(error), row_id))
+            moved = self._conn.execute("""
+                INSERT INTO outbox_recusados
+                    (id, record_key, db_path, payload, created_at, attempts, last_error, rejected_at)
+                SELECT id, record_key, db_path, payload, created_at, attempts, last_error, ?
+                FROM outbox WHERE id = ? AND attempts >= ?
+            """, (time.strftime("%Y-%m-%d %H:%M:%S"), row_id, MAX_DATA_ATTEMPTS)).rowcount
+            if moved:
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            self._conn.commit()
+            if moved:
+                self._pending[target] -= 1
+                self._rejected += 1
+
+    def _run(self):
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    sent = self.drain_once()
+                except Exception as e:
+                    failures += 1
+                    with self._lock:
+                        self._last_error = str(e)
+                    wait = min(self.max_backoff_s, 2 ** failures)
+                else:
+                    failures = 0
+                    with self._lock:
+                        self._last_error = None
+                        if sent:
+                            self._last_sync = time.strftime("%H:%M:%S")
+                    if sent == self.batch_size:
+                        continue  # Ainda há itens: envia o próximo lote em seguida
+                    wait = self.idle_interval_s
+                self._wake.wait(wait)
+                self._wake.clear()
+        finally:
+            db.release_thread_connection()
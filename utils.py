@@ -1,5 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
+from datetime import datetime, timedelta
 
 def setup_placeholder(widget, placeholder_text):
     """
@@ -69,3 +70,16 @@ def validate_posologia_input(value_if_allowed):
     """Permite dígitos e caracteres especiais comuns em posologia."""
     return all(c in '0123456789/,. ' for c in value_if_allowed) or value_if_allowed == ""
 
+def escala_atual(now=None):
+    """Início e fim (datetime) da escala em andamento: 07:00-18:59 ou 19:00-06:59 do dia seguinte."""
+    now = now or datetime.now()
+    if 7 <= now.hour < 19:
+        start_dt = now.replace(hour=7, minute=0, second=0, microsecond=0)
+        end_dt = now.replace(hour=18, minute=59, second=59, microsecond=999999)
+    elif now.hour >= 19:
+        start_dt = now.replace(hour=19, minute=0, second=0, microsecond=0)
+        end_dt = (now + timedelta(days=1)).replace(hour=6, minute=59, second=59, microsecond=999999)
+    else:
+        start_dt = (now - timedelta(days=1)).replace(hour=19, minute=0, second=0, microsecond=0)
+        end_dt = now.replace(hour=6, minute=59, second=59, microsecond=999999)
+    return start_dt, end_dt